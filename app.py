@@ -8,13 +8,16 @@ from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Any, Callable
-from utils import oauth2
+from utils import metrics, oauth2, startup
 from utils.registry import get_util_registry
+from wrappers.base import BaseWrapper
 from wrappers.registry import get_wrapper_registry
 
 adapter_registry = get_adapter_registry()
 util_registry = get_util_registry()
 wrapper_registry = get_wrapper_registry()
+if util_registry.module_config["global"].get("preload_registries", False):
+    util_registry.preload()
 
 
 class APIRouter(FastAPIRouter):
@@ -59,6 +62,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(metrics.trace_requests)
 
 
 # overwritten erro-handling function
@@ -80,6 +84,19 @@ router.add_api_route(
     methods=["GET"],
     tags=["admin"]
 )
+router.add_api_route(
+    path="/metrics",
+    endpoint=metrics.get_metrics,
+    methods=["GET"],
+    tags=["admin"]
+)
+router.add_api_route(
+    path="/startup-report",
+    endpoint=startup.get_startup_report,
+    methods=["GET"],
+    response_model=startup.StartupReport,
+    tags=["admin"]
+)
 router.add_api_route(
     path="/token",
     endpoint=oauth2.login_for_access_token,
@@ -116,7 +133,8 @@ for wrapper in wrapper_registry:
             method_name_with_hyphen = method_name.replace("_", "-")
             router.add_api_route(
                 path=f"/{method_name_with_hyphen}",
-                endpoint=getattr(wrapper, method_name),
+                endpoint=getattr(
+                    wrapper, wrapper.async_endpoints.get(method_name, method_name)),
                 methods=bind_types,
                 include_in_schema=include_in_schema,
                 response_model_by_alias="retro" not in prefix,
@@ -154,7 +172,7 @@ for util in util_registry:
         router = APIRouter(prefix=f"/api/{prefix_with_hyphen}")
         # Bind specified util.method to urls /{util.prefixes}/method_name
         for method_name, bind_types in util.methods_to_bind.items():
-            if util.name in ["draw"]:
+            if util.name in ["draw"] and method_name in ["get", "post"]:
                 # hardcode for some util for legacy convention
                 path = "/"
             elif util.name in ["selectivity_refs"]:
@@ -179,6 +197,24 @@ for util in util_registry:
             )
         app.include_router(router)
 
+
+@app.on_event("shutdown")
+def flush_api_call_counts():
+    BaseWrapper.call_counter.flush()
+
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    await BaseWrapper.aclose_async_clients()
+
+
+@app.on_event("shutdown")
+def shutdown_utils():
+    util_registry.shutdown()
+
+
+# Served with "python -m uvicorn app:app" in the images; when run as a script,
+# the forkserver process pools of the utils re-import this module
 if __name__ == "__main__":
     uvicorn.run(
         app,
@@ -1,4 +1,5 @@
 import os
+from askcos2_celery.serializers import register_msgpack_zstd
 from celery import Celery
 
 # Define readable names for celery workers for status reporting
@@ -58,6 +59,9 @@ rabbit_url = "amqp://{username}:{password}@{host}:{port}/".format(
     port=rabbit_port,
 )
 
+# Needs to be registered with kombu before the config is loaded
+register_msgpack_zstd()
+
 app = Celery(
     main="askcos2_celery",
     broker=rabbit_url,
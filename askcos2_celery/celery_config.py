@@ -1,11 +1,18 @@
 from configs.module_config_full import module_config
 
-# Default serializers
+# Default serializers. Task messages can use "msgpack_zstd" per task (with
+# serializer= on the @shared_task declarations in tasks.py, as the task's own
+# serializer takes precedence over task_routes); results always do, since the
+# result backend decodes them with a single serializer and the tree search
+# results are the largest payloads. Dict keys are converted as by json, so
+# results keep the shapes they had with the json serializer.
+# "msgpack_zstd" compresses anything above 1 KB, and offloads anything still
+# above CELERY_OFFLOAD_THRESHOLD (1 MB) to mongo, only passing a reference.
 task_serializer = "json"
-result_serializer = "json"
+result_serializer = "msgpack_zstd"
 
 # Allowed content types - other message types are discarded
-accept_content = ["json"]
+accept_content = ["json", "msgpack_zstd"]
 
 # Timezone for message dates and times (set to match django settings)
 timezone = "UTC"
@@ -57,6 +64,9 @@ task_routes[f"askcos2_celery.tasks.forward*"] = {"queue": "forward_worker"}
 task_routes[f"askcos2_celery.tasks.retro*"] = {"queue": "retro_worker"}
 task_routes[f"askcos2_celery.tasks.tree_analysis*"] = {"queue": "tree_analysis_worker"}
 task_routes[f"askcos2_celery.tasks.tree_search_task"] = {"queue": "tree_search_worker"}
+task_routes[f"askcos2_celery.tasks.tree_search_multi_target_task"] = {
+    "queue": "tree_search_worker"
+}
 
 print(f"celery_imports: {imports}")
 print("celery_task_routes:")
@@ -0,0 +1,154 @@
+import msgpack
+import os
+import threading
+import uuid
+import zstandard
+from bson import Binary
+from configs import db_config
+from datetime import date, datetime, timedelta
+from kombu.serialization import register
+from pymongo import ASCENDING, MongoClient
+from typing import Any
+
+# msgpack + zstd serializer for large task payloads and results. Each encoded
+# payload starts with a one-byte header saying how the rest is stored:
+#   RAW: msgpack bytes, for small payloads not worth compressing
+#   ZSTD: zstd-compressed msgpack bytes
+#   REF: the utf-8 id of zstd-compressed msgpack bytes in the blob store, for
+#        payloads too large to go through the broker / result backend
+SERIALIZER_NAME = "msgpack_zstd"
+CONTENT_TYPE = "application/x-msgpack-zstd"
+
+RAW = b"\x00"
+ZSTD = b"\x01"
+REF = b"\x02"
+
+COMPRESSION_THRESHOLD = 1024
+COMPRESSION_LEVEL = 3
+OFFLOAD_THRESHOLD = int(os.environ.get("CELERY_OFFLOAD_THRESHOLD", 1024 * 1024))
+
+# Blob store for the offloaded payloads, in chunks below the Mongo document limit.
+# Expired well after result_expires, so that results are readable until then.
+BLOB_DATABASE = "askcos"
+BLOB_COLLECTION = "celery_payloads"
+BLOB_CHUNK_SIZE = 8 * 1024 * 1024
+BLOB_EXPIRES = 2 * 3600
+
+
+class BlobStore:
+    """MongoDB-backed store for celery payloads, shared by the app and workers"""
+
+    def __init__(self):
+        self._collection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        with self._lock:
+            if self._collection is None or self._pid != os.getpid():
+                # (re)connect lazily, as MongoClient is not fork-safe
+                client = MongoClient(serverSelectionTimeoutMS=1000, **db_config.MONGO)
+                self._collection = client[BLOB_DATABASE][BLOB_COLLECTION]
+                self._collection.create_index(
+                    [("created", ASCENDING)], expireAfterSeconds=BLOB_EXPIRES)
+                self._collection.create_index([("ref", ASCENDING), ("i", ASCENDING)])
+                self._pid = os.getpid()
+
+            return self._collection
+
+    def put(self, data: bytes) -> str:
+        ref = str(uuid.uuid4())
+        created = datetime.utcnow()
+        self.collection.insert_many([
+            {
+                "ref": ref,
+                "i": i,
+                "data": Binary(data[start:start + BLOB_CHUNK_SIZE]),
+                "created": created
+            } for i, start in enumerate(range(0, len(data), BLOB_CHUNK_SIZE))
+        ])
+
+        return ref
+
+    def get(self, ref: str) -> bytes:
+        chunks = list(self.collection.find({"ref": ref}).sort("i", ASCENDING))
+        if not chunks:
+            raise KeyError(f"Payload {ref} not found in the blob store, "
+                           f"it may have expired")
+
+        return b"".join(chunk["data"] for chunk in chunks)
+
+
+blob_store = BlobStore()
+
+
+def _default(obj: Any) -> Any:
+    # same conversions as the json serializer
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    elif isinstance(obj, timedelta):
+        return obj.total_seconds()
+    elif isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _json_key(key: Any) -> Any:
+    # same conversions of dict keys as the json serializer
+    if isinstance(key, str):
+        return key
+    elif key is True:
+        return "true"
+    elif key is False:
+        return "false"
+    elif key is None:
+        return "null"
+    elif isinstance(key, (int, float)):
+        return str(key) if isinstance(key, int) else repr(key)
+
+    return key
+
+
+def _json_keys(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {_json_key(k): _json_keys(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_json_keys(v) for v in obj]
+
+    return obj
+
+
+def dumps(obj: Any) -> bytes:
+    data = msgpack.packb(_json_keys(obj), default=_default, use_bin_type=True)
+    if len(data) < COMPRESSION_THRESHOLD:
+        return RAW + data
+
+    data = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(data)
+    if len(data) < OFFLOAD_THRESHOLD:
+        return ZSTD + data
+
+    return REF + blob_store.put(data).encode("utf-8")
+
+
+def loads(payload: bytes) -> Any:
+    header, data = payload[:1], payload[1:]
+    if header == REF:
+        data = blob_store.get(bytes(data).decode("utf-8"))
+        header = ZSTD
+    if header == ZSTD:
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif header != RAW:
+        raise ValueError(f"Unrecognized {SERIALIZER_NAME} payload header: {header}")
+
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def register_msgpack_zstd() -> None:
+    register(
+        SERIALIZER_NAME,
+        dumps,
+        loads,
+        content_type=CONTENT_TYPE,
+        content_encoding="binary"
+    )
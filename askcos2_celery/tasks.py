@@ -1,10 +1,46 @@
+import importlib
 import json
 from adapters.registry import get_adapter_registry
 from celery import shared_task
-from utils.registry import get_util_registry
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init
+)
+from askcos2_celery.serializers import SERIALIZER_NAME
+from utils import metrics
+from utils.registry import get_config_path, get_util_registry
 from wrappers.registry import get_wrapper_registry
 
 
+# Build the registries in the main worker process, before the pool is started,
+# so that prefork children share the loaded data copy-on-write
+@worker_init.connect
+def preload_registries(**kwargs) -> None:
+    module_config = importlib.import_module(get_config_path()).module_config
+    if module_config["global"].get("preload_registries", False):
+        get_util_registry().preload()
+        get_wrapper_registry()
+
+
+# Queue wait / run time metrics and trace id propagation, for all tasks
+@before_task_publish.connect
+def on_task_publish(headers: dict = None, **kwargs) -> None:
+    if headers is not None:
+        metrics.on_task_publish(headers)
+
+
+@task_prerun.connect
+def on_task_prerun(task=None, **kwargs) -> None:
+    metrics.on_task_prerun(task)
+
+
+@task_postrun.connect
+def on_task_postrun(task=None, state: str = None, **kwargs) -> None:
+    metrics.on_task_postrun(task, state)
+
+
 @shared_task
 def base_task(module: str, input: dict) -> dict:
     """Celery tasks must have json serializable inputs/outputs"""
@@ -137,6 +173,19 @@ def site_selectivity_task(module: str, input: dict) -> dict:
     return response
 
 
+# Compressed binary messages for the tasks with large inputs
+@shared_task(serializer=SERIALIZER_NAME)
+def tree_search_multi_target_task(module: str, input: dict) -> dict:
+    """Celery tasks must have json serializable inputs/outputs"""
+    wrapper = get_wrapper_registry().get_wrapper(module=module)
+
+    # Reconstruct Input object from, and convert Output object to dict
+    input = wrapper.input_class(**input)
+    response = wrapper.call_sync_without_token(input).dict()
+
+    return response
+
+
 @shared_task
 def tree_optimizer_task(module: str, input: dict) -> dict:
     """Celery tasks must have json serializable inputs/outputs"""
@@ -152,7 +201,7 @@ def tree_optimizer_task(module: str, input: dict) -> dict:
 # Tasks that require authentication (e.g., with the "token" arg)
 
 
-@shared_task
+@shared_task(serializer=SERIALIZER_NAME)
 def tree_analysis_task(module: str, input: dict, token: str) -> dict:
     """Celery tasks must have json serializable inputs/outputs"""
     wrapper = get_wrapper_registry().get_wrapper(module=module)
@@ -178,7 +227,7 @@ def tree_search_expand_one_task(module: str, input: dict, token: str) -> dict:
     return response
 
 
-@shared_task
+@shared_task(serializer=SERIALIZER_NAME)
 def tree_search_mcts_task(module: str, input: dict, token: str) -> dict:
     """Celery tasks must have json serializable inputs/outputs"""
     wrapper = get_wrapper_registry().get_wrapper(module=module)
@@ -190,7 +239,7 @@ def tree_search_mcts_task(module: str, input: dict, token: str) -> dict:
     return response
 
 
-@shared_task
+@shared_task(serializer=SERIALIZER_NAME)
 def tree_search_retro_star_task(module: str, input: dict, token: str) -> dict:
     """Celery tasks must have json serializable inputs/outputs"""
     wrapper = get_wrapper_registry().get_wrapper(module=module)
@@ -0,0 +1,240 @@
+"""
+Lightweight stand-ins for the backend services, for benchmarking the gateway
+without GPUs or real models.
+
+Every default_prediction_url of the modules to start in the module config is
+served, on its own port, by an emulator that answers after a configurable
+latency, with a configurable error rate. The response for a request is a
+sample of the output_class of the wrapper that calls that url, generated from
+the pydantic schema (with payload_scale items per list), unless a fixture
+exists as benchmarks/fixtures/<wrapper name>.json.
+
+Usage:
+    python -m benchmarks.backend_emulator --config configs.module_config_full \
+        --latency_ms 20 --jitter_ms 5 --error_rate 0.01 --payload_scale 10
+"""
+import argparse
+import asyncio
+import importlib
+import inspect
+import json
+import os
+import random
+import re
+import signal
+import types
+import typing
+import uvicorn
+from pydantic import BaseModel
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from typing import Any
+from urllib.parse import urlsplit
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Strings for the fields with conventional values in the backend outputs
+STRING_SAMPLES = {
+    "status": "SUCCESS",
+    "error": "",
+    "smiles": "CCO",
+    "reactants": "CC.O",
+    "outcome": "CCO"
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("backend_emulator")
+    parser.add_argument("--config",
+                        help="module config to emulate the backends of",
+                        type=str, default="configs.module_config_full")
+    parser.add_argument("--latency_ms",
+                        help="mean response latency in milliseconds",
+                        type=float, default=20.0)
+    parser.add_argument("--jitter_ms",
+                        help="standard deviation of the latency in milliseconds",
+                        type=float, default=5.0)
+    parser.add_argument("--error_rate",
+                        help="fraction of requests answered with a 500",
+                        type=float, default=0.0)
+    parser.add_argument("--payload_scale",
+                        help="number of items per list in the generated responses",
+                        type=int, default=10)
+    parser.add_argument("--host",
+                        help="host to bind to, instead of the one in the urls",
+                        type=str, default="127.0.0.1")
+
+    return parser.parse_args()
+
+
+def make_sample(type_: Any, name: str = "", scale: int = 10, depth: int = 0) -> Any:
+    """Generate a sample value of a (pydantic) type annotation"""
+    if depth > 8:
+        return None
+
+    origin = typing.get_origin(type_)
+    args = typing.get_args(type_)
+
+    if inspect.isclass(type_) and issubclass(type_, BaseModel):
+        fields = type_.__fields__
+        if "__root__" in fields:
+            return make_sample(fields["__root__"].outer_type_, name, scale, depth + 1)
+
+        return {
+            field.alias: make_sample(field.outer_type_, field.name, scale, depth + 1)
+            for field in fields.values()
+        }
+    elif origin in (typing.Union, types.UnionType):
+        non_none = [arg for arg in args if arg is not type(None)]
+        return make_sample(non_none[0], name, scale, depth + 1) if non_none else None
+    elif origin is typing.Literal:
+        return args[0]
+    elif origin in (list, set, tuple) or type_ in (list, set, tuple):
+        if origin is tuple and args and args[-1] is not Ellipsis:
+            return [make_sample(arg, name, scale, depth + 1) for arg in args]
+        item_type = args[0] if args else str
+        return [make_sample(item_type, name, scale, depth + 1) for _ in range(scale)]
+    elif origin is dict or type_ is dict:
+        if len(args) == 2 and args[1] is not typing.Any:
+            return {"key": make_sample(args[1], name, scale, depth + 1)}
+        return {}
+    elif type_ is str:
+        return STRING_SAMPLES.get(name, "C")
+    elif type_ is bool:
+        return True
+    elif type_ is int:
+        return 1
+    elif type_ is float:
+        return 0.5
+
+    return None
+
+
+def get_url_suffixes(wrapper_class: type) -> list[str]:
+    """
+    Url suffixes appended to the prediction_url by a wrapper, found from its
+    source, e.g., "/fast_filter_evaluate" or "/{input.model_name}".
+    """
+    suffixes = []
+    for cls in wrapper_class.__mro__:
+        if cls.__module__.startswith("wrappers.") and cls.__name__ != "BaseWrapper":
+            try:
+                source = inspect.getsource(cls)
+            except (OSError, TypeError):
+                continue
+            suffixes.extend(re.findall(r"self\.prediction_url}([^\"]*)\"", source))
+
+    return suffixes or [""]
+
+
+class EmulatedBackend:
+    """Emulator for all the wrappers sharing a prediction_url port"""
+
+    def __init__(self, routes: list[tuple[str, type]], args: argparse.Namespace):
+        # (path regex, wrapper class) pairs, from the most specific
+        self.routes = sorted(routes, key=lambda route: -len(route[0]))
+        self.args = args
+        self.responses = {}
+
+    def get_response(self, path: str) -> Any:
+        for pattern, wrapper_class in self.routes:
+            if re.fullmatch(pattern, path):
+                break
+        else:
+            wrapper_class = self.routes[-1][1]
+
+        name = wrapper_class.name
+        if name not in self.responses:
+            fixture = os.path.join(FIXTURE_DIR, f"{name}.json")
+            if os.path.isfile(fixture):
+                with open(fixture, "r") as f:
+                    self.responses[name] = json.load(f)
+            else:
+                self.responses[name] = make_sample(
+                    wrapper_class.output_class, scale=self.args.payload_scale)
+
+        return self.responses[name]
+
+    async def handle(self, request: Request) -> JSONResponse:
+        if request.method == "GET":
+            # for is_ready()
+            return JSONResponse({"detail": "Not Found"}, status_code=404)
+
+        await request.body()
+        latency = random.gauss(self.args.latency_ms, self.args.jitter_ms)
+        await asyncio.sleep(max(latency, 0.0) / 1000)
+
+        if random.random() < self.args.error_rate:
+            return JSONResponse({"error": "emulated backend error"}, status_code=500)
+
+        return JSONResponse(self.get_response(request.url.path))
+
+    def make_app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/{path:path}", self.handle, methods=["GET", "POST"])
+        ])
+
+
+def get_backends(config: str, args: argparse.Namespace) -> dict[int, EmulatedBackend]:
+    from wrappers import WRAPPER_CLASSES
+
+    module_config = importlib.import_module(config).module_config
+    routes_by_port = {}
+    for module, to_start in module_config["modules_to_start"].items():
+        deployment = module_config.get(module, {}).get("deployment", {})
+        if not to_start or not deployment.get("default_prediction_url"):
+            continue
+
+        url = urlsplit(deployment["default_prediction_url"])
+        base_path = url.path.rstrip("/")
+        for name in module_config[module].get("wrapper_names", [module]):
+            wrapper_class = WRAPPER_CLASSES.get(name)
+            if wrapper_class is None:
+                continue
+            for suffix in get_url_suffixes(wrapper_class):
+                pattern = re.escape(base_path + suffix)
+                pattern = re.sub(r"\\{[^}]*\\}", "[^/]+", pattern)
+                routes_by_port.setdefault(url.port, []).append((pattern, wrapper_class))
+
+    return {
+        port: EmulatedBackend(routes=routes, args=args)
+        for port, routes in routes_by_port.items()
+    }
+
+
+class _Server(uvicorn.Server):
+    def install_signal_handlers(self) -> None:
+        # each server would replace the handlers of the previous one,
+        # so they are installed once for all the servers in serve()
+        pass
+
+
+async def serve(backends: dict[int, EmulatedBackend], host: str) -> None:
+    servers = [
+        _Server(uvicorn.Config(
+            backend.make_app(), host=host, port=port, log_level="warning"))
+        for port, backend in backends.items()
+    ]
+
+    def handle_exit() -> None:
+        for server in servers:
+            server.should_exit = True
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, handle_exit)
+
+    print(f"Emulating backends on ports: {sorted(backends)}", flush=True)
+    await asyncio.gather(*[server.serve() for server in servers])
+
+
+def main():
+    args = parse_args()
+    backends = get_backends(config=args.config, args=args)
+    asyncio.run(serve(backends=backends, host=args.host))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Run the gateway (app.py) for benchmarking, optionally with an in-memory
+mongomock in place of MongoDB, so that no database needs to be running.
+
+Usage:
+    python -m benchmarks.gateway --port 9199 --mongo mongomock
+"""
+import argparse
+import uvicorn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("gateway")
+    parser.add_argument("--host", help="host to bind to", type=str, default="127.0.0.1")
+    parser.add_argument("--port", help="port to bind to", type=int, default=9199)
+    parser.add_argument("--mongo",
+                        help="mongomock (in-memory) or local (configs.db_config)",
+                        choices=["mongomock", "local"], type=str, default="mongomock")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.mongo == "mongomock":
+        # needs to be patched before any module does "from pymongo import MongoClient"
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    from app import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+End-to-end throughput benchmark of the gateway against emulated backends.
+
+Starts benchmarks.backend_emulator and benchmarks.gateway as subprocesses,
+drives each scenario in benchmarks/scenarios.json with the given concurrency,
+and reports the p50/p95/p99 latency, the throughput, and the CPU time per
+request spent in each stage (gateway, emulated backends, load generator).
+
+With --baseline, the results are compared against a previous --output, and
+the run fails if any scenario regressed by more than --max_regression.
+
+Usage (from the repo root, with mongomock installed for --mongo mongomock):
+    python -m benchmarks.run_benchmark --concurrency 16 --num_requests 500 \
+        --output benchmark.json [--baseline benchmark_main.json]
+"""
+import argparse
+import asyncio
+import httpx
+import importlib
+import json
+import numpy as np
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+SCENARIOS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "scenarios.json")
+STARTUP_TIMEOUT = 300
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("run_benchmark")
+    parser.add_argument("--config",
+                        help="module config for the gateway and the emulator",
+                        type=str, default="configs.module_config_full")
+    parser.add_argument("--scenarios",
+                        help="json file with the scenarios to run",
+                        type=str, default=SCENARIOS_FILE)
+    parser.add_argument("--only",
+                        help="comma-separated names of the scenarios to run",
+                        type=str, default="")
+    parser.add_argument("--concurrency",
+                        help="number of requests in flight",
+                        type=int, default=16)
+    parser.add_argument("--num_requests",
+                        help="number of measured requests per scenario",
+                        type=int, default=500)
+    parser.add_argument("--num_warmup",
+                        help="number of unmeasured requests per scenario",
+                        type=int, default=20)
+    parser.add_argument("--mongo",
+                        help="mongomock (in-memory) or local (configs.db_config)",
+                        choices=["mongomock", "local"], type=str, default="mongomock")
+    parser.add_argument("--gateway_port",
+                        help="port for the gateway",
+                        type=int, default=9199)
+    # Passed through to the emulator
+    parser.add_argument("--latency_ms", type=float, default=20.0)
+    parser.add_argument("--jitter_ms", type=float, default=5.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--payload_scale", type=int, default=10)
+
+    parser.add_argument("--output",
+                        help="json file to save the results into",
+                        type=str, default="")
+    parser.add_argument("--baseline",
+                        help="json file of previous results to compare against",
+                        type=str, default="")
+    parser.add_argument("--max_regression",
+                        help="allowed relative regression against the baseline",
+                        type=float, default=0.2)
+
+    return parser.parse_args()
+
+
+def get_cpu_seconds(pid: int) -> float | None:
+    """User + system CPU time of a process, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+
+    # utime and stime are the 14th and 15th fields, i.e., 12th and 13th after comm
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def get_backend_ports(config: str) -> list[int]:
+    module_config = importlib.import_module(config).module_config
+    ports = set()
+    for module, to_start in module_config["modules_to_start"].items():
+        url = module_config.get(module, {}).get("deployment", {}).get(
+            "default_prediction_url")
+        if to_start and url:
+            ports.add(urlsplit(url).port)
+
+    return sorted(ports)
+
+
+def is_port_in_use(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def wait_for_port(port: int, process: subprocess.Popen, deadline: float) -> None:
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process {process.args} exited during startup")
+        if is_port_in_use(port):
+            return
+        time.sleep(0.5)
+
+    raise TimeoutError(f"Port {port} not ready after {STARTUP_TIMEOUT} seconds")
+
+
+def start_processes(args: argparse.Namespace
+                    ) -> tuple[subprocess.Popen, subprocess.Popen]:
+    ports = get_backend_ports(args.config) + [args.gateway_port]
+    in_use = [port for port in ports if is_port_in_use(port)]
+    if in_use:
+        # otherwise we would silently benchmark whatever is already running
+        raise RuntimeError(f"Ports already in use: {in_use}")
+
+    env = {**os.environ, "MODULE_CONFIG_PATH": args.config}
+    emulator = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.backend_emulator",
+            "--config", args.config,
+            "--latency_ms", str(args.latency_ms),
+            "--jitter_ms", str(args.jitter_ms),
+            "--error_rate", str(args.error_rate),
+            "--payload_scale", str(args.payload_scale)
+        ],
+        env=env
+    )
+    gateway = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.gateway",
+            "--port", str(args.gateway_port),
+            "--mongo", args.mongo
+        ],
+        env=env
+    )
+
+    deadline = time.time() + STARTUP_TIMEOUT
+    for port in ports[:-1]:
+        wait_for_port(port, emulator, deadline)
+    wait_for_port(args.gateway_port, gateway, deadline)
+
+    return emulator, gateway
+
+
+def is_error(response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+
+    # wrappers report backend errors in the body, with a 200
+    return isinstance(body, dict) and body.get("status_code", 200) >= 400
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: dict,
+    concurrency: int,
+    num_requests: int
+) -> tuple[list[float], int]:
+    """Returns the latencies in seconds and the number of errors"""
+    if "body_file" in scenario:
+        with open(scenario["body_file"], "r") as f:
+            body = json.load(f)
+    else:
+        body = scenario.get("body", {})
+    method = scenario.get("method", "POST")
+
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _request() -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, scenario["path"], json=body)
+                failed = is_error(response)
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    await asyncio.gather(*[_request() for _ in range(num_requests)])
+
+    return latencies, errors
+
+
+async def run_benchmark(
+    args: argparse.Namespace,
+    scenarios: list[dict],
+    emulator: subprocess.Popen,
+    gateway: subprocess.Popen
+) -> dict[str, dict]:
+    results = {}
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{args.gateway_port}",
+        timeout=120,
+        limits=httpx.Limits(max_connections=args.concurrency)
+    ) as client:
+        for scenario in scenarios:
+            await run_scenario(client, scenario, args.concurrency, args.num_warmup)
+
+            cpu_start = {
+                "gateway": get_cpu_seconds(gateway.pid),
+                "backends": get_cpu_seconds(emulator.pid),
+                "client": time.process_time()
+            }
+            start = time.perf_counter()
+            latencies, errors = await run_scenario(
+                client, scenario, args.concurrency, args.num_requests)
+            elapsed = time.perf_counter() - start
+            cpu_end = {
+                "gateway": get_cpu_seconds(gateway.pid),
+                "backends": get_cpu_seconds(emulator.pid),
+                "client": time.process_time()
+            }
+
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+            results[scenario["name"]] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "throughput": len(latencies) / elapsed,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "cpu_ms_per_request": {
+                    stage: (cpu_end[stage] - cpu_start[stage]) * 1000 / len(latencies)
+                    if cpu_start[stage] is not None else None
+                    for stage in cpu_start
+                }
+            }
+
+    return results
+
+
+def print_report(results: dict[str, dict]) -> None:
+    header = f"{'scenario':<28}{'req':>6}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}" \
+             f"{'p99':>9}  cpu ms/req (gateway/backends/client)"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        cpu = "/".join(
+            f"{v:.2f}" if v is not None else "n/a"
+            for v in r["cpu_ms_per_request"].values()
+        )
+        print(f"{name:<28}{r['requests']:>6}{r['errors']:>6}{r['throughput']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}  {cpu}")
+
+
+def compare_to_baseline(
+    results: dict[str, dict],
+    baseline: dict[str, dict],
+    max_regression: float
+) -> list[str]:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        checks = [
+            ("p95_ms", r["p95_ms"], base["p95_ms"], True),
+            ("throughput", r["throughput"], base["throughput"], False),
+            (
+                "gateway cpu_ms_per_request",
+                r["cpu_ms_per_request"]["gateway"],
+                base["cpu_ms_per_request"]["gateway"],
+                True
+            )
+        ]
+        for metric, value, base_value, higher_is_worse in checks:
+            if value is None or not base_value:
+                continue
+            change = (value - base_value) / base_value
+            if (change if higher_is_worse else -change) > max_regression:
+                regressions.append(
+                    f"{name}: {metric} {base_value:.2f} -> {value:.2f} "
+                    f"({change:+.0%})"
+                )
+
+    return regressions
+
+
+def main():
+    args = parse_args()
+    with open(args.scenarios, "r") as f:
+        scenarios = json.load(f)
+    if args.only:
+        names = args.only.split(",")
+        scenarios = [scenario for scenario in scenarios if scenario["name"] in names]
+
+    emulator, gateway = start_processes(args)
+    try:
+        results = asyncio.run(run_benchmark(args, scenarios, emulator, gateway))
+    finally:
+        for process in [gateway, emulator]:
+            process.terminate()
+            process.wait()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.max_regression)
+        if regressions:
+            print(f"Regressions of more than {args.max_regression:.0%} vs. baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions vs. baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,7 +34,9 @@ module_config = {
         "require_frontend": True,
         "container_runtime": "docker",
         "image_policy": "build_all",
-        "enable_gpu": False
+        "enable_gpu": False,
+        "util_init_workers": 8,
+        "preload_registries": False
     },
 
     "atom_map_indigo": {
@@ -173,7 +175,9 @@ module_config = {
             "default_prediction_url": "http://0.0.0.0:9611",
             "custom_prediction_url": "",
             "timeout": 10,
-            "available_model_names": []
+            "available_model_names": [],
+            "micro_batch_size": 64,
+            "micro_batch_wait_ms": 5
         },
         "wrapper_names": [
             "fast_filter",
@@ -414,7 +418,9 @@ module_config = {
             "default_prediction_url": "http://0.0.0.0:9741/scscore",
             "custom_prediction_url": "",
             "timeout": 10,
-            "available_model_names": []
+            "available_model_names": [],
+            "micro_batch_size": 64,
+            "micro_batch_wait_ms": 5
         },
         "wrapper_names": [
             "scscore",
@@ -476,6 +482,10 @@ module_config = {
             "ports_to_expose": [9311],
             "default_prediction_url": "http://0.0.0.0:9311/get_buyable_paths",
             "custom_prediction_url": "",
+            # for async runs, to persist partial results and allow early stops;
+            # falls back to the prediction url if not supported by the backend
+            "streaming_prediction_url":
+                "http://0.0.0.0:9311/get_buyable_paths_streaming",
             "timeout": 1200,
             "available_model_names": []
         }
@@ -491,6 +501,10 @@ module_config = {
             "ports_to_expose": [9321],
             "default_prediction_url": "http://0.0.0.0:9321/get_buyable_paths",
             "custom_prediction_url": "",
+            # for async runs, to persist partial results and allow early stops;
+            # falls back to the prediction url if not supported by the backend
+            "streaming_prediction_url":
+                "http://0.0.0.0:9321/get_buyable_paths_streaming",
             "timeout": 1200,
             "available_model_names": []
         }
@@ -500,24 +514,46 @@ module_config = {
     "banned_chemicals": {
         "engine": "db",
         "database": "askcos",
-        "collection": "banned_chemicals"
+        "collection": "banned_chemicals",
+        "cache_size": 1000,
+        "cache_ttl": 60
     },
 
     "banned_reactions": {
         "engine": "db",
         "database": "askcos",
-        "collection": "banned_reactions"
+        "collection": "banned_reactions",
+        "cache_size": 1000,
+        "cache_ttl": 60
+    },
+
+    "cache_controller": {
+        "engine": "db",
+        "database": "cache",
+        "cache_size": 10000,
+        "ttl": 86400,
+        "single_flight": True,
+        "distributed_single_flight": False,
+        "single_flight_timeout": 60
     },
 
     "celery_task": {},
 
-    "draw": {},
+    "draw": {
+        "cache_size": 2000,
+        "disk_cache_dir": "",
+        "max_age": 86400,
+        "max_batch_size": 1000,
+        "num_workers": 4
+    },
 
     "historian": {
         "engine": "db",
         "database": "askcos",
         "collection": "chemicals",
-        "files": []
+        "files": [],
+        "snapshot_dir": "",
+        "lazy_init": True
     },
 
     "pricer": {
@@ -525,15 +561,22 @@ module_config = {
         "database": "askcos",
         "collection": "buyables",
         "file": "",
-        "precompute_mols": False
+        "precompute_mols": False,
+        "snapshot_dir": "",
+        "smarts_cache_size": 1000,
+        "num_workers": 4,
+        "lazy_init": True
     },
 
     "reactions": {
-        "force_recompute_mols": False
+        "force_recompute_mols": False,
+        "fp_index_dir": "",
+        "lazy_init": True
     },
 
     "selectivity_refs": {
-        "file": "utils/site_selectivity_refs.json"
+        "file": "utils/site_selectivity_refs.json",
+        "lazy_init": True
     },
 
     "tree_search_results_controller": {
@@ -544,7 +587,9 @@ module_config = {
     "user_controller": {
         "engine": "db",
         "database": "askcos",
-        "collection": "users"
+        "collection": "users",
+        "token_cache_size": 10000,
+        "token_cache_ttl": 60
     },
 
     "frontend_config_controller": {
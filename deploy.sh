@@ -244,6 +244,12 @@ precompute() {
     /opt/conda/bin/python -m scripts.pre_compute --mode="$1"
 }
 
+precompute-buyables() {
+  # fingerprints for the buyables, only for documents that lack them
+  docker compose -f compose.yaml exec -T precompute \
+    /opt/conda/bin/python -m scripts.precompute_buyables
+}
+
 index-db() {
   if [ "$DROP_INDEXES" = "true" ]; then
     echo "Dropping existing indexes in mongo database..."
@@ -310,6 +316,10 @@ seed-db() {
     mongoimport_upsert buyables "$buyables_file"
   fi
 
+  if [ -n "$BUYABLES" ]; then
+    precompute-buyables
+  fi
+
   if [ "$CHEMICALS" = "default" ]; then
     echo "Loading default chemicals data..."
     chemicals_file="${DATA_DIR}/historian/chemicals.json.gz"
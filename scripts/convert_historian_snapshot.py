@@ -0,0 +1,29 @@
+import argparse
+import os
+from utils.historian import FileHistorian
+from utils.snapshot_utils import snapshot_lock
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("convert_historian_snapshot")
+    parser.add_argument("--files",
+                        help="historian json.gz files, as in the 'files' config",
+                        type=str, nargs="+", required=True)
+    parser.add_argument("--snapshot_dir",
+                        help="output directory, as in the 'snapshot_dir' config",
+                        type=str, default="data/precompute/historian")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with snapshot_lock(os.path.join(args.snapshot_dir, "_meta")):
+        FileHistorian.convert_to_snapshot(
+            files=args.files,
+            snapshot_dir=args.snapshot_dir
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import argparse
+import hashlib
 import multiprocessing
-import numpy as np
 import sys
 import time
+from bson import ObjectId
+from collections import Counter
 from configs import db_config
-from pymongo import errors, MongoClient
+from pymongo import errors, MongoClient, ReplaceOne, UpdateOne
 from rdkit import Chem, RDLogger
-from rdkit.Chem import AllChem, DataStructs
-from typing import Any
+from rdkit.Chem import AllChem
+from typing import Any, Iterable, Iterator
 
 RDLogger.DisableLog("rdApp.warning")
 
@@ -17,6 +19,8 @@ collection = "reactions"
 mol_collection = "products_in_reactions"
 index_collection = "index_for_reactions"
 count_collection = "fp_counts_in_reactions"
+# content version of mol_collection by template set, for the fingerprint indexes
+version_collection = "mol_versions_in_reactions"
 
 try:
     client.server_info()
@@ -24,13 +28,12 @@ except errors.ServerSelectionTimeoutError:
     raise ValueError("Cannot connect to mongodb for reactions")
 else:
     db = client[database]
-    db.drop_collection(mol_collection)
-    db.drop_collection(count_collection)
 
     collection = db[collection]
     mol_collection = db[mol_collection]
     index_collection = db[index_collection]
     count_collection = db[count_collection]
+    version_collection = db[version_collection]
 
 
 def parse_args():
@@ -38,10 +41,24 @@ def parse_args():
     parser.add_argument("--mode",
                         help="pre-computation mode",
                         choices=["reactions"], type=str, default="reactions")
+    parser.add_argument("--full",
+                        help="drop and rebuild everything, instead of only processing "
+                             "new or changed reactions",
+                        action="store_true")
+    parser.add_argument("--batch_size",
+                        help="number of reactions per batch of writes",
+                        type=int, default=10000)
 
     return parser.parse_args()
 
 
+def _get_reaction_hash(rxn: dict) -> str:
+    """Hash of the fields the precomputed fingerprints depend on"""
+    key = f"{rxn['template_set']}|{rxn['reaction_smiles']}"
+
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
 def _get_products_and_fps(rxn: dict) -> dict[str, Any] | None:
     fp_size = 2048
 
@@ -61,15 +78,6 @@ def _get_products_and_fps(rxn: dict) -> dict[str, Any] | None:
     pfp_bits = list(Chem.rdmolops.PatternFingerprint(
         product_mol).GetOnBits())
 
-    # mfp_bits = np.empty((1, fp_size), dtype=dtype)
-    # pfp_bits = np.empty((1, fp_size), dtype=dtype)
-    #
-    # DataStructs.ConvertToNumpyArray(mfp_bits_vc, mfp_bits)
-    # DataStructs.ConvertToNumpyArray(pfp_bits_vc, pfp_bits)
-    #
-    # mfp_bits = mfp_bits.astype(dtype=np.bool_)
-    # pfp_bits = pfp_bits.astype(dtype=np.bool_)
-
     mol = {
         "_id": rxn["_id"],
         "template_set": rxn["template_set"],
@@ -77,89 +85,253 @@ def _get_products_and_fps(rxn: dict) -> dict[str, Any] | None:
         "mfp_bits": mfp_bits,
         "mfp_count": len(mfp_bits),
         "pfp_bits": pfp_bits,
-        "pfp_count": len(pfp_bits)
-    }
-    mol_collection.insert_one(mol)
-    del mol
-
-    mol = {
-        "template_set": rxn["template_set"],
-        "mfp_bits": mfp_bits
+        "pfp_count": len(pfp_bits),
+        "reaction_hash": _get_reaction_hash(rxn)
     }
 
     return mol
 
 
-def precompute_reactions() -> None:
+def _get_batches(cursor: Iterable[dict], batch_size: int) -> Iterator[list[dict]]:
+    batch = []
+    for rxn in cursor:
+        batch.append(rxn)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _get_count_deltas(mols: Iterable[dict]) -> Counter:
+    """Bit count changes by the mols of a batch, less the fingerprints they replaced"""
+    deltas = Counter()
+    for mol in mols:
+        for bit in mol.get("mfp_bits", []):
+            deltas[(mol["template_set"], bit)] += 1
+        uncount = mol.get("uncount")
+        if uncount:
+            for bit in uncount["mfp_bits"]:
+                deltas[(uncount["template_set"], bit)] -= 1
+
+    return deltas
+
+
+def _count_batch(batch_id: ObjectId, mols: list[dict]) -> None:
+    """
+    Apply the bit count changes of a written batch of mols, then clear their
+    "count_batch" markers. Each count document records the last batch applied
+    to it, so that a batch interrupted in between is not counted twice when
+    it is counted again by _count_interrupted_batches().
+    """
+    operations = [
+        UpdateOne(
+            {"template_set": template_set, "bit_index": bit, "batch": {"$ne": batch_id}},
+            {"$inc": {"count": count}, "$set": {"batch": batch_id}},
+            upsert=True
+        ) for (template_set, bit), count in _get_count_deltas(mols).items()
+    ]
+    if operations:
+        try:
+            count_collection.bulk_write(operations, ordered=False)
+        except errors.BulkWriteError as e:
+            # upserts of the count documents this batch was already applied to
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+
+    mol_collection.delete_many({"count_batch": batch_id, "removed": True})
+    mol_collection.update_many(
+        {"count_batch": batch_id},
+        {"$unset": {"count_batch": "", "uncount": ""}}
+    )
+    _bump_versions(
+        {mol.get("template_set") for mol in mols}
+        | {mol["uncount"]["template_set"] for mol in mols if mol.get("uncount")}
+    )
+
+
+def _bump_versions(template_sets: Iterable[str | None]) -> None:
+    """Mark the mols of the template sets as changed, e.g., for load_fp_index()"""
+    for template_set in template_sets:
+        if template_set is not None:
+            version_collection.update_one(
+                {"_id": template_set}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def _count_interrupted_batches() -> None:
+    """Count the mols written by an interrupted run, but not counted yet"""
+    for batch_id in mol_collection.distinct("count_batch"):
+        mols = list(mol_collection.find(
+            {"count_batch": batch_id},
+            {"template_set": 1, "mfp_bits": 1, "uncount": 1}
+        ))
+        _count_batch(batch_id, mols)
+        print(f"Counted {len(mols)} mols of an interrupted batch")
+
+
+def _get_removed_mol(old_mol: dict, batch_id: ObjectId) -> dict:
+    """
+    Placeholder for a mol to be removed, kept until its old fingerprint has
+    been subtracted from the counts. Without a "template_set", so that it is
+    never matched by the lookups meanwhile.
+    """
+    return {
+        "_id": old_mol["_id"],
+        "removed": True,
+        "count_batch": batch_id,
+        "uncount": {
+            "template_set": old_mol["template_set"],
+            "mfp_bits": old_mol.get("mfp_bits", [])
+        }
+    }
+
+
+def _remove_deleted_reactions(query: dict, batch_size: int) -> int:
+    """
+    Remove the mols whose reactions were deleted (or no longer match the query),
+    subtracting their fingerprints from the counts.
+    """
+    removed_count = 0
+    cursor = mol_collection.find(
+        {}, {"template_set": 1, "mfp_bits": 1}, no_cursor_timeout=True
+    ).sort("_id", 1)
+    for old_mols in _get_batches(cursor, batch_size):
+        present = {
+            rxn["_id"] for rxn in collection.find(
+                {"_id": {"$in": [mol["_id"] for mol in old_mols]}, **query},
+                {"_id": 1}
+            )
+        }
+        batch_id = ObjectId()
+        removed = [
+            _get_removed_mol(old_mol, batch_id)
+            for old_mol in old_mols if old_mol["_id"] not in present
+        ]
+        if removed:
+            mol_collection.bulk_write(
+                [ReplaceOne({"_id": mol["_id"]}, mol) for mol in removed],
+                ordered=False
+            )
+            _count_batch(batch_id, removed)
+            removed_count += len(removed)
+    cursor.close()
+
+    return removed_count
+
+
+def precompute_reactions(full: bool = False, batch_size: int = 10000) -> None:
+    """
+    Precompute the product fingerprints for the reactions into mol_collection,
+    with the per-bit counts by template set in count_collection.
+
+    By default, only the reactions that are new, or whose reaction_smiles or
+    template_set changed since the last run (by "reaction_hash"), are processed,
+    the mols of deleted reactions are removed, and the bit counts are adjusted
+    with $inc upserts. With full=True, both collections are dropped and rebuilt
+    from scratch.
+
+    The counts are adjusted after every batch of mol writes. The mols are
+    written with a "count_batch" marker (and the fingerprint they replace)
+    until then, so that a batch interrupted in between is counted exactly
+    once by the next run.
+    """
     start = time.time()
-    mfp_counts = {}
-    # all_mfp_bits = []
+    processed_count = 0
     success_count = 0
+    skipped_count = 0
+
+    if full:
+        db.drop_collection(mol_collection.name)
+        db.drop_collection(count_collection.name)
+
+    count_collection.create_index(
+        [("template_set", 1), ("bit_index", 1)], unique=True)
+    mol_collection.create_index("count_batch", sparse=True)
+    _count_interrupted_batches()
 
-    p = multiprocessing.Pool()
     query = {
         "reaction_smiles": {"$exists": True},
         "reaction_smarts": {"$nin": [None, ""]}
     }
 
-    print("Precomputing fingerprints for all reactions (including newly added ones)")
+    print(f"Precomputing fingerprints for "
+          f"{'all' if full else 'new or changed'} reactions")
     sys.stdout.flush()
 
-    cursor = collection.find(query)
-    for i, result in enumerate(p.imap_unordered(_get_products_and_fps, cursor)):
-        if i > 0 and i % 100000 == 0:
-            print(f"Processed {i} reactions with 'reaction_smiles' and 'reaction_smarts' "
-                  f"in {time.time() - start:.2f} seconds. "
-                  f"Success count: {success_count}")
-            sys.stdout.flush()
-
-        if result is None:
-            continue
-
-        template_set = result["template_set"]
-        mfp_bits = result["mfp_bits"]
-        # all_mfp_bits.append(mfp_bits)
-
-        if template_set not in mfp_counts:
-            mfp_counts[template_set] = {}
-        mfp_counts_by_template = mfp_counts[template_set]
-
-        for bit in mfp_bits:
-            mfp_counts_by_template[bit] = mfp_counts_by_template.get(bit, 0) + 1
-
-        del result
-        success_count += 1
+    p = multiprocessing.Pool()
+    cursor = collection.find(
+        query,
+        {"_id": 1, "reaction_smiles": 1, "template_set": 1},
+        no_cursor_timeout=True
+    )
+    for batch in _get_batches(cursor, batch_size):
+        processed_count += len(batch)
+        existing = {}
+        if not full:
+            existing = {
+                mol["_id"]: mol for mol in mol_collection.find(
+                    {"_id": {"$in": [rxn["_id"] for rxn in batch]}},
+                    {"reaction_hash": 1, "template_set": 1, "mfp_bits": 1}
+                )
+            }
+            batch_size_before = len(batch)
+            batch = [
+                rxn for rxn in batch
+                if existing.get(rxn["_id"], {}).get("reaction_hash")
+                != _get_reaction_hash(rxn)
+            ]
+            skipped_count += batch_size_before - len(batch)
+
+        batch_id = ObjectId()
+        mols = []
+        for rxn, mol in zip(batch, p.imap(_get_products_and_fps, batch, chunksize=100)):
+            old_mol = existing.get(rxn["_id"])
+            if mol is None:
+                if old_mol is not None:
+                    mols.append(_get_removed_mol(old_mol, batch_id))
+                continue
+
+            mol["count_batch"] = batch_id
+            if old_mol is not None:
+                # changed reaction, to retract the counts of its old fingerprint
+                mol["uncount"] = {
+                    "template_set": old_mol["template_set"],
+                    "mfp_bits": old_mol.get("mfp_bits", [])
+                }
+            mols.append(mol)
+            success_count += 1
+
+        if mols:
+            mol_collection.bulk_write(
+                [ReplaceOne({"_id": mol["_id"]}, mol, upsert=True) for mol in mols],
+                ordered=False
+            )
+            _count_batch(batch_id, mols)
+
+        print(f"Processed {processed_count} reactions with 'reaction_smiles' "
+              f"and 'reaction_smarts' in {time.time() - start:.2f} seconds. "
+              f"Success count: {success_count}, unchanged count: {skipped_count}")
+        sys.stdout.flush()
+    cursor.close()
 
     p.close()
     p.join()
 
-    # print("Stacking all mfp_bits..")
-    # all_mfp_bits = np.stack(all_mfp_bits)
-    # print(f"Done stacking, shape: {all_mfp_bits.shape}, dtype: {all_mfp_bits.dtype}."
-    #       f"Saving")
-    #
-    # ofn = "data/precompute/all_mfp_bits.npy"
-    # np.save(ofn, all_mfp_bits)
-
-    for template_set, mfp_counts_by_template in mfp_counts.items():
-        for k, v in mfp_counts_by_template.items():
-            count_collection.insert_one({
-                "bit_index": k,
-                "count": v,
-                "template_set": template_set
-            })
-
-    # Indexing.. Also taking too long
-    # mol_collection.create_index("mfp_bits")
-    # mol_collection.create_index("mfp_count")
-    # mol_collection.create_index("pfp_bits")
-    # mol_collection.create_index("pfp_count")
+    if not full:
+        removed_count = _remove_deleted_reactions(query, batch_size)
+        print(f"Removed {removed_count} mols of deleted reactions")
+
+    # For the count-bounded similarity search (and the fingerprint index)
+    print("Creating indexes")
+    sys.stdout.flush()
+    mol_collection.create_index([("template_set", 1), ("mfp_count", 1)])
+    print(f"Done precomputing in {time.time() - start:.2f} seconds")
 
 
 def main():
     args = parse_args()
     if args.mode == "reactions":
-        precompute_reactions()
+        precompute_reactions(full=args.full, batch_size=args.batch_size)
     else:
         raise NotImplementedError
 
@@ -0,0 +1,56 @@
+import argparse
+from configs import db_config
+from utils.pricer import MongoPricer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("precompute_buyables")
+    parser.add_argument("--database",
+                        help="database name, as in the pricer config",
+                        type=str, default="askcos")
+    parser.add_argument("--collection",
+                        help="collection name, as in the pricer config",
+                        type=str, default="buyables")
+    parser.add_argument("--batch_size",
+                        help="number of documents per batch (and checkpoint)",
+                        type=int, default=10000)
+    parser.add_argument("--num_workers",
+                        help="number of processes for fingerprinting",
+                        type=int, default=4)
+    parser.add_argument("--full",
+                        help="recompute for all documents, "
+                             "instead of only the ones without fingerprints",
+                        action="store_true")
+    parser.add_argument("--snapshot_dir",
+                        help="directory to save the snapshot for SMARTS lookups to, "
+                             "as in the pricer 'snapshot_dir' config",
+                        type=str, default="")
+    parser.add_argument("--snapshot_only",
+                        help="only save the snapshot, e.g., ahead of a deployment "
+                             "(the API otherwise rebuilds it in the background)",
+                        action="store_true")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pricer = MongoPricer(
+        config=db_config.MONGO,
+        database=args.database,
+        collection=args.collection,
+        snapshot_dir=args.snapshot_dir,
+        num_workers=args.num_workers
+    )
+    if not args.snapshot_only:
+        pricer.precompute_mols(
+            batch_size=args.batch_size,
+            num_workers=args.num_workers,
+            incremental=not args.full
+        )
+    if args.snapshot_dir:
+        pricer.save_snapshot()
+
+
+if __name__ == "__main__":
+    main()
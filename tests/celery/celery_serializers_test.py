@@ -0,0 +1,66 @@
+import unittest
+from askcos2_celery import celery_app
+from askcos2_celery.serializers import CONTENT_TYPE, dumps, loads
+from askcos2_celery.tasks import (
+    base_task,
+    tree_analysis_task,
+    tree_search_mcts_task,
+    tree_search_multi_target_task,
+    tree_search_retro_star_task
+)
+from kombu import Connection
+
+
+class CelerySerializersTest(unittest.TestCase):
+    """Test class for the serialization of the celery task messages and results"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """This method is run once before all tests in this class."""
+        # publish to an in-memory broker, without a result backend to contact
+        celery_app.conf.result_backend = "cache+memory://"
+        cls.connection = Connection("memory://")
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.connection.release()
+
+    def get_published_message(self, task, args: tuple):
+        queue = celery_app.amqp.router.route({}, task.name)["queue"].name
+        with self.connection.Producer() as producer:
+            task.apply_async(args=args, producer=producer)
+        message = self.connection.SimpleQueue(queue).get(timeout=1)
+        message.ack()
+
+        return message
+
+    def test_large_task_messages(self):
+        for task in [
+            tree_analysis_task,
+            tree_search_mcts_task,
+            tree_search_retro_star_task
+        ]:
+            message = self.get_published_message(task, ("module", {"a": 1}, "token"))
+            self.assertEqual(message.content_type, CONTENT_TYPE, task.name)
+
+        message = self.get_published_message(
+            tree_search_multi_target_task, ("module", {"a": 1}))
+        self.assertEqual(message.content_type, CONTENT_TYPE)
+
+    def test_other_task_messages(self):
+        message = self.get_published_message(base_task, ("module", {"a": 1}))
+        self.assertEqual(message.content_type, "application/json")
+
+    def test_json_compatible_results(self):
+        # results keep the shapes they had with the json serializer
+        result = {1: [1, 2], "a": {2.5: None, True: (1, 2)}, None: "x"}
+        self.assertEqual(
+            loads(dumps(result)),
+            {"1": [1, 2], "a": {"2.5": None, "true": [1, 2]}, "null": "x"}
+        )
+        large = {i: "x" * 10 for i in range(1000)}
+        self.assertEqual(loads(dumps(large)), {str(i): "x" * 10 for i in range(1000)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import mongomock
+import unittest
+from unittest import mock
+from utils import banned_chemicals, base
+from utils.banned_chemicals import BannedChemicalsController
+from utils.base import canonicalize_banned_smiles, compile_banlist
+from utils.user import User
+
+
+class BanlistCompilationTest(unittest.TestCase):
+    """Test class for the canonicalization of banned SMILES"""
+
+    def test_canonicalize_chemicals(self):
+        self.assertEqual(canonicalize_banned_smiles("OCC"), "CCO")
+        self.assertEqual(canonicalize_banned_smiles("  C(C)O \n"), "CCO")
+        self.assertEqual(canonicalize_banned_smiles("C1=CC=CC=C1"), "c1ccccc1")
+        self.assertEqual(canonicalize_banned_smiles("N[C@@H](C)C(=O)O"),
+                         canonicalize_banned_smiles("C[C@H](N)C(=O)O"))
+
+    def test_canonicalize_reactions(self):
+        self.assertEqual(canonicalize_banned_smiles("OCC.CC(=O)O>>O=C(C)OCC"),
+                         "CC(=O)O.CCO>>CCOC(C)=O")
+        self.assertEqual(canonicalize_banned_smiles("CC(=O)O.OCC>>CCOC(C)=O"),
+                         "CC(=O)O.CCO>>CCOC(C)=O")
+        self.assertEqual(canonicalize_banned_smiles("OCC>[Na+].[OH-]>C=O"),
+                         "CCO>[Na+].[OH-]>C=O")
+
+    def test_unparsable_kept_verbatim(self):
+        self.assertEqual(canonicalize_banned_smiles(" not_a_smiles "), "not_a_smiles")
+        # a single unparsable part keeps the whole reaction as is
+        self.assertEqual(canonicalize_banned_smiles("OCC>>not_a_smiles"),
+                         "OCC>>not_a_smiles")
+
+    def test_compile_banlist(self):
+        self.assertEqual(
+            compile_banlist(["OCC", "CCO", " C(C)O", "", "  ", None, "c1ccccc1", "xyz"]),
+            ["CCO", "c1ccccc1", "xyz"]
+        )
+        self.assertEqual(compile_banlist([]), [])
+
+
+class BanlistControllerTest(unittest.TestCase):
+    """Test class for the cached active banlists of the banlist controllers"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(base, "MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # tokens are the usernames
+        user_controller = mock.Mock()
+        user_controller.get_current_user.side_effect = lambda token: User(
+            username=token, hashed_password="")
+        registry = mock.Mock()
+        registry.get_util.return_value = user_controller
+        for module in [base, banned_chemicals]:
+            registry_patcher = mock.patch.object(
+                module, "get_util_registry", return_value=registry)
+            registry_patcher.start()
+            self.addCleanup(registry_patcher.stop)
+
+        self.controller = BannedChemicalsController(util_config={
+            "engine": "db",
+            "database": "askcos",
+            "collection": "banned_chemicals"
+        })
+        self.controller.post(smiles="OCC", token="alice")
+        self.controller.post(smiles="c1ccccc1", token="alice")
+        self.controller.post(smiles="CCN", active=False, token="alice")
+        self.controller.post(smiles="CCCl", token="bob")
+
+        self.unpatched_find = self.controller.collection.find
+        find = mock.patch.object(
+            self.controller.collection, "find", wraps=self.unpatched_find)
+        self.find = find.start()
+        self.addCleanup(find.stop)
+
+    def get_queries(self) -> int:
+        # other than the lookups made by find_one()
+        return sum(
+            call.args[0].get("active") is True for call in self.find.call_args_list)
+
+    def get_id(self, smiles: str, username: str = "alice") -> str:
+        return str(self.controller.collection.find_one(
+            {"user": username, "smiles": smiles})["_id"])
+
+    def test_get_banlist(self):
+        self.assertEqual(self.controller.get_banlist(token="alice"), ("CCO", "c1ccccc1"))
+        self.assertEqual(self.controller.get_banlist(token="bob"), ("CCCl",))
+        self.assertEqual(self.controller.get_banlist(token="carol"), ())
+
+        # cached per user
+        self.controller.get_banlist(token="alice")
+        self.assertEqual(self.get_queries(), 3)
+
+    def test_invalidated_on_changes(self):
+        self.controller.get_banlist(token="alice")
+
+        self.controller.activate(_id=self.get_id("CCN"), token="alice")
+        self.assertEqual(self.controller.get_banlist(token="alice"),
+                         ("CCN", "CCO", "c1ccccc1"))
+        self.controller.deactivate(_id=self.get_id("OCC"), token="alice")
+        self.assertEqual(self.controller.get_banlist(token="alice"), ("CCN", "c1ccccc1"))
+        self.controller.delete(_id=self.get_id("c1ccccc1"), token="alice")
+        self.assertEqual(self.controller.get_banlist(token="alice"), ("CCN",))
+        self.controller.post(smiles="NCC", token="alice")
+        self.assertEqual(self.controller.get_banlist(token="alice"), ("CCN",))
+        self.assertEqual(self.get_queries(), 5)
+
+        # other users are kept
+        self.controller.get_banlist(token="bob")
+        self.controller.post(smiles="CCBr", token="alice")
+        self.controller.get_banlist(token="bob")
+        self.assertEqual(self.get_queries(), 6)
+
+    def test_invalidation_racing_with_query(self):
+        def change_after_query(*args, **kwargs):
+            cursor = list(self.unpatched_find(*args, **kwargs))
+            # changed through this worker after the query, before the result is cached
+            self.controller.collection.update_many(
+                {"user": "alice"}, {"$set": {"active": False}})
+            self.controller.invalidate_banlist("alice")
+
+            return cursor
+
+        self.find.side_effect = change_after_query
+        self.assertEqual(self.controller.get_banlist(token="alice"), ("CCO", "c1ccccc1"))
+        self.find.side_effect = None
+
+        # the stale banlist is not served from the cache
+        self.assertEqual(self.controller.get_banlist(token="alice"), ())
+
+    def test_merge_banlist(self):
+        self.assertEqual(self.controller.merge_banlist(None, token="alice"),
+                         ["CCO", "c1ccccc1"])
+        self.assertEqual(
+            self.controller.merge_banlist(["C(C)O", "CCCl", "xyz "], token="alice"),
+            ["CCCl", "CCO", "c1ccccc1", "xyz"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
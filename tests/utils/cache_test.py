@@ -0,0 +1,401 @@
+import asyncio
+import mongomock
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from pydantic import BaseModel
+from pymongo import errors
+from unittest import mock
+from utils import cache
+from utils.cache import CacheController, LRUCache, MongoCache, SingleFlight
+
+
+class Clock:
+    """Settable replacement for time.monotonic()"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class LRUCacheTest(unittest.TestCase):
+    """Test class for the bounded in-process cache tier"""
+
+    def setUp(self) -> None:
+        self.clock = Clock()
+        patcher = mock.patch.object(cache.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lru_eviction(self):
+        lru = LRUCache(max_size=3)
+        for key in "abc":
+            lru.set(key, key.upper())
+        lru.get("a")                # now the most recently used
+        lru.set("d", "D")
+
+        self.assertEqual(len(lru), 3)
+        with self.assertRaises(KeyError):
+            lru.get("b")
+        self.assertEqual([lru.get(key) for key in "acd"], ["A", "C", "D"])
+
+        lru.set("c", "C2")          # overwrites count once
+        lru.set("e", "E")
+        with self.assertRaises(KeyError):
+            lru.get("a")
+        self.assertEqual([lru.get(key) for key in "cde"], ["C2", "D", "E"])
+
+    def test_ttl_expiry(self):
+        lru = LRUCache(max_size=10, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2, ttl=5)      # per-entry ttl takes precedence
+        self.clock.now += 30
+        self.assertEqual(lru.get("a"), 1)
+        with self.assertRaises(KeyError):
+            lru.get("b")
+
+        # expiry is set on write, not extended by reads
+        self.clock.now += 31
+        with self.assertRaises(KeyError):
+            lru.get("a")
+        self.assertEqual(len(lru), 0)
+
+    def test_no_ttl(self):
+        lru = LRUCache(max_size=10)
+        lru.set("a", 1)
+        self.clock.now += 10 ** 9
+        self.assertEqual(lru.get("a"), 1)
+
+    def test_clear(self):
+        lru = LRUCache(max_size=10)
+        lru.set("a", 1)
+        lru.clear()
+        with self.assertRaises(KeyError):
+            lru.get("a")
+
+
+class MongoCacheTest(unittest.TestCase):
+    """Test class for the shared cache tier in Mongo"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(cache, "MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # distinct "created" timestamps, for a deterministic eviction order
+        self.created = datetime(2024, 1, 1)
+        datetime_patcher = mock.patch.object(cache, "datetime", wraps=datetime)
+        mock_datetime = datetime_patcher.start()
+        self.addCleanup(datetime_patcher.stop)
+        mock_datetime.utcnow.side_effect = self.utcnow
+
+    def utcnow(self) -> datetime:
+        self.created += timedelta(seconds=1)
+        return self.created
+
+    def test_max_entries(self):
+        shared_cache = MongoCache(config={}, database="cache", max_entries=3)
+        for i in range(5):
+            shared_cache.set("retro", f"key{i}", f"value{i}")
+
+        self.assertEqual(shared_cache.db["retro"].count_documents({}), 3)
+        for i in range(2):
+            with self.assertRaises(KeyError):
+                shared_cache.get("retro", f"key{i}")
+        for i in range(2, 5):
+            self.assertEqual(shared_cache.get("retro", f"key{i}"), f"value{i}")
+
+        # bounded per module
+        shared_cache.set("forward", "key0", "value0")
+        self.assertEqual(shared_cache.get("forward", "key0"), "value0")
+        self.assertEqual(shared_cache.db["retro"].count_documents({}), 3)
+
+    def test_ttl_index(self):
+        shared_cache = MongoCache(config={}, database="cache", ttl=60)
+        shared_cache.set("retro", "key", "value")
+
+        indexes = shared_cache.db["retro"].index_information()
+        self.assertEqual(indexes["created_1"]["expireAfterSeconds"], 60)
+
+    def test_failed_writes_are_skipped(self):
+        shared_cache = MongoCache(config={}, database="cache", max_entries=3)
+        collection = shared_cache._get_collection("retro")
+        with mock.patch.object(
+            collection, "replace_one", side_effect=errors.WriteError("too large")
+        ), mock.patch.object(shared_cache, "_get_collection", return_value=collection):
+            shared_cache.set("retro", "key", "value")
+
+        with self.assertRaises(KeyError):
+            shared_cache.get("retro", "key")
+
+
+class SingleFlightTest(unittest.TestCase):
+    """Test class for the in-process request coalescing"""
+
+    def run_concurrently(self, target, num_threads: int = 8) -> None:
+        threads = [threading.Thread(target=target) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_calls_share_one_call(self):
+        single_flight = SingleFlight()
+        calls = []
+        results = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"result": len(calls)}
+
+        self.run_concurrently(lambda: results.append(single_flight.do("key", func)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], [{"result": 1}] * 8)
+        self.assertEqual(sum(is_leader for _, is_leader in results), 1)
+
+        # landed, so the next call is made again
+        self.assertEqual(single_flight.do("key", func), ({"result": 2}, True))
+        self.assertEqual(single_flight.do("other", func), ({"result": 3}, True))
+
+    def test_exception_fan_out(self):
+        single_flight = SingleFlight()
+        calls = []
+        raised = []
+
+        def func():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        def call():
+            try:
+                single_flight.do("key", func)
+            except ValueError as e:
+                raised.append(e)
+
+        self.run_concurrently(call)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(raised), 8)
+        self.assertEqual({id(e) for e in raised}, {id(raised[0])})
+        # not cached
+        self.assertEqual(single_flight.do("key", lambda: 1), (1, True))
+
+    def test_aborted_flight_is_retried(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        results = []
+
+        def abort():
+            started.set()
+            time.sleep(0.2)
+            raise KeyboardInterrupt
+
+        def lead():
+            try:
+                single_flight.do("key", abort)
+            except KeyboardInterrupt:
+                pass
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait()
+        # the follower makes the call itself, instead of raising the abort
+        results.append(single_flight.do("key", lambda: "retried"))
+        leader.join()
+
+        self.assertEqual(results, [("retried", True)])
+
+    def test_do_async(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "result"
+
+        async def main():
+            return await asyncio.gather(
+                *[single_flight.do_async("key", func) for _ in range(8)])
+
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], ["result"] * 8)
+        self.assertEqual(sum(is_leader for _, is_leader in results), 1)
+
+    def test_do_async_exception_fan_out(self):
+        single_flight = SingleFlight()
+
+        async def func():
+            await asyncio.sleep(0.1)
+            raise ValueError("failed")
+
+        async def main():
+            return await asyncio.gather(
+                *[single_flight.do_async("key", func) for _ in range(4)],
+                return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+
+class Input(BaseModel):
+    smiles: str
+    max_num_templates: int = 100
+
+
+class CacheControllerTest(unittest.TestCase):
+    """Test class for the cache controller over both tiers"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(cache, "MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hash_input(self):
+        self.assertEqual(
+            CacheController.hash_input(Input(smiles="CCO", max_num_templates=5)),
+            CacheController.hash_input(Input(max_num_templates=5, smiles="CCO"))
+        )
+        self.assertNotEqual(
+            CacheController.hash_input(Input(smiles="CCO")),
+            CacheController.hash_input(Input(smiles="CCN"))
+        )
+
+    def test_memory_engine(self):
+        controller = CacheController(util_config={"engine": "memory", "cache_size": 2})
+        with self.assertRaises(KeyError):
+            controller.get("retro", Input(smiles="CCO"))
+
+        response = {"results": [1, 2]}
+        controller.add("retro", Input(smiles="CCO"), response)
+        cached = controller.get("retro", Input(smiles="CCO"))
+        self.assertEqual(cached, response)
+        cached["results"].append(3)     # callers do not share the cached objects
+        self.assertEqual(controller.get("retro", Input(smiles="CCO")), response)
+
+        controller.add("retro", Input(smiles="CCN"), response)
+        controller.add("retro", Input(smiles="CCC"), response)
+        with self.assertRaises(KeyError):
+            controller.get("retro", Input(smiles="CCO"))
+
+    def test_shared_tier(self):
+        controller = CacheController(util_config={"engine": "db", "cache_size": 10})
+        controller.add("retro", Input(smiles="CCO"), {"a": 1})
+
+        # another worker sharing the Mongo cache
+        other = CacheController(util_config={"engine": "db", "cache_size": 10})
+        other.shared_cache = controller.shared_cache
+        self.assertEqual(other.get("retro", Input(smiles="CCO")), {"a": 1})
+
+        controller.clear("retro")
+        with self.assertRaises(KeyError):
+            controller.get("retro", Input(smiles="CCO"))
+
+    def test_get_or_compute(self):
+        controller = CacheController(util_config={"engine": "memory"})
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"results": ["CCO"]}
+
+        def call():
+            results.append(controller.get_or_compute("retro", Input(smiles="CCO"), compute))
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"results": ["CCO"]}] * 8)
+        self.assertEqual(
+            controller.get_or_compute("retro", Input(smiles="CCO"), compute),
+            {"results": ["CCO"]}
+        )
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_compute_without_single_flight(self):
+        controller = CacheController(
+            util_config={"engine": "memory", "single_flight": False})
+        compute = mock.Mock(return_value={"a": 1})
+
+        self.assertEqual(controller.get_or_compute("retro", Input(smiles="CCO"), compute),
+                         {"a": 1})
+        self.assertEqual(controller.get_or_compute("retro", Input(smiles="CCO"), compute),
+                         {"a": 1})
+        compute.assert_called_once()
+
+    def test_get_or_compute_errors_are_not_cached(self):
+        controller = CacheController(util_config={"engine": "memory"})
+        with self.assertRaises(ValueError):
+            controller.get_or_compute(
+                "retro", Input(smiles="CCO"), mock.Mock(side_effect=ValueError))
+
+        self.assertEqual(
+            controller.get_or_compute("retro", Input(smiles="CCO"), lambda: {"a": 1}),
+            {"a": 1}
+        )
+
+    def test_get_or_compute_async(self):
+        controller = CacheController(util_config={"engine": "memory"})
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return {"results": ["CCO"]}
+
+        async def main():
+            return await asyncio.gather(*[
+                controller.get_or_compute_async("retro", Input(smiles="CCO"), compute)
+                for _ in range(8)
+            ])
+
+        self.assertEqual(asyncio.run(main()), [{"results": ["CCO"]}] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_distributed_single_flight(self):
+        util_config = {"engine": "db", "distributed_single_flight": True}
+        controller = CacheController(util_config=util_config)
+        # another worker sharing the Mongo cache
+        other = CacheController(util_config=util_config)
+        other.shared_cache = controller.shared_cache
+        calls = []
+        computing = threading.Event()
+
+        def compute():
+            calls.append(1)
+            computing.set()
+            time.sleep(0.3)
+            return {"a": 1}
+
+        leader = threading.Thread(
+            target=controller.get_or_compute, args=("retro", Input(smiles="CCO"), compute))
+        with mock.patch.object(cache, "SINGLE_FLIGHT_POLL_INTERVAL", 0.01):
+            leader.start()
+            computing.wait()
+            self.assertEqual(
+                other.get_or_compute("retro", Input(smiles="CCO"), compute), {"a": 1})
+            leader.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(controller.shared_cache.is_locked(
+            "retro", CacheController.hash_input(Input(smiles="CCO"))))
+
+
+if __name__ == "__main__":
+    unittest.main()
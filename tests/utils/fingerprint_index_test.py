@@ -0,0 +1,114 @@
+import numpy as np
+import tempfile
+import unittest
+from unittest import mock
+from utils import fingerprint_index
+from utils.fingerprint_index import PackedFingerprintIndex, pack_bits, popcount
+
+
+class PackedFingerprintIndexTest(unittest.TestCase):
+    """Test class for the packed fingerprint index behind method="fast" """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """This method is run once before all tests in this class."""
+        rng = np.random.default_rng(0)
+        cls.docs = []
+        for i in range(500):
+            num_bits = int(rng.integers(1, 60))
+            bits = sorted(set(rng.integers(0, 2048, size=num_bits).tolist()))
+            cls.docs.append({
+                "_id": f"id{i}",
+                "product_smiles": f"smiles{i}",
+                "mfp_bits": bits
+            })
+        # near duplicates of the queries, for high similarities
+        cls.queries = [cls.docs[i]["mfp_bits"] for i in [0, 7, 42]]
+        for i, bits in enumerate(cls.queries):
+            cls.docs.append({
+                "_id": f"near{i}",
+                "product_smiles": f"near_smiles{i}",
+                "mfp_bits": bits[:-1] + [2047]
+            })
+        cls.queries.append([3, 500, 1000, 1500, 2000])
+        cls.smiles = {doc["_id"]: doc["product_smiles"] for doc in cls.docs}
+
+    def brute_force(self, query_bits: list[int], threshold: float) -> dict[str, float]:
+        query = set(query_bits)
+        results = {}
+        for doc in self.docs:
+            bits = set(doc["mfp_bits"])
+            tanimoto = len(query & bits) / len(query | bits)
+            if tanimoto >= threshold:
+                results[doc["_id"]] = tanimoto
+
+        return results
+
+    def assert_search_matches(self, index: PackedFingerprintIndex) -> None:
+        for query_bits in self.queries:
+            for threshold in [0.0, 0.05, 0.1, 0.3, 0.6, 0.9, 1.0]:
+                expected = self.brute_force(query_bits, threshold)
+                results = index.search(query_bits=query_bits, threshold=threshold)
+
+                self.assertEqual(
+                    {r["_id"]: r["tanimoto"] for r in results}.keys(),
+                    expected.keys(),
+                    f"threshold {threshold}"
+                )
+                for r in results:
+                    self.assertAlmostEqual(r["tanimoto"], expected[r["_id"]])
+                    self.assertEqual(r["product_smiles"], self.smiles[r["_id"]])
+                scores = [r["tanimoto"] for r in results]
+                self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_pack_bits(self):
+        packed = pack_bits([[0, 63, 64, 2047], []])
+        self.assertEqual(packed.shape, (2, 32))
+        self.assertEqual(packed.dtype, np.dtype("<u8"))
+        self.assertEqual(int(packed[0, 0]), 1 | 1 << 63)
+        self.assertEqual(int(packed[0, 1]), 1)
+        self.assertEqual(int(packed[0, 31]), 1 << 63)
+        self.assertEqual(popcount(packed).tolist(), [4, 0])
+
+    def test_search_against_brute_force(self):
+        index = PackedFingerprintIndex.build(self.docs)
+        self.assertEqual(len(index), len(self.docs))
+        self.assert_search_matches(index)
+
+    def test_search_in_chunks(self):
+        with mock.patch.object(fingerprint_index, "BUILD_CHUNK_SIZE", 7), \
+                mock.patch.object(fingerprint_index, "SEARCH_CHUNK_SIZE", 13):
+            index = PackedFingerprintIndex.build(self.docs)
+            self.assert_search_matches(index)
+
+    def test_top_k(self):
+        index = PackedFingerprintIndex.build(self.docs)
+        for query_bits in self.queries:
+            expected = sorted(self.brute_force(query_bits, 0.05).values(), reverse=True)
+            for top_k in [1, 3, 10, len(expected) + 5]:
+                results = index.search(query_bits=query_bits, threshold=0.05, top_k=top_k)
+                self.assertEqual(len(results), min(top_k, len(expected)))
+                for r, tanimoto in zip(results, expected):
+                    self.assertAlmostEqual(r["tanimoto"], tanimoto)
+
+    def test_empty(self):
+        index = PackedFingerprintIndex.build([])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search(query_bits=[1, 2], threshold=0.3), [])
+
+        index = PackedFingerprintIndex.build(self.docs)
+        self.assertEqual(index.search(query_bits=[], threshold=0.3), [])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/USPTO_FULL"
+            PackedFingerprintIndex.build(self.docs).save(path, meta={"version": 3})
+
+            self.assertEqual(PackedFingerprintIndex.load_meta(path), {"version": 3})
+            index = PackedFingerprintIndex.load(path)
+            self.assertIsInstance(index.fps, np.memmap)
+            self.assert_search_matches(index)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+import mongomock
+import os
+import pandas as pd
+import tempfile
+import threading
+import time
+import unittest
+from bson import Binary
+from rdkit import Chem
+from unittest import mock
+from utils import pricer
+from utils.pricer import FilePricer, Pricer
+
+
+class FilePricerTest(unittest.TestCase):
+    """Test class for the hash-indexed lookups of FilePricer"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        """This method is run once before all tests in this class."""
+        cls.records = [
+            {"smiles": "CCO", "source": "a", "ppg": 3.0},
+            {"smiles": "CCO", "source": "a", "ppg": 1.0},
+            {"smiles": "CCO", "source": "b", "ppg": 2.0},
+            {"smiles": "CCO", "source": "", "ppg": 5.0},
+            {"smiles": "CCN", "source": "b", "ppg": 4.0},
+            {"smiles": "CCN", "source": "b", "ppg": 4.0},
+            {"smiles": "c1ccccc1", "source": "c", "ppg": 0.5}
+        ]
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp_dir.name, "buyables.json.gz")
+        pd.DataFrame(cls.records).to_json(cls.path, orient="records", compression="gzip")
+        cls.pricer = FilePricer(path=cls.path)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.tmp_dir.cleanup()
+
+    def brute_force(self, smiles: str, source) -> dict | None:
+        """The lowest price row, as looked up before the index"""
+        data = self.pricer.data
+        query = data["smiles"] == smiles
+        if isinstance(source, list):
+            query = query & data["source"].isin(source)
+        elif source is not None:
+            query = query & (data["source"] == source)
+        rows = data[query]
+        if rows.empty:
+            return None
+
+        return rows.loc[rows["ppg"].idxmin()].to_dict()
+
+    def test_build_index(self):
+        index = FilePricer.build_index(pd.DataFrame(self.records))
+
+        self.assertEqual(set(index), {"CCO", "CCN", "c1ccccc1"})
+        self.assertEqual(set(index["CCO"]), {"a", "b", ""})
+        # only the cheapest row per smiles and source
+        self.assertEqual(index["CCO"]["a"]["ppg"], 1.0)
+        self.assertEqual(index["CCN"]["b"], {"smiles": "CCN", "source": "b", "ppg": 4.0})
+
+    def test_lookup_smiles_against_brute_force(self):
+        for smiles in ["CCO", "CCN", "c1ccccc1", "CCCC"]:
+            for source in [None, "a", "b", "", "x", ["a", "b"], ["b", "c"], ["x"]]:
+                expected = self.brute_force(smiles, source)
+                result = self.pricer.lookup_smiles(smiles=smiles, source=source)
+                if expected is None:
+                    self.assertIsNone(result, (smiles, source))
+                else:
+                    self.assertEqual(result["ppg"], expected["ppg"], (smiles, source))
+                    self.assertEqual(result["smiles"], smiles)
+                    if source is not None:
+                        self.assertIn(result["source"], source)
+
+        self.assertIsNone(self.pricer.lookup_smiles(smiles="CCO", source=[]))
+
+    def test_lookup_smiles_returns_copies(self):
+        result = self.pricer.lookup_smiles(smiles="CCO")
+        result["ppg"] = 100.0
+        self.assertEqual(self.pricer.lookup_smiles(smiles="CCO")["ppg"], 1.0)
+
+    def test_lookup_smiles_list(self):
+        result = self.pricer.lookup_smiles_list(
+            smiles_list=["CCO", "CCCC", "c1ccccc1"], source=["b", "c"])
+        self.assertEqual(set(result), {"CCO", "c1ccccc1"})
+        self.assertEqual(result["CCO"], {"smiles": "CCO", "source": "b", "ppg": 2.0})
+
+        for smiles in ["CCO", "CCN", "CCCC"]:
+            single = self.pricer.lookup_smiles(smiles=smiles)
+            listed = self.pricer.lookup_smiles_list(smiles_list=[smiles]).get(smiles)
+            self.assertEqual(single is None, listed is None)
+            if single is not None:
+                self.assertEqual(single["ppg"], listed["ppg"])
+
+        self.assertEqual(self.pricer.lookup_smiles_list(["CCO"], source=[]), {})
+
+    def test_missing_file(self):
+        pricer = FilePricer(path=os.path.join(self.tmp_dir.name, "missing.json.gz"))
+        self.assertIsNone(pricer.lookup_smiles(smiles="CCO"))
+
+
+class MongoPricerSmartsTest(unittest.TestCase):
+    """Test class for the SMARTS lookups of MongoPricer, over Mongo or a snapshot"""
+
+    smiles = [
+        "c1ccccc1O", "CCO", "c1ccccc1N", "CC(=O)O", "c1ccncc1", "OCCO",
+        "c1ccccc1C(=O)O", "CCCCCCO", "C[C@H](N)C(=O)O", "ClC(Cl)Cl", "not_a_smiles"
+    ]
+    patterns = ["[OX2H]", "c1ccccc1", "C(=O)[OH]", "[NX3H2]", "Cl", "[Si]"]
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(pricer, "MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+        self.pricer = Pricer(util_config={
+            "engine": "db",
+            "database": "askcos",
+            "collection": "buyables",
+            "snapshot_dir": self.tmp_dir.name,
+            "num_workers": 1
+        })
+        self.addCleanup(self.pricer.shutdown)
+        self.mongo_pricer = self.pricer._pricer
+        # mongomock does not support the capped collection
+        self.mongo_pricer._smarts_cache_collection = self.mongo_pricer.db["smarts_cache"]
+
+        self.add_buyables(self.smiles)
+
+    def add_buyables(self, smiles_list: list[str]) -> None:
+        collection = self.mongo_pricer.collection
+        ids = collection.insert_many(
+            [{"smiles": smi, "source": "a", "ppg": 1.0} for smi in smiles_list]
+        ).inserted_ids
+        # as by scripts/precompute_buyables.py
+        for _id, mol, mfp, pfp in pricer._compute_buyables_fps(zip(ids, smiles_list)):
+            collection.update_one({"_id": _id}, {"$set": {
+                "mol": Binary(mol) if mol is not None else None,
+                "mfp": {"bits": mfp, "count": len(mfp)},
+                "pfp": {"bits": pfp, "count": len(pfp)}
+            }})
+        self.mongo_pricer.bump_version()
+
+    def brute_force(self, smarts: str) -> set[str]:
+        pattern = Chem.MolFromSmarts(smarts)
+        matches = set()
+        for doc in self.mongo_pricer.collection.find():
+            mol = Chem.MolFromSmiles(doc["smiles"])
+            if mol is not None and mol.HasSubstructMatch(pattern, useChirality=True):
+                matches.add(doc["smiles"])
+
+        return matches
+
+    def lookup(self, smarts: str) -> set[str]:
+        return {r["smiles"] for r in self.pricer.lookup_smarts(smarts=smarts)}
+
+    def test_search_in_mongo(self):
+        for smarts in self.patterns:
+            self.assertEqual(
+                set(self.mongo_pricer._search_smarts_in_mongo(smarts)),
+                self.brute_force(smarts),
+                smarts
+            )
+
+    def test_search_in_snapshot(self):
+        with mock.patch.object(pricer, "BUILD_CHUNK_SIZE", 3):
+            self.mongo_pricer.save_snapshot()
+        version = self.mongo_pricer.get_version()
+        snapshot = self.mongo_pricer.load_snapshot(version)
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(len(snapshot), len(self.smiles) - 1)
+
+        for smarts in self.patterns:
+            pattern = Chem.MolFromSmarts(smarts)
+            query_bits = list(Chem.rdmolops.PatternFingerprint(pattern).GetOnBits())
+            screened = {snapshot.get_smiles(i) for i in snapshot.screen(query_bits)}
+            expected = self.brute_force(smarts)
+            # the screen only ever drops non-matches
+            self.assertLessEqual(expected, screened, smarts)
+            self.assertEqual(
+                set(self.mongo_pricer._search_smarts(smarts, version)), expected, smarts)
+
+    def test_search_on_process_pool(self):
+        self.mongo_pricer.save_snapshot()
+        self.mongo_pricer.num_workers = 2
+        with mock.patch.object(pricer, "MIN_CANDIDATES_FOR_POOL", 1):
+            for smarts in self.patterns:
+                self.assertEqual(self.lookup(smarts), self.brute_force(smarts), smarts)
+
+    def test_lookup_smarts(self):
+        for smarts in self.patterns:
+            self.assertEqual(self.lookup(smarts), self.brute_force(smarts), smarts)
+            # cached
+            with mock.patch.object(self.mongo_pricer, "_search_smarts") as search:
+                self.assertEqual(self.lookup(smarts), self.brute_force(smarts))
+            search.assert_not_called()
+
+        results = self.pricer.lookup_smarts(smarts="[OX2H]", limit=2)
+        self.assertEqual(len(results), 2)
+
+    def test_stale_snapshot_rebuilt_in_background(self):
+        self.mongo_pricer.save_snapshot()
+        self.assertEqual(self.lookup("[NX3H2]"), self.brute_force("[NX3H2]"))
+
+        self.add_buyables(["NCCN"])
+        # served from Mongo while the snapshot is being rebuilt
+        self.assertEqual(self.lookup("[NX3H2]"), self.brute_force("[NX3H2]"))
+        self.assertIn("NCCN", self.lookup("[NX3H2]"))
+        self.mongo_pricer._snapshot_thread.join(timeout=30)
+
+        snapshot = self.mongo_pricer.load_snapshot(self.mongo_pricer.get_version())
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(len(snapshot), len(self.smiles))
+        self.assertIn("NCCN", self.lookup("CN"))
+
+    def test_concurrent_lookups_share_one_search(self):
+        self.mongo_pricer.save_snapshot()
+        search = self.mongo_pricer._search_smarts
+        calls = []
+
+        def slow_search(smarts: str, version: str) -> list[str]:
+            calls.append(smarts)
+            time.sleep(0.2)
+            return search(smarts, version)
+
+        results = []
+        with mock.patch.object(self.mongo_pricer, "_search_smarts", slow_search):
+            threads = [
+                threading.Thread(target=lambda: results.append(self.lookup("[OX2H]")))
+                for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, ["[OX2H]"])
+        self.assertEqual(results, [self.brute_force("[OX2H]")] * 8)
+
+    def test_add_many_bumps_version_once(self):
+        with mock.patch.object(
+            self.mongo_pricer, "bump_version", wraps=self.mongo_pricer.bump_version
+        ) as bump_version:
+            result = self.pricer.add_many([
+                {"smiles": "OCC", "source": "b", "ppg": 1.0},
+                {"smiles": "CCN", "source": "b", "ppg": 2.0},
+                {"smiles": "CCN", "source": "b", "ppg": 3.0}
+            ])
+        self.assertEqual(result["inserted_count"], 2)
+        self.assertEqual(result["updated_count"], 1)
+        bump_version.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
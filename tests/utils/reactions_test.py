@@ -0,0 +1,89 @@
+import mongomock
+import tempfile
+import unittest
+from unittest import mock
+from utils import reactions
+from utils.reactions import Reactions
+
+
+class ReactionsFingerprintIndexTest(unittest.TestCase):
+    """Test class for the fingerprint indexes of the Reactions util"""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        with mock.patch.object(reactions, "MongoClient", mongomock.MongoClient):
+            self.reactions = Reactions(util_config={"fp_index_dir": self.tmp_dir.name})
+        self.reactions.mol_collection.insert_many([
+            {"_id": 1, "product_smiles": "CCO", "mfp_bits": [1, 2, 3],
+             "template_set": "a"},
+            {"_id": 2, "product_smiles": "CCN", "mfp_bits": [1, 2, 4],
+             "template_set": "a"},
+            {"_id": 3, "product_smiles": "CCC", "mfp_bits": [1, 2, 3],
+             "template_set": "b"}
+        ])
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def bump_version(self, template_set: str) -> None:
+        # as done by scripts/pre_compute.py
+        self.reactions.version_collection.update_one(
+            {"_id": template_set}, {"$inc": {"version": 1}}, upsert=True)
+
+    def test_load_per_template_set(self):
+        index = self.reactions.load_fp_index("a")
+        self.assertEqual(len(index), 2)
+        self.assertIs(self.reactions.load_fp_index("a"), index)
+        self.assertEqual(len(self.reactions.load_fp_index("b")), 1)
+
+        # loaded from the saved sidecar files by other processes
+        with mock.patch.object(reactions, "MongoClient", mongomock.MongoClient):
+            other = Reactions(util_config={"fp_index_dir": self.tmp_dir.name})
+        other.mol_collection = self.reactions.mol_collection
+        other.version_collection = self.reactions.version_collection
+        with mock.patch.object(reactions.PackedFingerprintIndex, "build") as build:
+            self.assertEqual(len(other.load_fp_index("a")), 2)
+        build.assert_not_called()
+
+    def test_reload_on_version_bump(self):
+        index = self.reactions.load_fp_index("a")
+        # same count, changed content
+        self.reactions.mol_collection.update_one(
+            {"_id": 2}, {"$set": {"mfp_bits": [1, 2, 3]}})
+        self.bump_version("a")
+
+        # trusted until the version is rechecked
+        self.assertIs(self.reactions.load_fp_index("a"), index)
+        with mock.patch.object(reactions, "FP_INDEX_CHECK_INTERVAL", 0):
+            reloaded = self.reactions.load_fp_index("a")
+            self.assertIsNot(reloaded, index)
+            results = reloaded.search(query_bits=[1, 2, 3], threshold=1.0)
+            self.assertEqual(sorted(r["_id"] for r in results), ["1", "2"])
+
+            # unchanged version, kept without a rebuild
+            self.assertIs(self.reactions.load_fp_index("a"), reloaded)
+
+    def test_lookup_similar_smiles_fast(self):
+        self.reactions.mol_collection.delete_many({})
+        smiles = ["CCO", "CCCO", "c1ccccc1O", "CC(=O)O", "CCN"]
+        for i, smi in enumerate(smiles):
+            bits = list(reactions.AllChem.GetMorganFingerprintAsBitVect(
+                reactions.Chem.MolFromSmiles(smi),
+                reactions.DEFAULT_MORGAN_RADIUS,
+                nBits=reactions.DEFAULT_MORGAN_LEN
+            ).GetOnBits())
+            self.reactions.mol_collection.insert_one({
+                "_id": i, "product_smiles": smi, "mfp_bits": bits, "template_set": "a"})
+
+        results = self.reactions.lookup_similar_smiles(
+            smiles="CCO", sim_threshold=0.3, reaction_set="a", method="fast")
+        self.assertEqual(results[0], {"smiles": "CCO", "tanimoto": 1.0, "id": "0"})
+        self.assertNotIn("c1ccccc1O", [r["smiles"] for r in results])
+
+        results = self.reactions.lookup_similar_smiles(
+            smiles="CCO", sim_threshold=0.0, reaction_set="a", method="fast", top_k=2)
+        self.assertEqual(len(results), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
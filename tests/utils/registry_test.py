@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from utils.registry import LazyUtil
+
+
+class Query(BaseModel):
+    smiles: str
+    limit: int = 10
+
+
+class DummyUtil:
+    """Util class with the usual endpoint signatures, counting its initializations"""
+    name = "dummy"
+    prefixes = ["dummy"]
+    methods_to_bind: dict[str, list[str]] = {
+        "lookup": ["GET"],
+        "lookup_async": ["GET"],
+        "search": ["POST"]
+    }
+    init_count = 0
+
+    def __init__(self, util_config: dict):
+        time.sleep(0.1)
+        type(self).init_count += 1
+        self.source = util_config["source"]
+
+    def lookup(self, smiles: str, limit: int = 10) -> dict:
+        return {"smiles": smiles, "limit": limit, "source": self.source}
+
+    async def lookup_async(self, smiles: str) -> dict:
+        return {"smiles": smiles, "source": self.source}
+
+    def search(self, query: Query) -> dict:
+        return {"smiles": query.smiles, "limit": query.limit, "source": self.source}
+
+    @staticmethod
+    def canonicalize(smiles: str) -> str:
+        return smiles.strip()
+
+    @classmethod
+    def get_name(cls) -> str:
+        return cls.name
+
+
+class LazyUtilTest(unittest.TestCase):
+    """Test class for the placeholders of lazily initialized utils"""
+
+    def setUp(self) -> None:
+        DummyUtil.init_count = 0
+        self.util = LazyUtil(DummyUtil, {"source": "a"})
+
+    def get_client(self) -> TestClient:
+        app = FastAPI()
+        # as bound in app.py
+        for method_name, bind_types in self.util.methods_to_bind.items():
+            app.add_api_route(
+                path=f"/api/dummy/{method_name}",
+                endpoint=getattr(self.util, method_name),
+                methods=bind_types
+            )
+
+        return TestClient(app)
+
+    def test_class_attributes_without_init(self):
+        self.assertEqual(self.util.name, "dummy")
+        self.assertEqual(self.util.prefixes, ["dummy"])
+        self.assertEqual(self.util.canonicalize(" CCO "), "CCO")
+        self.assertEqual(self.util.get_name(), "dummy")
+        self.assertFalse(self.util.initialized)
+
+    def test_fastapi_endpoints(self):
+        client = self.get_client()
+        self.assertFalse(self.util.initialized)
+
+        # no "self" among the parameters
+        schema = client.get("/openapi.json").json()
+        parameters = schema["paths"]["/api/dummy/lookup"]["get"]["parameters"]
+        self.assertEqual([p["name"] for p in parameters], ["smiles", "limit"])
+        self.assertFalse(self.util.initialized)
+
+        response = client.get("/api/dummy/lookup", params={"smiles": "CCO", "limit": 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"smiles": "CCO", "limit": 5, "source": "a"})
+        self.assertTrue(self.util.initialized)
+
+        response = client.get("/api/dummy/lookup_async", params={"smiles": "CCN"})
+        self.assertEqual(response.json(), {"smiles": "CCN", "source": "a"})
+        response = client.post("/api/dummy/search", json={"smiles": "CCC"})
+        self.assertEqual(response.json(), {"smiles": "CCC", "limit": 10, "source": "a"})
+
+        response = client.get("/api/dummy/lookup")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(DummyUtil.init_count, 1)
+
+    def test_after_init(self):
+        util = self.util.get()
+        self.assertIsInstance(util, DummyUtil)
+        self.assertIs(self.util.get(), util)
+        # instance attributes and bound methods of the util
+        self.assertEqual(self.util.source, "a")
+        self.assertIs(self.util.lookup.__self__, util)
+
+    def test_concurrent_init(self):
+        utils = []
+        threads = [
+            threading.Thread(target=lambda: utils.append(self.util.get()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(DummyUtil.init_count, 1)
+        self.assertEqual(len({id(util) for util in utils}), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
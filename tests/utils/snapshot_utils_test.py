@@ -0,0 +1,149 @@
+import numpy as np
+import os
+import tempfile
+import threading
+import time
+import unittest
+from utils.snapshot_utils import (
+    get_string_from_blob,
+    load_arrays,
+    load_meta,
+    resolve_path,
+    save_arrays,
+    search_sorted_blob,
+    snapshot_lock,
+    strings_to_blob
+)
+
+
+class SnapshotUtilsTest(unittest.TestCase):
+    """Test class for the memory-mapped snapshot helpers"""
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "historian")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def get_versions(self) -> list[str]:
+        return sorted(
+            entry for entry in os.listdir(self.tmp_dir.name)
+            if entry.startswith(".historian.snapshot-") and not entry.endswith(".link")
+        )
+
+    def save(self, value: int) -> None:
+        save_arrays(
+            path=self.path,
+            arrays={"values": np.full(4, value, dtype=np.int64)},
+            meta={"version": value}
+        )
+
+    def test_strings_blob(self):
+        strings = ["", "CCO", "c1ccccc1", "[NH4+]", "ClC(Cl)Cl"]
+        blob, offsets = strings_to_blob(strings)
+        self.assertEqual(
+            [get_string_from_blob(blob, offsets, i) for i in range(len(strings))],
+            strings
+        )
+
+        blob, offsets = strings_to_blob(sorted(strings))
+        for i, s in enumerate(sorted(strings)):
+            self.assertEqual(search_sorted_blob(blob, offsets, s), i)
+        self.assertIsNone(search_sorted_blob(blob, offsets, "CCN"))
+        self.assertIsNone(search_sorted_blob(*strings_to_blob([]), "CCO"))
+
+    def test_load_before_save(self):
+        self.assertIsNone(load_meta(resolve_path(self.path)))
+
+    def test_save_swaps_symlink(self):
+        self.save(1)
+        self.assertTrue(os.path.islink(self.path))
+        first = resolve_path(self.path)
+        self.assertEqual(load_meta(first), {"version": 1})
+        values = load_arrays(first, names=["values"])["values"]
+        self.assertIsInstance(values, np.memmap)
+
+        self.save(2)
+        second = resolve_path(self.path)
+        self.assertNotEqual(first, second)
+        self.assertEqual(load_meta(second), {"version": 2})
+        self.assertEqual(load_arrays(self.path, names=["values"])["values"].tolist(),
+                         [2] * 4)
+        # the previous version is kept for readers that resolved it before
+        self.assertTrue(os.path.isdir(first))
+        self.assertEqual(load_meta(first), {"version": 1})
+        self.assertEqual(len(self.get_versions()), 2)
+
+        self.save(3)
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(len(self.get_versions()), 2)
+        # memory maps of removed versions stay valid
+        self.assertEqual(values.tolist(), [1] * 4)
+
+    def test_save_replaces_plain_directory(self):
+        # saved before snapshots were versioned
+        os.makedirs(self.path)
+        np.save(os.path.join(self.path, "values.npy"), np.zeros(4, dtype=np.int64))
+
+        self.save(1)
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(load_meta(resolve_path(self.path)), {"version": 1})
+
+    def test_snapshot_lock_is_exclusive(self):
+        events = []
+        locked = threading.Event()
+
+        def hold():
+            with snapshot_lock(self.path):
+                locked.set()
+                time.sleep(0.2)
+                events.append("first released")
+
+        def wait():
+            locked.wait()
+            with snapshot_lock(self.path):
+                events.append("second acquired")
+
+        threads = [threading.Thread(target=hold), threading.Thread(target=wait)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(events, ["first released", "second acquired"])
+        self.assertTrue(os.path.isfile(f"{self.path}.lock"))
+
+    def test_concurrent_saves_and_loads(self):
+        errors = []
+
+        def write(offset: int):
+            for i in range(10):
+                with snapshot_lock(self.path):
+                    self.save(offset + i)
+
+        def read():
+            for _ in range(50):
+                with snapshot_lock(self.path):
+                    path = resolve_path(self.path)
+                    meta = load_meta(path)
+                    if meta is None:
+                        continue
+                    values = load_arrays(path, names=["values"])["values"]
+                # the meta and the arrays are read from the same version
+                if values.tolist() != [meta["version"]] * 4:
+                    errors.append((meta, values.tolist()))
+
+        threads = [threading.Thread(target=write, args=(i * 100,)) for i in range(3)]
+        threads += [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.get_versions()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import mongomock
+import unittest
+from datetime import timedelta
+from fastapi import HTTPException
+from unittest import mock
+from utils import cache, user
+from utils.oauth2 import create_access_token
+from utils.user import UserController
+
+
+class Clock:
+    """Settable replacement for time.monotonic()"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class UserControllerTokenCacheTest(unittest.TestCase):
+    """Test class for the cached token resolutions of UserController"""
+
+    def setUp(self) -> None:
+        patcher = mock.patch.object(user, "MongoClient", mongomock.MongoClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock = Clock()
+        clock_patcher = mock.patch.object(cache.time, "monotonic", self.clock)
+        clock_patcher.start()
+        self.addCleanup(clock_patcher.stop)
+
+        self.controller = UserController(util_config={
+            "engine": "db",
+            "database": "askcos",
+            "collection": "users",
+            "token_cache_ttl": 60
+        })
+        self.controller.register(username="alice", password="password", email="a@a")
+        self.controller.register(username="bob", password="password")
+        self.token = create_access_token(
+            data={"sub": "alice"}, expires_delta=timedelta(hours=1))
+        self.admin_token = create_access_token(
+            data={"sub": "askcos_admin"}, expires_delta=timedelta(hours=1))
+
+        get_user_by_name = mock.patch.object(
+            self.controller, "get_user_by_name", wraps=self.controller.get_user_by_name)
+        self.get_user_by_name = get_user_by_name.start()
+        self.addCleanup(get_user_by_name.stop)
+
+    def get_resolutions(self, username: str = "alice") -> int:
+        return sum(
+            call.kwargs.get("username") == username
+            for call in self.get_user_by_name.call_args_list
+        )
+
+    def test_cache_hit(self):
+        first = self.controller.get_current_user(token=self.token)
+        second = self.controller.get_current_user(token=self.token)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first.email, "a@a")
+        self.assertEqual(self.get_resolutions(), 1)
+        # callers do not share the cached objects
+        first.email = "changed"
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "a@a")
+
+    def test_invalid_tokens(self):
+        for token in ["", "not_a_token"]:
+            with self.assertRaises(HTTPException) as context:
+                self.controller.get_current_user(token=token)
+            self.assertEqual(context.exception.status_code, 401)
+
+        token = create_access_token(data={"sub": "nobody"})
+        for _ in range(2):
+            with self.assertRaises(HTTPException):
+                self.controller.get_current_user(token=token)
+        # not cached
+        self.assertEqual(self.get_resolutions("nobody"), 2)
+
+    def test_invalidated_on_update(self):
+        self.controller.get_current_user(token=self.token)
+        self.controller.update(username="alice", email="b@b", token=self.token)
+
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "b@b")
+        self.assertEqual(self.get_resolutions(), 2)
+
+        # other users are kept
+        bob_token = create_access_token(data={"sub": "bob"})
+        self.controller.get_current_user(token=bob_token)
+        self.controller.update(username="alice", email="c@c", token=self.token)
+        self.controller.get_current_user(token=bob_token)
+        self.assertEqual(self.get_resolutions("bob"), 1)
+
+    def test_invalidation_racing_with_resolution(self):
+        def update_after_read(username: str):
+            result = UserController.get_user_by_name(self.controller, username=username)
+            # updated through this worker after the read, before the result is cached
+            self.controller.collection.update_one(
+                {"username": username}, {"$set": {"email": "b@b"}})
+            self.controller.invalidate_user(username)
+
+            return result
+
+        self.get_user_by_name.side_effect = update_after_read
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "a@a")
+        self.get_user_by_name.side_effect = None
+
+        # the stale resolution is not served from the cache
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "b@b")
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "b@b")
+        self.assertEqual(self.get_resolutions(), 2)
+
+    def test_invalidation_before_resolution(self):
+        self.controller.invalidate_user("alice")
+        self.controller.get_current_user(token=self.token)
+        self.controller.get_current_user(token=self.token)
+
+        self.assertEqual(self.get_resolutions(), 1)
+
+    def test_ttl_expiry(self):
+        self.controller.get_current_user(token=self.token)
+        # changed through another worker
+        self.controller.collection.update_one(
+            {"username": "alice"}, {"$set": {"email": "b@b"}})
+
+        self.clock.now += 30
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "a@a")
+        self.clock.now += 31
+        self.assertEqual(self.controller.get_current_user(token=self.token).email, "b@b")
+        self.assertEqual(self.get_resolutions(), 2)
+
+    def test_cached_until_token_expiry(self):
+        token = create_access_token(
+            data={"sub": "alice"}, expires_delta=timedelta(seconds=20))
+        self.controller.get_current_user(token=token)
+
+        self.clock.now += 10
+        self.controller.get_current_user(token=token)
+        self.assertEqual(self.get_resolutions(), 1)
+        self.clock.now += 11
+        self.controller.get_current_user(token=token)
+        self.assertEqual(self.get_resolutions(), 2)
+
+    def test_disabled_user(self):
+        self.controller.get_current_user(token=self.token)
+        self.controller.disable(username="alice", token=self.admin_token)
+
+        with self.assertRaises(HTTPException) as context:
+            self.controller.get_current_user(token=self.token)
+        self.assertEqual(context.exception.status_code, 400)
+
+        self.controller.enable(username="alice", token=self.admin_token)
+        self.assertFalse(self.controller.get_current_user(token=self.token).disabled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import threading
+import time
+import unittest
+from concurrent.futures import wait
+from wrappers.base import MicroBatcher
+
+
+class MicroBatcherTest(unittest.TestCase):
+    """Test class for the micro-batching of single-item wrapper calls"""
+
+    def setUp(self) -> None:
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def batch_fn(self, items: list) -> list:
+        with self.lock:
+            self.batches.append(list(items))
+
+        return [f"result_{item}" for item in items]
+
+    def test_batch_within_max_wait(self):
+        batcher = MicroBatcher(
+            batch_fn=self.batch_fn, max_batch_size=100, max_wait=0.2, max_in_flight=1)
+        futures = [batcher.submit(i) for i in range(5)]
+
+        self.assertEqual([f.result(timeout=5) for f in futures],
+                         [f"result_{i}" for i in range(5)])
+        self.assertEqual(self.batches, [[0, 1, 2, 3, 4]])
+
+        # submitted after the flush, so in a new batch
+        self.assertEqual(batcher.submit(5).result(timeout=5), "result_5")
+        self.assertEqual(self.batches, [[0, 1, 2, 3, 4], [5]])
+
+    def test_flush_at_max_batch_size(self):
+        batcher = MicroBatcher(
+            batch_fn=self.batch_fn, max_batch_size=3, max_wait=10, max_in_flight=2)
+        start = time.monotonic()
+        futures = [batcher.submit(i) for i in range(6)]
+
+        self.assertEqual([f.result(timeout=5) for f in futures],
+                         [f"result_{i}" for i in range(6)])
+        # cut by size, without waiting for max_wait
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(sorted(self.batches), [[0, 1, 2], [3, 4, 5]])
+
+    def test_identical_items_sent_once(self):
+        batcher = MicroBatcher(
+            batch_fn=self.batch_fn, max_batch_size=100, max_wait=0.2, max_in_flight=1)
+        futures = [batcher.submit(item) for item in ["CCO", "CCN", "CCO", "CCO"]]
+
+        self.assertEqual([f.result(timeout=5) for f in futures],
+                         ["result_CCO", "result_CCN", "result_CCO", "result_CCO"])
+        self.assertEqual(self.batches, [["CCO", "CCN"]])
+
+    def test_error_fan_out(self):
+        def batch_fn(items: list) -> list:
+            raise RuntimeError("backend unavailable")
+
+        batcher = MicroBatcher(
+            batch_fn=batch_fn, max_batch_size=100, max_wait=0.2, max_in_flight=1)
+        futures = [batcher.submit(i) for i in range(4)]
+        wait(futures, timeout=5)
+
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "backend unavailable"):
+                future.result()
+
+        # the dispatcher survives failed batches
+        batcher.batch_fn = self.batch_fn
+        self.assertEqual(batcher.submit(1).result(timeout=5), "result_1")
+
+    def test_wrong_number_of_results(self):
+        batcher = MicroBatcher(
+            batch_fn=lambda items: items[:-1],
+            max_batch_size=100,
+            max_wait=0.2,
+            max_in_flight=1
+        )
+        futures = [batcher.submit(i) for i in range(3)]
+        wait(futures, timeout=5)
+
+        for future in futures:
+            with self.assertRaisesRegex(ValueError, "Expected 3 results"):
+                future.result()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -102,6 +102,7 @@ class BannedReactionsController(BaseBanlistController):
             }
             BlacklistedReaction(**doc)              # data validation, if any
             self.collection.insert_one(doc)
+            self.invalidate_banlist(user.username)
 
             return Response(content=f"Successfully add banned reactions for user: "
                                     f"{user.username}!")
@@ -1,9 +1,13 @@
+import functools
+import threading
 from bson.objectid import ObjectId
 from configs import db_config
 from fastapi import Depends, Response
 from pydantic import BaseModel
 from pymongo import errors, MongoClient
-from typing import Annotated, Any
+from rdkit import Chem
+from typing import Annotated, Any, Iterable
+from utils.cache import LRUCache
 from utils.oauth2 import oauth2_scheme
 from utils.registry import get_util_registry
 
@@ -14,6 +18,33 @@ class BaseResponse(BaseModel):
     result: str | int | float | list | dict
 
 
+@functools.lru_cache(maxsize=65536)
+def canonicalize_banned_smiles(smiles: str) -> str:
+    """
+    Canonicalize a banned chemical, or each part of a banned reaction.
+    Unparsable SMILES are kept as they are (stripped), to be matched verbatim.
+    """
+    smiles = smiles.strip()
+    try:
+        parts = []
+        for part in smiles.split(">"):
+            if part:
+                mol = Chem.MolFromSmiles(part)
+                part = Chem.MolToSmiles(mol)
+            parts.append(part)
+    except Exception:
+        return smiles
+    else:
+        return ">".join(parts)
+
+
+def compile_banlist(smiles: Iterable[str]) -> list[str]:
+    """Canonicalized, deduplicated and sorted banned SMILES"""
+    return sorted(set(
+        canonicalize_banned_smiles(smi) for smi in smiles if smi and smi.strip()
+    ))
+
+
 class BaseBanlistController:
     """
     Base class for Banlist controller, alias for legacy BanlistViewSet
@@ -46,6 +77,59 @@ class BaseBanlistController:
             self.collection = self.client[database][collection]
             self.db = self.client[database]
 
+        # In-process cache of the compiled active banlist of each user. Entries
+        # are dropped when the banlist is changed through this worker, and
+        # expire after cache_ttl to pick up the changes made through others.
+        self.banlist_cache = LRUCache(
+            max_size=util_config.get("cache_size", 1000),
+            ttl=util_config.get("cache_ttl", 60)
+        )
+        self._generations: dict[str, int] = {}
+        self._generations_lock = threading.Lock()
+
+    def invalidate_banlist(self, username: str) -> None:
+        with self._generations_lock:
+            self._generations[username] = self._generations.get(username, 0) + 1
+
+    def get_banlist(self, token: str) -> tuple[str, ...]:
+        """
+        Compiled active banlist of the currently authenticated user.
+
+        Returns: canonical SMILES of the banlist, sorted
+        """
+        user_controller = get_util_registry().get_util(module="user_controller")
+        user = user_controller.get_current_user(token)
+
+        # taken before the query, so that a concurrent change is not missed
+        generation = self._generations.get(user.username, 0)
+        try:
+            cached_generation, smiles = self.banlist_cache.get(user.username)
+            if cached_generation == generation:
+                return smiles
+        except KeyError:
+            pass
+
+        cursor = self.collection.find(
+            {"user": user.username, "active": True},
+            {"smiles": 1, "_id": 0}
+        )
+        smiles = tuple(compile_banlist(r.get("smiles") for r in cursor))
+        self.banlist_cache.set(user.username, (generation, smiles))
+
+        return smiles
+
+    def merge_banlist(self, banned: list[str] | None, token: str) -> list[str]:
+        """
+        Merge the banned SMILES of a request with the active banlist of the
+        user into one compiled list, for a stable cache key and compact
+        payloads for the backends.
+        """
+        user_banned = self.get_banlist(token=token)
+        if not banned:
+            return list(user_banned)
+
+        return compile_banlist([*banned, *user_banned])
+
     def get(self, token: Annotated[str, Depends(oauth2_scheme)]) -> BaseModel:
         """
         API endpoint for accessing banned entries.
@@ -89,6 +173,7 @@ class BaseBanlistController:
             "_id": ObjectId(_id)
         }
         self.collection.delete_one(query)
+        self.invalidate_banlist(user.username)
 
         return Response(content=f"Successfully delete banlist entry: {_id}!")
 
@@ -111,6 +196,7 @@ class BaseBanlistController:
             query,
             {"$set": {"active": True}}
         )
+        self.invalidate_banlist(user.username)
 
         return Response(content=f"Successfully activate banlist entry: {_id}!")
 
@@ -133,5 +219,6 @@ class BaseBanlistController:
             query,
             {"$set": {"active": False}}
         )
+        self.invalidate_banlist(user.username)
 
         return Response(content=f"Successfully deactivate banlist entry: {_id}!")
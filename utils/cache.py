@@ -1,61 +1,550 @@
+import asyncio
+import hashlib
 import json
-import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from configs import db_config
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from pymongo import errors, MongoClient
-from typing import Any
+from typing import Any, Awaitable, Callable
 from utils import register_util
+from utils.metrics import CACHE_REQUESTS
+
+
+# Collection of the cross-worker single flight locks, in the cache database
+SINGLE_FLIGHT_COLLECTION = "_single_flight_locks"
+# Polling of the shared cache while another worker computes an entry
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+SINGLE_FLIGHT_MAX_POLL_INTERVAL = 1.0
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with LRU eviction and an optional TTL.
+    Values are stored as serialized JSON (or other immutable values, e.g.,
+    bytes) so that callers never share (and mutate) the cached objects.
+    """
+
+    def __init__(self, max_size: int, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            expires_at, value = self._data[key]
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                raise KeyError(key)
+            self._data.move_to_end(key)
+
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        # a per-entry ttl, if given, takes precedence over that of the cache
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _FlightAborted(Exception):
+    """The leader of a flight was interrupted (e.g., cancelled) without a result"""
+
+
+class SingleFlight:
+    """
+    In-process request coalescing: concurrent calls with the same key share a
+    single in-flight call, made by the first caller (the leader), and all
+    receive its result or exception. Works across threads and event loops,
+    since the flights are concurrent.futures.Future's.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+
+        return future, True
+
+    def _land(self, key: str, future: Future, result: Any = None,
+              exception: BaseException | None = None) -> None:
+        with self._lock:
+            del self._flights[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, func: Callable[[], Any]) -> tuple[Any, bool]:
+        """Returns the result of func(), and whether this caller made the call"""
+        while True:
+            future, is_leader = self._join(key)
+            if is_leader:
+                break
+            try:
+                return future.result(), False
+            except _FlightAborted:
+                continue
+
+        try:
+            result = func()
+        except Exception as e:
+            self._land(key, future, exception=e)
+            raise
+        except BaseException:
+            self._land(key, future, exception=_FlightAborted())
+            raise
+        self._land(key, future, result=result)
+
+        return result, True
+
+    async def do_async(
+        self, key: str, func: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool]:
+        """Async version of do(), without blocking the event loop while waiting"""
+        while True:
+            future, is_leader = self._join(key)
+            if is_leader:
+                break
+            try:
+                # shielded, so that a cancelled follower does not cancel the flight
+                return await asyncio.shield(asyncio.wrap_future(future)), False
+            except _FlightAborted:
+                continue
+
+        try:
+            result = await func()
+        except Exception as e:
+            self._land(key, future, exception=e)
+            raise
+        except BaseException:
+            self._land(key, future, exception=_FlightAborted())
+            raise
+        self._land(key, future, result=result)
+
+        return result, True
+
+
+class MongoCache:
+    """
+    Shared cache tier in Mongo, one collection per module, with TTL eviction
+    through a Mongo TTL index, and bounded to max_entries per module by evicting
+    the oldest entries. Entries survive restarts and are shared across API and
+    celery workers. Failed writes are skipped, as the tier is only a cache.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        database: str,
+        ttl: float | None = None,
+        max_entries: int | None = None
+    ):
+        self.client = MongoClient(serverSelectionTimeoutMS=1000, **config)
+
+        try:
+            self.client.server_info()
+        except errors.ServerSelectionTimeoutError:
+            raise ValueError("Cannot connect to mongodb for cache")
+        else:
+            self.db = self.client[database]
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._indexed_collections = set()
+
+    def _get_collection(self, module_name: str):
+        collection = self.db[module_name]
+        if module_name not in self._indexed_collections:
+            self._create_index(collection)
+            self._indexed_collections.add(module_name)
+
+        return collection
+
+    def _create_index(self, collection) -> None:
+        """
+        Index "created" for the eviction, as a TTL index if ttl is set. An index
+        created with another (or no) ttl, e.g., before a config change, is
+        dropped and recreated, as create_index() fails on the conflict.
+        """
+        options = {"expireAfterSeconds": int(self.ttl)} if self.ttl else {}
+        try:
+            collection.create_index("created", **options)
+        except errors.OperationFailure:
+            collection.drop_index("created_1")
+            collection.create_index("created", **options)
+
+    def _evict(self, collection) -> None:
+        """Delete the oldest entries beyond max_entries."""
+        excess = collection.estimated_document_count() - self.max_entries
+        if excess > 0:
+            oldest = collection.find({}, {"_id": 1}).sort("created", 1).limit(excess)
+            collection.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+
+    def get(self, module_name: str, key: str) -> str:
+        try:
+            doc = self.db[module_name].find_one({"_id": key})
+        except errors.PyMongoError:
+            raise KeyError(key)
+        if doc is None:
+            raise KeyError(key)
+
+        return doc["response"]
+
+    def set(self, module_name: str, key: str, value: str) -> None:
+        try:
+            collection = self._get_collection(module_name)
+            collection.replace_one(
+                {"_id": key},
+                {"_id": key, "response": value, "created": datetime.utcnow()},
+                upsert=True
+            )
+            if self.max_entries:
+                self._evict(collection)
+        except errors.PyMongoError as e:
+            print(f"Failed to add to the shared cache for {module_name}: {e}")
+
+    def clear(self, module_name: str) -> None:
+        self.db.drop_collection(module_name)
+        self._indexed_collections.discard(module_name)
+
+    def lock(self, module_name: str, key: str, ttl: float) -> bool:
+        """
+        Try to take the lock for computing an entry, shared across workers;
+        locks not released within ttl seconds are considered abandoned.
+        """
+        now = datetime.utcnow()
+        lock_id = f"{module_name}:{key}"
+        try:
+            self.db[SINGLE_FLIGHT_COLLECTION].insert_one({
+                "_id": lock_id,
+                "expires_at": now + timedelta(seconds=ttl)
+            })
+        except errors.DuplicateKeyError:
+            # take over an abandoned lock, atomically
+            result = self.db[SINGLE_FLIGHT_COLLECTION].update_one(
+                {"_id": lock_id, "expires_at": {"$lt": now}},
+                {"$set": {"expires_at": now + timedelta(seconds=ttl)}}
+            )
+            return result.modified_count == 1
+
+        return True
+
+    def unlock(self, module_name: str, key: str) -> None:
+        self.db[SINGLE_FLIGHT_COLLECTION].delete_one({"_id": f"{module_name}:{key}"})
+
+    def is_locked(self, module_name: str, key: str) -> bool:
+        doc = self.db[SINGLE_FLIGHT_COLLECTION].find_one(
+            {"_id": f"{module_name}:{key}"})
+
+        return doc is not None and doc["expires_at"] >= datetime.utcnow()
 
 
 @register_util(name="cache_controller")
 class CacheController:
-    """Util class for controlling the cache"""
+    """
+    Util class for controlling the cache, with a bounded in-process LRU tier
+    per module and an optional shared tier (engine="db") in Mongo
+    """
     prefixes = []
     methods_to_bind: dict[str, list[str]] = {}
 
     def __init__(self, util_config: dict[str, Any] = None):
-        self.cache_maps = {}
-        self.cache_size = 10000
+        util_config = util_config or {}
+        engine = util_config.get("engine", "db")
+        self.cache_size = util_config.get("cache_size", 10000)
+        self.ttl = util_config.get("ttl", None)
+        self.single_flight = util_config.get("single_flight", True)
+        self.distributed_single_flight = util_config.get(
+            "distributed_single_flight", False)
+        self.single_flight_timeout = util_config.get("single_flight_timeout", 60)
 
-        self.client = MongoClient(serverSelectionTimeoutMS=1000, **db_config.MONGO)
-        database = "cache"
+        self.cache_maps: dict[str, LRUCache] = {}
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
 
+        if engine == "db":
+            self.shared_cache = MongoCache(
+                config=db_config.MONGO,
+                database=util_config.get("database", "cache"),
+                ttl=self.ttl,
+                max_entries=self.cache_size
+            )
+        elif engine == "memory":
+            self.shared_cache = None
+        else:
+            raise ValueError(f"Unsupported cache engine: {engine}! "
+                             f"Only 'db' or 'memory' is supported")
+
+    @staticmethod
+    def hash_input(input: BaseModel) -> str:
+        """
+        Canonical digest of the input, independent of the field order.
+        """
+        canonical = json.dumps(
+            jsonable_encoder(input),
+            sort_keys=True,
+            separators=(",", ":")
+        )
+
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _get_cache_map(self, module_name: str) -> LRUCache:
+        if module_name not in self.cache_maps:
+            with self._lock:
+                if module_name not in self.cache_maps:
+                    self.cache_maps[module_name] = LRUCache(
+                        max_size=self.cache_size,
+                        ttl=self.ttl
+                    )
+
+        return self.cache_maps[module_name]
+
+    def _get_serialized(self, module_name: str, input_hash: str) -> str:
+        cache_map = self._get_cache_map(module_name)
         try:
-            self.client.server_info()
-        except errors.ServerSelectionTimeoutError:
-            raise ValueError("Cannot connect to mongodb for cache")
+            response = cache_map.get(input_hash)
+        except KeyError:
+            try:
+                if self.shared_cache is None:
+                    raise
+                response = self.shared_cache.get(module_name, input_hash)
+            except KeyError:
+                CACHE_REQUESTS.labels(module_name, "miss").inc()
+                raise
+            CACHE_REQUESTS.labels(module_name, "shared_hit").inc()
+            cache_map.set(input_hash, response)
         else:
-            # reset the db from the Mongo side as well
-            self.client.drop_database(database)
-            self.db = self.client[database]
+            CACHE_REQUESTS.labels(module_name, "memory_hit").inc()
+
+        return response
+
+    def _add_serialized(self, module_name: str, input_hash: str, response: Any) -> str:
+        response = json.dumps(jsonable_encoder(response))
+
+        self._get_cache_map(module_name).set(input_hash, response)
+        if self.shared_cache is not None:
+            self.shared_cache.set(module_name, input_hash, response)
+
+        return response
 
     def get(self, module_name: str, input: BaseModel) -> dict:
         # any KeyError will be handled at the respective wrapper
-        cache_map = self.cache_maps[module_name]
-        input_hash = json.dumps(jsonable_encoder(input))
-        _id = cache_map[input_hash]
+        return json.loads(self._get_serialized(module_name, self.hash_input(input)))
 
+    def add(self, module_name: str, input: BaseModel, response: BaseModel) -> None:
+        self._add_serialized(module_name, self.hash_input(input), response)
+
+    def clear(self, module_name: str) -> None:
+        self._get_cache_map(module_name).clear()
+        if self.shared_cache is not None:
+            self.shared_cache.clear(module_name)
+
+    def get_or_compute(
+        self,
+        module_name: str,
+        input: BaseModel,
+        compute: Callable[[], Any]
+    ) -> Any:
+        """
+        Cached response for the input, or else the response of compute(), which
+        is then added to the cache. Concurrent misses for the same input share a
+        single compute() (single flight) within the process and, with
+        distributed_single_flight, across the workers sharing the Mongo cache.
+        The caller that computed gets its response as is, the others as a dict.
+        """
+        input_hash = self.hash_input(input)
         try:
-            collection = self.db[module_name]
-            response = collection.find_one(_id)
-            del response["_id"]
-        except:     # weird bug; may be due to lag for async mongo deletion?
-            raise KeyError
+            return json.loads(self._get_serialized(module_name, input_hash))
+        except KeyError:
+            pass
 
-        return response
+        if not self.single_flight:
+            response = compute()
+            self._add_serialized(module_name, input_hash, response)
 
-    def add(self, module_name: str, input: BaseModel, response: BaseModel) -> None:
-        if module_name not in self.cache_maps:
-            self.cache_maps[module_name] = {}
-        cache_map = self.cache_maps[module_name]
-        input_hash = json.dumps(jsonable_encoder(input))
+            return response
 
-        collection = self.db[module_name]
-        _id = collection.insert_one(response.dict()).inserted_id
-        cache_map[input_hash] = _id
+        (response, serialized), is_leader = self._single_flight.do(
+            key=f"{module_name}:{input_hash}",
+            func=lambda: self._compute_and_add(module_name, input_hash, compute)
+        )
+
+        return response if is_leader else json.loads(serialized)
+
+    async def get_or_compute_async(
+        self,
+        module_name: str,
+        input: BaseModel,
+        compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Async version of get_or_compute(), for an async compute()"""
+        input_hash = self.hash_input(input)
+        try:
+            return json.loads(await run_in_threadpool(
+                self._get_serialized, module_name, input_hash))
+        except KeyError:
+            pass
+
+        if not self.single_flight:
+            response = await compute()
+            await run_in_threadpool(
+                self._add_serialized, module_name, input_hash, response)
+
+            return response
+
+        (response, serialized), is_leader = await self._single_flight.do_async(
+            key=f"{module_name}:{input_hash}",
+            func=lambda: self._compute_and_add_async(module_name, input_hash, compute)
+        )
+
+        return response if is_leader else json.loads(serialized)
+
+    def _compute_and_add(
+        self,
+        module_name: str,
+        input_hash: str,
+        compute: Callable[[], Any]
+    ) -> tuple[Any, str]:
+        cache_map = self._get_cache_map(module_name)
+        try:
+            # added by a flight that landed after the lookup of the caller
+            serialized = cache_map.get(input_hash)
+            return json.loads(serialized), serialized
+        except KeyError:
+            pass
+
+        locked = self._lock_shared(module_name, input_hash)
+        if locked is False:
+            serialized = self._wait_for_shared(module_name, input_hash)
+            if serialized is not None:
+                cache_map.set(input_hash, serialized)
+                return json.loads(serialized), serialized
+
+        try:
+            response = compute()
+            serialized = self._add_serialized(module_name, input_hash, response)
+        finally:
+            if locked:
+                self._unlock_shared(module_name, input_hash)
+
+        return response, serialized
+
+    async def _compute_and_add_async(
+        self,
+        module_name: str,
+        input_hash: str,
+        compute: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, str]:
+        cache_map = self._get_cache_map(module_name)
+        try:
+            # added by a flight that landed after the lookup of the caller
+            serialized = cache_map.get(input_hash)
+            return json.loads(serialized), serialized
+        except KeyError:
+            pass
+
+        locked = await run_in_threadpool(self._lock_shared, module_name, input_hash)
+        if locked is False:
+            serialized = await self._wait_for_shared_async(module_name, input_hash)
+            if serialized is not None:
+                cache_map.set(input_hash, serialized)
+                return json.loads(serialized), serialized
+
+        try:
+            response = await compute()
+            serialized = await run_in_threadpool(
+                self._add_serialized, module_name, input_hash, response)
+        finally:
+            if locked:
+                await run_in_threadpool(self._unlock_shared, module_name, input_hash)
+
+        return response, serialized
+
+    def _lock_shared(self, module_name: str, input_hash: str) -> bool | None:
+        """
+        Whether the cross-worker lock for computing the entry is taken (True)
+        or held by another worker (False); None if not applicable
+        """
+        if not self.distributed_single_flight or self.shared_cache is None:
+            return None
+        try:
+            return self.shared_cache.lock(
+                module_name, input_hash, ttl=self.single_flight_timeout)
+        except errors.PyMongoError:
+            return None
+
+    def _unlock_shared(self, module_name: str, input_hash: str) -> None:
+        try:
+            self.shared_cache.unlock(module_name, input_hash)
+        except errors.PyMongoError:
+            # expires on its own
+            pass
+
+    def _poll_shared(self, module_name: str, input_hash: str) -> tuple[str | None, bool]:
+        """The entry if computed by another worker, and whether it still is computing"""
+        try:
+            return self.shared_cache.get(module_name, input_hash), False
+        except KeyError:
+            pass
+        try:
+            if self.shared_cache.is_locked(module_name, input_hash):
+                return None, True
+        except errors.PyMongoError:
+            return None, False
+
+        # unlocked in between, after adding the entry or without one (on errors)
+        try:
+            return self.shared_cache.get(module_name, input_hash), False
+        except KeyError:
+            return None, False
+
+    def _wait_for_shared(self, module_name: str, input_hash: str) -> str | None:
+        deadline = time.monotonic() + self.single_flight_timeout
+        interval = SINGLE_FLIGHT_POLL_INTERVAL
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            serialized, locked = self._poll_shared(module_name, input_hash)
+            if not locked:
+                return serialized
+            interval = min(interval * 2, SINGLE_FLIGHT_MAX_POLL_INTERVAL)
+
+        return None
+
+    async def _wait_for_shared_async(
+        self, module_name: str, input_hash: str
+    ) -> str | None:
+        deadline = time.monotonic() + self.single_flight_timeout
+        interval = SINGLE_FLIGHT_POLL_INTERVAL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(interval)
+            serialized, locked = await run_in_threadpool(
+                self._poll_shared, module_name, input_hash)
+            if not locked:
+                return serialized
+            interval = min(interval * 2, SINGLE_FLIGHT_MAX_POLL_INTERVAL)
 
-        while len(cache_map) >= self.cache_size:
-            k = random.choice(list(cache_map.keys()))
-            collection.delete_one({"_id": cache_map[k]})
-            del cache_map[k]
+        return None
@@ -1,9 +1,19 @@
+import asyncio
+import base64
+import hashlib
 import json
+import multiprocessing
+import os
+import tempfile
 import traceback as tb
-from fastapi import Depends, Query, Response
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import Depends, Header, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from schemas.base import LowerCamelAliasModel
 from typing import Annotated, Any, Literal
 from utils import register_util
+from utils.cache import LRUCache
 from utils.draw_impl import (
     molecule_smiles_to_image,
     reaction_smiles_to_image,
@@ -29,6 +39,95 @@ class DrawerInput(LowerCamelAliasModel):
     size: float = None
 
 
+class DrawerBatchInput(LowerCamelAliasModel):
+    items: list[DrawerInput]
+
+
+class DrawerBatchResult(BaseModel):
+    status_code: int
+    media_type: str | None = None
+    etag: str | None = None
+    content: str | None = Field(
+        default=None,
+        description="SVG as text, or PNG encoded in base64"
+    )
+    error: str | None = None
+
+
+class DrawerBatchResponse(BaseModel):
+    results: list[DrawerBatchResult]
+
+
+# Part of the cache keys and ETags; bump when the rendering changes
+RENDER_VERSION = 1
+
+
+class RenderCache:
+    """
+    Content-addressed cache of rendered images, keyed by a digest of the
+    normalized drawer input, with a bounded in-memory LRU tier and an optional
+    on-disk tier (for successful renders), shared by the workers on a host.
+    """
+
+    def __init__(self, cache_size: int, disk_cache_dir: str = ""):
+        self.memory = LRUCache(max_size=cache_size)
+        self.disk_cache_dir = disk_cache_dir
+        if disk_cache_dir:
+            os.makedirs(disk_cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_key(data: dict) -> str:
+        data = {**data, "input_type": data.get("input_type") or None}
+        canonical = json.dumps(
+            {"version": RENDER_VERSION, **data},
+            sort_keys=True,
+            separators=(",", ":")
+        )
+
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.disk_cache_dir, key[:2], key)
+
+    def get(self, key: str, data: dict) -> tuple[int, str, bytes]:
+        try:
+            return self.memory.get(key)
+        except KeyError:
+            if not self.disk_cache_dir:
+                raise
+        try:
+            with open(self._get_path(key), "rb") as f:
+                content = f.read()
+        except OSError:
+            raise KeyError(key)
+
+        rendered = (
+            status.HTTP_200_OK,
+            "image/svg+xml" if data.get("svg") else "image/png",
+            content
+        )
+        self.memory.set(key, rendered)
+
+        return rendered
+
+    def set(self, key: str, rendered: tuple[int, str, bytes]) -> None:
+        self.memory.set(key, rendered)
+        status_code, _, content = rendered
+        if not self.disk_cache_dir or status_code != status.HTTP_200_OK:
+            return
+
+        path = self._get_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written atomically, for concurrent readers and writers
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError:
+            tb.print_exc()
+
+
 @register_util(name="draw")
 class Drawer:
     """
@@ -65,31 +164,178 @@ class Drawer:
             product for annotation
     - `size` (float, optional): size of drawing
 
-    Returns: SVG or PNG image of input SMILES
+    Returns: SVG or PNG image of input SMILES, with a strong ETag (304 for GET
+    requests with a matching If-None-Match) and Cache-Control headers
     """
     prefixes = ["draw", "v2/draw"]
     methods_to_bind: dict[str, list[str]] = {
         "get": ["GET"],
-        "post": ["POST"]
+        "post": ["POST"],
+        "batch": ["POST"]
     }
 
     def __init__(self, util_config: dict[str, Any]):
-        pass
+        util_config = util_config or {}
+        self.render_cache = RenderCache(
+            cache_size=util_config.get("cache_size", 2000),
+            disk_cache_dir=util_config.get("disk_cache_dir", "")
+        )
+        self.cache_control = \
+            f"public, max-age={util_config.get('max_age', 86400)}, immutable"
+        self.max_batch_size = util_config.get("max_batch_size", 1000)
+        self.num_workers = util_config.get("num_workers", 4)
+        self._pool = None
 
-    @staticmethod
     def get(
+        self,
         query_params: Annotated[DrawerInput, Depends()],
-        reacting_atoms: Annotated[list[float] | None, Query()] = None
+        reacting_atoms: Annotated[list[float] | None, Query()] = None,
+        if_none_match: Annotated[str | None, Header()] = None
     ) -> Response:
         # hardcode; Depends() doesn't fully work with list or union fields
         # https://github.com/tiangolo/fastapi/issues/5719
         query_params.reacting_atoms = reacting_atoms
 
-        return draw(query_params.dict())
+        return self.draw_cached(query_params.dict(), if_none_match=if_none_match)
 
-    @staticmethod
-    def post(data: DrawerInput) -> Response:
-        return draw(data.dict())
+    def post(self, data: DrawerInput) -> Response:
+        return self.draw_cached(data.dict())
+
+    def draw_cached(self, data: dict, if_none_match: str | None = None) -> Response:
+        key = self.render_cache.get_key(data)
+        headers = {"ETag": f'"{key}"', "Cache-Control": self.cache_control}
+        if if_none_match is not None:
+            etags = [etag.strip().removeprefix("W/") for etag in if_none_match.split(",")]
+            if headers["ETag"] in etags or "*" in etags:
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        try:
+            status_code, media_type, content = self.render_cache.get(key, data)
+        except KeyError:
+            status_code, media_type, content = render(data)
+            # server errors may be transient, so are rendered again next time
+            if status_code < status.HTTP_500_INTERNAL_SERVER_ERROR:
+                self.render_cache.set(key, (status_code, media_type, content))
+
+        if status_code != status.HTTP_200_OK:
+            headers = None
+
+        return Response(
+            content=content,
+            status_code=status_code,
+            media_type=media_type,
+            headers=headers
+        )
+
+    async def batch(self, input: DrawerBatchInput) -> DrawerBatchResponse:
+        """
+        Batch drawing endpoint: renders the items (cache misses only, once per
+        distinct item) in parallel across a process pool, and returns them all
+        in one JSON payload, with per-item errors
+
+        Method: POST
+        """
+        if len(input.items) > self.max_batch_size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {self.max_batch_size} items per batch"
+            )
+
+        items = [item.dict() for item in input.items]
+        keys = [self.render_cache.get_key(data) for data in items]
+        rendered = await run_in_threadpool(self._get_cached, keys, items)
+
+        missing = {
+            key: data for key, data in zip(keys, items) if key not in rendered
+        }
+        if missing:
+            results = await self._render_batch(list(missing.values()))
+            results = dict(zip(missing, results))
+            await run_in_threadpool(self._set_cached, results)
+            rendered.update(results)
+
+        return DrawerBatchResponse(
+            results=[to_batch_result(key, rendered[key]) for key in keys]
+        )
+
+    def _get_cached(self, keys: list[str], items: list[dict]
+                    ) -> dict[str, tuple[int, str, bytes]]:
+        rendered = {}
+        for key, data in zip(keys, items):
+            try:
+                rendered[key] = self.render_cache.get(key, data)
+            except KeyError:
+                continue
+
+        return rendered
+
+    def _set_cached(self, results: dict[str, tuple[int, str, bytes]]) -> None:
+        for key, rendered in results.items():
+            if rendered[0] < status.HTTP_500_INTERNAL_SERVER_ERROR:
+                self.render_cache.set(key, rendered)
+
+    async def _render_batch(self, items: list[dict]) -> list[tuple[int, str, bytes]]:
+        if self.num_workers <= 1:
+            return await run_in_threadpool(render_batch, items)
+
+        if self._pool is None:
+            # not forked from this multi-threaded process
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+        chunk_size = -(-len(items) // (self.num_workers * 4))
+        chunks = [items[i:i+chunk_size] for i in range(0, len(items), chunk_size)]
+        try:
+            results = await asyncio.gather(*[
+                asyncio.wrap_future(self._pool.submit(render_batch, chunk))
+                for chunk in chunks
+            ])
+        except Exception as e:
+            # e.g., BrokenProcessPool; start afresh on the next batch
+            tb.print_exc()
+            self._pool = None
+            error = json.dumps({"error": f"Rendering failed: {e}"}).encode("utf-8")
+            return [
+                (status.HTTP_500_INTERNAL_SERVER_ERROR, "application/json", error)
+            ] * len(items)
+
+        return [rendered for chunk_results in results for rendered in chunk_results]
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def to_batch_result(key: str, rendered: tuple[int, str, bytes]) -> DrawerBatchResult:
+    status_code, media_type, content = rendered
+    if status_code != status.HTTP_200_OK:
+        try:
+            error = json.loads(content)["error"]
+        except (ValueError, KeyError, TypeError):
+            error = content.decode("utf-8", errors="replace")
+
+        return DrawerBatchResult(status_code=status_code, error=error)
+
+    if media_type == "image/png":
+        content = base64.b64encode(content).decode("ascii")
+    else:
+        content = content.decode("utf-8")
+
+    return DrawerBatchResult(
+        status_code=status_code,
+        media_type=media_type,
+        etag=f'"{key}"',
+        content=content
+    )
+
+
+def render_batch(items: list[dict]) -> list[tuple[int, str, bytes]]:
+    """
+    Render a batch of items, e.g., in a worker process
+    """
+    return [render(data) for data in items]
 
 
 def draw(data: dict) -> Response:
@@ -130,6 +376,15 @@ def draw(data: dict) -> Response:
         )
 
 
+def render(data: dict) -> tuple[int, str, bytes]:
+    """
+    Returns the status code, media type and content of the drawing.
+    """
+    response = draw(data)
+
+    return response.status_code, response.media_type, response.body
+
+
 def draw_chemical(data: dict) -> Response:
     """
     Returns HttpResponse containing PNG of chemical SMILES.
@@ -0,0 +1,195 @@
+import math
+import numpy as np
+import sys
+import time
+from typing import Iterable
+from utils.snapshot_utils import (
+    get_string_from_blob,
+    load_arrays,
+    load_meta,
+    save_arrays,
+    strings_to_blob
+)
+
+# Morgan fingerprints, consistent with similarity_search_utils
+DEFAULT_MORGAN_RADIUS = 2
+DEFAULT_MORGAN_LEN = 2048
+
+# Number of rows to AND/popcount at a time, to bound the temporary memory
+SEARCH_CHUNK_SIZE = 65536
+BUILD_CHUNK_SIZE = 10000
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def pack_bits(bits_list: list[list[int]], fp_size: int = DEFAULT_MORGAN_LEN
+              ) -> np.ndarray:
+    """
+    Pack lists of on-bits into a (n, fp_size // 64) little-endian uint64 matrix.
+    """
+    dense = np.zeros((len(bits_list), fp_size), dtype=np.bool_)
+    for i, bits in enumerate(bits_list):
+        dense[i, bits] = True
+    packed = np.packbits(dense, axis=1, bitorder="little")
+
+    return np.ascontiguousarray(packed).view("<u8")
+
+
+def popcount(packed: np.ndarray) -> np.ndarray:
+    """Vectorized row-wise popcount for a C-contiguous packed uint64 matrix."""
+    packed = np.ascontiguousarray(packed)
+    as_bytes = packed.view(np.uint8).reshape(packed.shape[0], packed.shape[1] * 8)
+
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=1, dtype=np.int32)
+
+
+class PackedFingerprintIndex:
+    """
+    In-memory Morgan fingerprint index for the products of a single template set.
+
+    Fingerprints are stored as a packed uint64 bit matrix sorted by popcount,
+    so that the count bounds implied by a Tanimoto threshold map to a
+    contiguous row range. All arrays are persisted as .npy files and loaded
+    memory-mapped, so that processes on the same host share pages.
+    """
+    FILES = ["fps", "counts", "ids", "ids_offsets", "smiles", "smiles_offsets"]
+
+    def __init__(
+        self,
+        fps: np.ndarray,
+        counts: np.ndarray,
+        ids: np.ndarray,
+        ids_offsets: np.ndarray,
+        smiles: np.ndarray,
+        smiles_offsets: np.ndarray
+    ):
+        self.fps = fps
+        self.counts = counts
+        self.ids = ids
+        self.ids_offsets = ids_offsets
+        self.smiles = smiles
+        self.smiles_offsets = smiles_offsets
+
+    def __len__(self) -> int:
+        return self.fps.shape[0]
+
+    @classmethod
+    def build(cls, docs: Iterable[dict]) -> "PackedFingerprintIndex":
+        """
+        Build the index from documents in the products_in_reactions schema,
+        i.e., with "_id", "product_smiles" and "mfp_bits" keys.
+        """
+        start = time.time()
+        fps = []
+        ids = []
+        smiles = []
+        bits_batch = []
+        for i, doc in enumerate(docs):
+            if i > 0 and i % 100000 == 0:
+                print(f"Packed {i} fingerprints in {time.time() - start: .2f} seconds")
+                sys.stdout.flush()
+
+            ids.append(str(doc["_id"]))
+            smiles.append(doc["product_smiles"])
+            bits_batch.append(doc["mfp_bits"])
+            if len(bits_batch) == BUILD_CHUNK_SIZE:
+                fps.append(pack_bits(bits_batch))
+                bits_batch = []
+        if bits_batch or not fps:
+            fps.append(pack_bits(bits_batch))
+
+        fps = np.concatenate(fps, axis=0)
+        counts = popcount(fps)
+        order = np.argsort(counts, kind="stable")
+
+        fps = np.ascontiguousarray(fps[order])
+        counts = counts[order]
+        ids, ids_offsets = strings_to_blob([ids[i] for i in order])
+        smiles, smiles_offsets = strings_to_blob([smiles[i] for i in order])
+
+        return cls(fps, counts, ids, ids_offsets, smiles, smiles_offsets)
+
+    def save(self, path: str, meta: dict = None) -> None:
+        """Save the index into directory `path`, replacing any existing one."""
+        save_arrays(
+            path=path,
+            arrays={name: getattr(self, name) for name in self.FILES},
+            meta=meta
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "PackedFingerprintIndex":
+        """Load a saved index from directory `path` as read-only memory maps."""
+        return cls(**load_arrays(path=path, names=cls.FILES))
+
+    @staticmethod
+    def load_meta(path: str) -> dict | None:
+        return load_meta(path=path)
+
+    def get_id(self, i: int) -> str:
+        return get_string_from_blob(self.ids, self.ids_offsets, i)
+
+    def get_smiles(self, i: int) -> str:
+        return get_string_from_blob(self.smiles, self.smiles_offsets, i)
+
+    def search(
+        self,
+        query_bits: list[int],
+        threshold: float,
+        top_k: int | None = None
+    ) -> list[dict]:
+        """
+        Find all entries with Tanimoto similarity >= threshold to the query.
+
+        Args:
+            query_bits (list): on-bits of the query Morgan fingerprint
+            threshold (float): Tanimoto threshold for similarity
+            top_k (int, optional): only return the k most similar entries
+
+        Returns:
+            list of dicts with "_id", "product_smiles" and "tanimoto" keys,
+                in the same format as sim_search_aggregate(), sorted by
+                decreasing similarity
+        """
+        query_count = len(query_bits)
+        if query_count == 0 or len(self) == 0:
+            return []
+
+        if threshold > 0:
+            fp_min = int(math.ceil(threshold * query_count))
+            fp_max = int(query_count / threshold)
+            start = int(np.searchsorted(self.counts, fp_min, side="left"))
+            end = int(np.searchsorted(self.counts, fp_max, side="right"))
+        else:
+            start, end = 0, len(self)
+
+        query_fp = pack_bits([query_bits])[0]
+        indices = []
+        scores = []
+        for chunk_start in range(start, end, SEARCH_CHUNK_SIZE):
+            chunk_end = min(chunk_start + SEARCH_CHUNK_SIZE, end)
+            common = popcount(self.fps[chunk_start:chunk_end] & query_fp)
+            counts = self.counts[chunk_start:chunk_end]
+            tanimoto = common / (query_count + counts - common)
+
+            matched = np.nonzero(tanimoto >= threshold)[0]
+            indices.append(matched + chunk_start)
+            scores.append(tanimoto[matched])
+
+        if not indices:
+            return []
+        indices = np.concatenate(indices)
+        scores = np.concatenate(scores)
+
+        if top_k is not None and top_k < len(scores):
+            partition = np.argpartition(-scores, top_k)[:top_k]
+            indices, scores = indices[partition], scores[partition]
+        order = np.argsort(-scores, kind="stable")
+
+        return [
+            {
+                "_id": self.get_id(i),
+                "product_smiles": self.get_smiles(i),
+                "tanimoto": float(score)
+            } for i, score in zip(indices[order], scores[order])
+        ]
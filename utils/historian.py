@@ -1,6 +1,7 @@
 import gzip
 import hashlib
 import json
+import numpy as np
 import os
 from bson import ObjectId
 from configs import db_config
@@ -8,6 +9,15 @@ from pymongo import errors, MongoClient
 from rdkit import Chem
 from typing import Any
 from utils import register_util
+from utils.snapshot_utils import (
+    load_arrays,
+    load_meta,
+    resolve_path,
+    save_arrays,
+    search_sorted_blob,
+    snapshot_lock,
+    strings_to_blob
+)
 
 
 @register_util(name="historian")
@@ -36,7 +46,10 @@ class Historian:
             self._estimated_count = None
             self._template_sets = []
         elif engine == "file":
-            self._historian = FileHistorian(files=util_config["files"])
+            self._historian = FileHistorian(
+                files=util_config["files"],
+                snapshot_dir=util_config.get("snapshot_dir", "")
+            )
         else:
             raise ValueError(f"Unsupported historian engine: {engine}! "
                              f"Only 'db' or 'file' is supported")
@@ -108,16 +121,45 @@ class Historian:
         canonicalize: bool = True,
         isomeric_smiles: bool = True
     ) -> dict[str, dict[str, int]]:
-        results = {}
-        for smiles in smiles_list:
-            results[smiles] = self.lookup_smiles(
-                smiles=smiles,
-                template_sets=template_sets,
-                canonicalize=canonicalize,
-                isomeric_smiles=isomeric_smiles
-            )
+        """
+        Looks up number of occurrences for a list of SMILES in a single batch.
 
-        return results
+        Each unique SMILES is canonicalized and hashed once, and all of them are
+        looked up together (e.g., with a single query for the Mongo engine).
+
+        Args:
+            smiles_list (list): list of SMILES strings to look up.
+            template_sets (list, optional): Template sets to consider when
+                aggregating statistics.
+            canonicalize (bool, optional): whether to canonicalize SMILES string
+            isomeric_smiles (bool, optional): whether to generate isomeric
+                SMILES string when performing canonicalization
+
+        Returns:
+            dict: mapping from input SMILES to dict containing
+                'as_reactant' and 'as_product' keys
+        """
+        if canonicalize:
+            canonical_smiles = {
+                smiles: self.canonicalize(
+                    smiles=smiles,
+                    isomeric_smiles=isomeric_smiles
+                ) or smiles
+                for smiles in set(smiles_list)
+            }
+        else:
+            canonical_smiles = {smiles: smiles for smiles in set(smiles_list)}
+
+        unique_smiles = list(set(canonical_smiles.values()))
+        counts = self._historian.lookup_smiles_list(
+            smiles_list=unique_smiles,
+            hashed_smiles_list=[self.hash_smiles(smiles) for smiles in unique_smiles],
+            template_sets=template_sets
+        )
+
+        return {
+            smiles: dict(counts[canonical_smiles[smiles]]) for smiles in smiles_list
+        }
 
     # The following methods are Mongo only
     def search(
@@ -252,28 +294,181 @@ class MongoHistorian:
 
         return result
 
+    def lookup_smiles_list(
+        self,
+        smiles_list: list[str],
+        hashed_smiles_list: list[str],
+        template_sets: list[str] = None
+    ) -> dict[str, dict[str, int]]:
+        # Processing for template subsets which use the same historian data
+        if template_sets:
+            template_sets = list({ts.split(":")[0] for ts in template_sets})
+
+        results = {
+            smiles: {"as_reactant": 0, "as_product": 0} for smiles in smiles_list
+        }
+        key_to_smiles = dict(zip(smiles_list, smiles_list))
+        key_to_smiles.update(zip(hashed_smiles_list, smiles_list))
+
+        query = {"smiles": {"$in": list(key_to_smiles.keys())}}
+        if template_sets:
+            query["template_set"] = {"$in": template_sets}
+        cursor = self.collection.find(
+            query,
+            projection={"_id": 0, "smiles": 1, "as_reactant": 1, "as_product": 1}
+        )
+        for doc in cursor:
+            result = results[key_to_smiles[doc["smiles"]]]
+            result["as_reactant"] += doc.get("as_reactant", 0)
+            result["as_product"] += doc.get("as_product", 0)
+
+        return results
+
+
+class HistorianSnapshot:
+    """
+    Compact read-only historian data for a single template set, with sorted
+    SMILES keys and parallel int32 count arrays, memory-mapped from .npy files
+    so that all processes on the same host share the pages.
+    """
+    FILES = ["keys", "offsets", "as_reactant", "as_product"]
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        offsets: np.ndarray,
+        as_reactant: np.ndarray,
+        as_product: np.ndarray
+    ):
+        self.keys = keys
+        self.offsets = offsets
+        self.as_reactant = as_reactant
+        self.as_product = as_product
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def build(cls, data: dict[str, dict]) -> "HistorianSnapshot":
+        """Build the snapshot from a smiles -> {as_reactant, as_product} dict."""
+        smiles_list = sorted(data.keys(), key=lambda smi: smi.encode("utf-8"))
+        keys, offsets = strings_to_blob(smiles_list)
+        as_reactant = np.array(
+            [data[smi].get("as_reactant", 0) for smi in smiles_list], dtype=np.int32
+        )
+        as_product = np.array(
+            [data[smi].get("as_product", 0) for smi in smiles_list], dtype=np.int32
+        )
+
+        return cls(keys, offsets, as_reactant, as_product)
+
+    def save(self, path: str, meta: dict = None) -> None:
+        save_arrays(
+            path=path,
+            arrays={name: getattr(self, name) for name in self.FILES},
+            meta=meta
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "HistorianSnapshot":
+        return cls(**load_arrays(path=path, names=cls.FILES))
+
+    def get(self, smiles: str, default: Any = None) -> dict[str, int] | Any:
+        """Same signature as dict.get(), for drop-in use by FileHistorian."""
+        i = search_sorted_blob(self.keys, self.offsets, smiles)
+        if i is None:
+            return default
+
+        return {
+            "as_reactant": int(self.as_reactant[i]),
+            "as_product": int(self.as_product[i])
+        }
+
 
 class FileHistorian:
-    def __init__(self, files: list[str]):
+    def __init__(self, files: list[str], snapshot_dir: str = ""):
         """
-        Load data from local file.
+        Load data from local file, or from the memory-mapped snapshot
+        in snapshot_dir if one has been converted from the same files.
         """
         print("Loading chemhistorian from file...")
 
-        self.data = {}
         for filename in files:
             if not os.path.isfile(filename):
                 raise ValueError(f"Chemical data file does not exist: {filename}")
 
+        if snapshot_dir:
+            self.data = self.load_snapshot(files=files, snapshot_dir=snapshot_dir)
+        else:
+            self.data = self.load_files(files=files)
+
+        print("Historian is fully loaded.")
+
+    @staticmethod
+    def load_files(files: list[str]) -> dict[str, dict[str, dict]]:
+        data = {}
+        for filename in files:
             with gzip.open(filename, "rt", encoding="utf-8") as f:
-                data = json.load(f)
+                file_data = json.load(f)
 
-            for entry in data:
+            for entry in file_data:
                 smiles = entry.pop("smiles")
                 template_set = entry.pop("template_set")
-                self.data.setdefault(template_set, {})[smiles] = entry
+                data.setdefault(template_set, {})[smiles] = entry
 
-        print("Historian is fully loaded.")
+        return data
+
+    @staticmethod
+    def get_snapshot_meta(files: list[str]) -> dict:
+        return {
+            "files": [
+                {
+                    "file": os.path.abspath(filename),
+                    "size": os.path.getsize(filename),
+                    "mtime": os.path.getmtime(filename)
+                } for filename in files
+            ]
+        }
+
+    @classmethod
+    def convert_to_snapshot(cls, files: list[str], snapshot_dir: str) -> None:
+        """
+        One-time conversion of the json files into a snapshot per template set.
+        Callers should hold snapshot_lock on snapshot_dir/_meta.
+        """
+        data = cls.load_files(files=files)
+        for template_set, data_by_template in data.items():
+            HistorianSnapshot.build(data_by_template).save(
+                path=os.path.join(snapshot_dir, template_set)
+            )
+            print(f"Converted {len(data_by_template)} historian entries "
+                  f"for template_set {template_set}")
+
+        meta = cls.get_snapshot_meta(files=files)
+        meta["template_sets"] = list(data.keys())
+        save_arrays(path=os.path.join(snapshot_dir, "_meta"), arrays={}, meta=meta)
+
+    @classmethod
+    def load_snapshot(
+        cls,
+        files: list[str],
+        snapshot_dir: str
+    ) -> dict[str, HistorianSnapshot]:
+        meta_path = os.path.join(snapshot_dir, "_meta")
+        # other workers may be converting the same files
+        with snapshot_lock(meta_path):
+            meta = load_meta(path=resolve_path(meta_path))
+            if meta is None or meta["files"] != cls.get_snapshot_meta(files)["files"]:
+                print(f"Historian snapshot in {snapshot_dir} missing or outdated, "
+                      f"converting from files...")
+                cls.convert_to_snapshot(files=files, snapshot_dir=snapshot_dir)
+                meta = load_meta(path=resolve_path(meta_path))
+
+            return {
+                template_set: HistorianSnapshot.load(
+                    path=resolve_path(os.path.join(snapshot_dir, template_set))
+                ) for template_set in meta["template_sets"]
+            }
 
     def lookup_smiles(
         self,
@@ -299,3 +494,17 @@ class FileHistorian:
             ),
             "as_product": sum(doc["as_product"] for doc in results if doc is not None),
         }
+
+    def lookup_smiles_list(
+        self,
+        smiles_list: list[str],
+        hashed_smiles_list: list[str],
+        template_sets: list[str] = None
+    ) -> dict[str, dict[str, int]]:
+        return {
+            smiles: self.lookup_smiles(
+                smiles=smiles,
+                hashed_smiles=hashed_smiles,
+                template_sets=template_sets
+            ) for smiles, hashed_smiles in zip(smiles_list, hashed_smiles_list)
+        }
@@ -0,0 +1,202 @@
+import contextvars
+import os
+import time
+import uuid
+from fastapi import Request, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+from pymongo import monitoring
+from typing import Any, Awaitable, Callable
+
+# Prometheus metrics of the gateway and the celery workers, exposed on
+# /api/admin/metrics. If PROMETHEUS_MULTIPROC_DIR is set (to a directory shared
+# by the app and the workers), the metrics of all processes are aggregated;
+# otherwise only those of the serving process are exposed.
+
+TRACE_ID_HEADER = "X-Request-ID"
+# Trace id of the request being handled, forwarded to the backends and tasks
+trace_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "trace_id", default=None)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+    120.0, 300.0, 600.0
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUEST_LATENCY = Histogram(
+    "askcos_request_latency_seconds",
+    "Latency of the gateway requests, per route",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS
+)
+REQUEST_SIZE = Histogram(
+    "askcos_request_size_bytes",
+    "Size of the gateway request bodies, per route",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS
+)
+BACKEND_LATENCY = Histogram(
+    "askcos_backend_latency_seconds",
+    "Latency of the round-trips from the wrappers to the backends, through their "
+    "sync (call_raw) or async (call_raw_async) HTTP clients",
+    ["wrapper", "method", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "askcos_cache_requests_total",
+    "Cache lookups per cache_controller module, by tier hit or miss",
+    ["module", "result"]
+)
+MONGO_LATENCY = Histogram(
+    "askcos_mongo_command_seconds",
+    "Latency of the MongoDB commands, per database and collection",
+    ["database", "collection", "command", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+CELERY_QUEUE_WAIT = Histogram(
+    "askcos_celery_queue_wait_seconds",
+    "Time between the publishing of a celery task and the start of its run",
+    ["task"],
+    buckets=LATENCY_BUCKETS
+)
+CELERY_RUN_TIME = Histogram(
+    "askcos_celery_run_seconds",
+    "Run time of the celery tasks",
+    ["task", "state"],
+    buckets=LATENCY_BUCKETS
+)
+
+# Custom celery message headers
+SENT_AT_HEADER = "askcos_sent_at"
+TRACE_ID_TASK_HEADER = "askcos_trace_id"
+
+
+def get_trace_id() -> str | None:
+    return trace_id_var.get()
+
+
+def observe_backend_call(
+    wrapper: str,
+    method: str,
+    start: float,
+    status_code: int | None
+) -> None:
+    """
+    Observe the BACKEND_LATENCY of a round-trip to a backend, started at start
+    (time.perf_counter()); status_code is None if no response was received.
+    """
+    outcome = "success" if status_code is not None and status_code < 400 else "error"
+    BACKEND_LATENCY.labels(wrapper, method, outcome).observe(time.perf_counter() - start)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Observes MONGO_LATENCY for every command of every MongoClient"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # e.g., getMore, whose value is the cursor id
+            collection = event.command.get("collection", "")
+        self._collections[event.request_id] = collection
+
+    def _observe(self, event: Any, outcome: str) -> None:
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(
+            event.database_name, collection, event.command_name, outcome
+        ).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._observe(event, outcome="success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._observe(event, outcome="error")
+
+
+# Applies to the MongoClients created from here on
+monitoring.register(MongoCommandListener())
+
+
+async def trace_requests(
+    request: Request,
+    call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """
+    Middleware setting the trace id of the request (from the X-Request-ID
+    header, or a new one) and observing REQUEST_SIZE and REQUEST_LATENCY
+    """
+    trace_id = request.headers.get(TRACE_ID_HEADER) or uuid.uuid4().hex
+    token = trace_id_var.set(trace_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        trace_id_var.reset(token)
+
+    # label by the route template rather than the path, to bound the cardinality
+    route = request.scope.get("route")
+    route = route.path if route is not None else "unmatched"
+    REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - start)
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        REQUEST_SIZE.labels(request.method, route).observe(int(content_length))
+    response.headers[TRACE_ID_HEADER] = trace_id
+
+    return response
+
+
+def on_task_publish(headers: dict) -> None:
+    headers[SENT_AT_HEADER] = time.time()
+    trace_id = get_trace_id()
+    if trace_id:
+        headers[TRACE_ID_TASK_HEADER] = trace_id
+
+
+def _get_task_header(request: Any, name: str) -> Any:
+    # custom headers are request attributes, or under request.headers in newer celery
+    value = getattr(request, name, None)
+    if value is None:
+        value = (getattr(request, "headers", None) or {}).get(name)
+
+    return value
+
+
+def on_task_prerun(task: Any) -> None:
+    sent_at = _get_task_header(task.request, SENT_AT_HEADER)
+    if sent_at is not None:
+        CELERY_QUEUE_WAIT.labels(task.name).observe(max(time.time() - sent_at, 0.0))
+    trace_id_var.set(_get_task_header(task.request, TRACE_ID_TASK_HEADER))
+    task.request.askcos_started_at = time.perf_counter()
+
+
+def on_task_postrun(task: Any, state: str | None) -> None:
+    started_at = getattr(task.request, "askcos_started_at", None)
+    if started_at is not None:
+        CELERY_RUN_TIME.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - started_at)
+    trace_id_var.set(None)
+
+
+def get_metrics() -> Response:
+    """
+    API endpoint for the Prometheus metrics of the gateway and the workers
+
+    Method: GET
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
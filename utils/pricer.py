@@ -1,16 +1,51 @@
+import json
+import multiprocessing
+import numpy as np
 import os
 import pandas as pd
+import socket
+import sys
+import threading
+import time
+import uuid
 from bson import Binary, ObjectId
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 from configs import db_config
-from fastapi import Query
-from pymongo import errors, MongoClient
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Query
+from pymongo import DeleteMany, errors, InsertOne, MongoClient, UpdateOne
 from pymongo.collection import ReturnDocument
 from rdkit import Chem
 from rdkit.Chem import AllChem
-from typing import Annotated, Any
+from typing import Annotated, Any, Iterable, Iterator
 from utils import register_util
 import hashlib
+from utils.cache import LRUCache, SingleFlight
+from utils.fingerprint_index import BUILD_CHUNK_SIZE, pack_bits
 from utils.similarity_search_utils import sim_search_aggregate_buyables, sim_search_buyables
+from utils.snapshot_utils import (
+    get_bytes_from_blob,
+    get_string_from_blob,
+    load_arrays,
+    load_meta,
+    resolve_path,
+    save_arrays,
+    snapshot_lock,
+    strings_to_blob
+)
+
+# Default size of rdkit pattern fingerprints, as stored in buyables["pfp"]
+PATTERN_FP_LEN = 2048
+# Seconds for which the buyables version (and thus the snapshot) is trusted
+VERSION_CHECK_INTERVAL = 30
+# Substructure matching is spread over the process pool above this many candidates
+MIN_CANDIDATES_FOR_POOL = 2000
+# SMARTS results with more matches are only cached in-process (Mongo doc size limit)
+MAX_PERSISTED_MATCHES = 100000
+SMARTS_CACHE_COLLECTION_BYTES = 512 * 1024 * 1024
+# Seconds before a precompute_mols() run that stopped checkpointing can be taken over
+PRECOMPUTE_LEASE_SECONDS = 600
 
 
 @register_util(name="pricer")
@@ -19,7 +54,8 @@ class Pricer:
     prefixes = ["pricer"]
     methods_to_bind: dict[str, list[str]] = {
         "lookup_smarts": ["POST"],
-        "lookup_smiles": ["POST"]
+        "lookup_smiles": ["POST"],
+        "lookup_smiles_list": ["POST"]
     }
     # methods_to_bind: dict[str, list[str]] = {
     #     "lookup_smiles": ["POST"],
@@ -41,7 +77,10 @@ class Pricer:
             self._pricer = MongoPricer(
                 config=db_config.MONGO,
                 database=util_config["database"],
-                collection=util_config["collection"]
+                collection=util_config["collection"],
+                snapshot_dir=util_config.get("snapshot_dir", ""),
+                smarts_cache_size=util_config.get("smarts_cache_size", 1000),
+                num_workers=util_config.get("num_workers", 4)
             )
             self.collection = self._pricer.collection
         elif engine == "file":
@@ -53,6 +92,10 @@ class Pricer:
             raise ValueError(f"Unsupported pricer engine: {engine}! "
                              f"Only 'db' or 'file' is supported")
 
+    def shutdown(self) -> None:
+        if isinstance(self._pricer, MongoPricer):
+            self._pricer.shutdown()
+
     @staticmethod
     def canonicalize(smiles: str, isomeric_smiles: bool = True):
         """
@@ -124,10 +167,13 @@ class Pricer:
             dict: mapping from input SMILES to data dict
         """
         if canonicalize:
-            smiles_list = [
+            # canonicalize each unique SMILES only once
+            smiles_list = list({
                 self.canonicalize(smi, isomeric_smiles=isomeric_smiles) or smi
-                for smi in smiles_list
-            ]
+                for smi in set(smiles_list)
+            })
+        else:
+            smiles_list = list(set(smiles_list))
 
         return self._pricer.lookup_smiles_list(smiles_list=smiles_list, source=source)
 
@@ -321,6 +367,7 @@ class Pricer:
         )
         if result and result.get("_id"):
             result["_id"] = str(result["_id"])
+        self._pricer.bump_version()
 
         return result
 
@@ -334,6 +381,7 @@ class Pricer:
 
         delete_result = self.collection.delete_one({"_id": _id})
         # delete_result = self.collection.delete_one({"_id": ObjectId(_id)})
+        self._pricer.bump_version()
 
         return delete_result.deleted_count > 0
 
@@ -345,6 +393,14 @@ class Pricer:
         assert isinstance(self._pricer, MongoPricer), \
             f"add() is only implemented for MongoPricer"
 
+        result = self._add(new_doc, allow_overwrite=allow_overwrite)
+        self._pricer.bump_version()
+
+        return result
+
+    def _add(self, new_doc: dict, allow_overwrite: bool = True) -> dict:
+        """add() without the version bump, so that add_many() bumps it only once"""
+
         new_doc["smiles"] = self.canonicalize(new_doc["smiles"])
         smi, source = new_doc["smiles"], new_doc["source"]
         smi_vendor = f"{smi}{source}"
@@ -395,7 +451,7 @@ class Pricer:
         }
 
         for new_doc in new_docs:
-            res = self.add(new_doc, allow_overwrite=allow_overwrite)
+            res = self._add(new_doc, allow_overwrite=allow_overwrite)
             if not res["error"]:
                 if res["doc"]:
                     if res["updated"]:
@@ -409,12 +465,223 @@ class Pricer:
             else:
                 result["error"] = res["error"]
                 result["error_count"] += 1
+        self._pricer.bump_version()
 
         return result
 
 
+# Snapshot last loaded by a process pool worker, reloaded when its path changes
+_worker_snapshot = None
+
+
+def _match_substructures(
+    snapshot: "BuyablesSnapshot",
+    smarts: str,
+    rows: Iterable[int]
+) -> list[int]:
+    """Rows of the snapshot whose mols match the SMARTS."""
+    pattern = Chem.MolFromSmarts(smarts)
+
+    return [
+        int(i) for i in rows
+        if Chem.Mol(snapshot.get_mol_binary(i)).HasSubstructMatch(
+            pattern, useChirality=True)
+    ]
+
+
+def _match_snapshot_rows(task: tuple[str, str, np.ndarray]) -> list[int]:
+    """
+    Process pool task: rows of the snapshot saved at path whose mols match
+    the SMARTS, with the mols read from the worker's own memory map.
+    """
+    global _worker_snapshot
+    path, smarts, rows = task
+    if _worker_snapshot is None or _worker_snapshot.path != path:
+        _worker_snapshot = BuyablesSnapshot.load(path)
+
+    return _match_substructures(_worker_snapshot, smarts, rows)
+
+
+def _compute_buyables_fps(
+    batch: list[tuple[Any, str]]
+) -> list[tuple[Any, bytes | None, list[int], list[int]]]:
+    """Process pool task: (_id, mol binary, mfp bits, pfp bits) for the SMILES."""
+    results = []
+    for _id, smiles in batch:
+        rdmol = Chem.MolFromSmiles(smiles)
+        if rdmol is None:
+            # still marked as processed, with empty fingerprints
+            results.append((_id, None, [], []))
+            continue
+        mfp = list(
+            AllChem.GetMorganFingerprintAsBitVect(rdmol, 2, nBits=2048).GetOnBits()
+        )
+        pfp = list(Chem.rdmolops.PatternFingerprint(rdmol).GetOnBits())
+        results.append((_id, rdmol.ToBinary(), mfp, pfp))
+
+    return results
+
+
+def _get_batches(cursor: Iterable[dict], batch_size: int
+                 ) -> Iterator[list[tuple[Any, str]]]:
+    batch = []
+    for doc in cursor:
+        batch.append((doc["_id"], doc.get("smiles") or ""))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BuyablesSnapshot:
+    """
+    Local copy of the buyables with precomputed mols, i.e., the unique SMILES,
+    their rdkit Mol binaries and packed pattern fingerprints, for substructure
+    search without streaming the pickled mols out of Mongo for every query.
+    Saved as .npy files and memory-mapped, like HistorianSnapshot, by
+    scripts/precompute_buyables.py rather than by the API processes.
+    """
+    FILES = ["smiles", "smiles_offsets", "mols", "mols_offsets", "pfps", "pfp_counts"]
+
+    def __init__(
+        self,
+        smiles: np.ndarray,
+        smiles_offsets: np.ndarray,
+        mols: np.ndarray,
+        mols_offsets: np.ndarray,
+        pfps: np.ndarray,
+        pfp_counts: np.ndarray
+    ):
+        self.smiles = smiles
+        self.smiles_offsets = smiles_offsets
+        self.mols = mols
+        self.mols_offsets = mols_offsets
+        self.pfps = pfps
+        self.pfp_counts = pfp_counts
+        # resolved version directory, when loaded from one
+        self.path = None
+
+    def __len__(self) -> int:
+        return len(self.smiles_offsets) - 1
+
+    @classmethod
+    def build(
+        cls,
+        docs: Iterable[dict],
+        num_docs: int | None = None
+    ) -> "BuyablesSnapshot":
+        """
+        Build the snapshot from buyables documents with "smiles", "mol" and
+        "pfp" keys, keeping the first document for each SMILES.
+
+        The pattern fingerprints are packed BUILD_CHUNK_SIZE at a time into
+        a preallocated array (of num_docs rows if known, grown as needed),
+        as in PackedFingerprintIndex.build().
+        """
+        smiles_list = []
+        mols = bytearray()
+        mols_lengths = []
+        pfp_counts = []
+        pfps = np.zeros(
+            (max(num_docs or 0, BUILD_CHUNK_SIZE), PATTERN_FP_LEN // 64),
+            dtype=np.uint64
+        )
+        num_packed = 0
+        bits_batch = []
+        seen = set()
+
+        def pack_batch():
+            nonlocal pfps, num_packed
+            if num_packed + len(bits_batch) > len(pfps):
+                grown = np.zeros(
+                    (max(2 * len(pfps), num_packed + len(bits_batch)), pfps.shape[1]),
+                    dtype=np.uint64
+                )
+                grown[:num_packed] = pfps[:num_packed]
+                pfps = grown
+            pfps[num_packed:num_packed + len(bits_batch)] = pack_bits(
+                bits_batch, fp_size=PATTERN_FP_LEN)
+            num_packed += len(bits_batch)
+            bits_batch.clear()
+
+        for doc in docs:
+            if doc["smiles"] in seen:
+                continue
+            seen.add(doc["smiles"])
+            smiles_list.append(doc["smiles"])
+            mols += doc["mol"]
+            mols_lengths.append(len(doc["mol"]))
+            pfp_counts.append(len(doc["pfp"]["bits"]))
+            bits_batch.append(doc["pfp"]["bits"])
+            if len(bits_batch) == BUILD_CHUNK_SIZE:
+                pack_batch()
+        if bits_batch:
+            pack_batch()
+
+        smiles, smiles_offsets = strings_to_blob(smiles_list)
+        mols_offsets = np.zeros(len(mols_lengths) + 1, dtype=np.int64)
+        np.cumsum(mols_lengths, out=mols_offsets[1:])
+
+        return cls(
+            smiles,
+            smiles_offsets,
+            np.frombuffer(mols, dtype=np.uint8),
+            mols_offsets,
+            pfps[:num_packed],
+            np.array(pfp_counts, dtype=np.int32)
+        )
+
+    def save(self, path: str, meta: dict = None) -> None:
+        save_arrays(
+            path=path,
+            arrays={name: getattr(self, name) for name in self.FILES},
+            meta=meta
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "BuyablesSnapshot":
+        snapshot = cls(**load_arrays(path=path, names=cls.FILES))
+        snapshot.path = path
+
+        return snapshot
+
+    def get_smiles(self, i: int) -> str:
+        return get_string_from_blob(self.smiles, self.smiles_offsets, i)
+
+    def get_mol_binary(self, i: int) -> bytes:
+        return get_bytes_from_blob(self.mols, self.mols_offsets, i)
+
+    def screen(self, query_bits: list[int], chunk_size: int = 65536) -> np.ndarray:
+        """
+        Indices of the entries whose pattern fingerprints contain all the
+        query bits, i.e., the candidates for a substructure match.
+        """
+        query_fp = pack_bits([query_bits], fp_size=PATTERN_FP_LEN)[0]
+        candidates = []
+        for start in range(0, len(self), chunk_size):
+            end = min(start + chunk_size, len(self))
+            is_superset = np.all(
+                (self.pfps[start:end] & query_fp) == query_fp, axis=1)
+            is_superset &= self.pfp_counts[start:end] >= len(query_bits)
+            candidates.append(np.nonzero(is_superset)[0] + start)
+
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+
+        return np.concatenate(candidates)
+
+
 class MongoPricer:
-    def __init__(self, config: dict, database: str, collection: str):
+    def __init__(
+        self,
+        config: dict,
+        database: str,
+        collection: str,
+        snapshot_dir: str = "",
+        smarts_cache_size: int = 1000,
+        num_workers: int = 4
+    ):
         """
         Initialize database connection.
         """
@@ -428,8 +695,31 @@ class MongoPricer:
             self.collection = self.client[database][collection]
             self.db = self.client[database]
 
-        self.smarts_query_index = {}
         self.count_collection = None
+        self._mols_precomputed = False
+
+        # The buyables version is the document count plus a counter bumped by
+        # Pricer writes; snapshots and SMARTS results are keyed by the version
+        self.version_collection = self.db["pricer_versions"]
+        self._version = None
+        self._version_checked = 0.0
+
+        self.snapshot_dir = snapshot_dir
+        self.snapshot = None
+        self.snapshot_version = None
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_thread = None
+
+        self.smarts_cache_size = smarts_cache_size
+        self.smarts_query_index = LRUCache(max_size=smarts_cache_size)
+        self._smarts_cache_collection = None
+        self._smarts_flights = SingleFlight()
+
+        self.num_workers = num_workers
+        self._pool = None
+
+        self.precompute_collection = self.db["pricer_precompute"]
+        self._lease_owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4()}"
 
     @staticmethod
     def _source_to_query(source: list[str] | str | None) -> list[str] | None:
@@ -517,72 +807,439 @@ class MongoPricer:
         return result
 
     def is_mols_precomputed(self) -> bool:
+        # only the positive result is cached, mols are never un-computed
+        if self._mols_precomputed:
+            return True
+
         query = {"mol": {"$ne": None}}
         result = self.collection.find_one(query)
         if result:
+            self._mols_precomputed = True
             return True
         else:
             return False
 
-    def precompute_mols(self, batch_size: int = 10000) -> None:
+    def ensure_mols_precomputed(self) -> None:
         """
-        Stores rdkit Mol objects as a Binary,a molecular fingerprint and bit
-        counts, and a pattern fingerprint and bit counts for each molecule in
-        the database
+        Fail the request if the mols have not been precomputed yet. The run is
+        left to scripts/precompute_buyables.py, outside the API processes.
         """
-        print(f"{self.collection.count_documents(filter={})} "
-              f"documents in the buyables database")
-        idxs = [s["_id"] for s in self.collection.find({}, {"_id": 1}) if s]
-        full_batch_idx = int(len(idxs) / batch_size) * batch_size
-        if batch_size > len(idxs):
-            batched_idxs = [idxs]
-        else:
-            splits = list(range(0, full_batch_idx, batch_size)) + [len(idxs)]
-            batched_idxs = [idxs[i:j] for i, j in zip(splits[:-1], splits[1:])]
-
-        document_list = []
-        print(f"Precomputing mols in {len(batched_idxs)} batches")
-        mfp_counts = {}
-        for i, batch in enumerate(batched_idxs):
-            query = {"_id": {"$in": batch}}
-            documents = self.collection.find(query)
-            for document in documents:
-                rdmol = Chem.MolFromSmiles(document["smiles"])
-                mfp = list(
-                    AllChem.GetMorganFingerprintAsBitVect(
-                        rdmol, 2, nBits=2048
-                    ).GetOnBits()
+        if self.is_mols_precomputed():
+            return
+
+        raise HTTPException(
+            status_code=503,
+            detail="Fingerprints for the buyables have not been precomputed, "
+                   "please run scripts/precompute_buyables.py"
+        )
+
+    def _acquire_precompute_lease(self) -> bool:
+        """
+        Take (or renew) the lease on the precompute checkpoint, so that only one
+        process at a time runs precompute_mols() for the collection.
+        """
+        now = datetime.utcnow()
+        try:
+            self.precompute_collection.update_one(
+                {
+                    "_id": self.collection.name,
+                    "$or": [
+                        {"lease_until": {"$lt": now}},
+                        {"lease_owner": self._lease_owner}
+                    ]
+                },
+                {"$set": {
+                    "lease_owner": self._lease_owner,
+                    "lease_until": now + timedelta(seconds=PRECOMPUTE_LEASE_SECONDS)
+                }},
+                upsert=True
+            )
+        except errors.DuplicateKeyError:
+            return False
+
+        return True
+
+    def get_version(self) -> str:
+        """
+        Version of the buyables collection, rechecked at most every
+        VERSION_CHECK_INTERVAL seconds.
+        """
+        if (
+            self._version is None
+            or time.monotonic() - self._version_checked > VERSION_CHECK_INTERVAL
+        ):
+            doc = self.version_collection.find_one({"_id": self.collection.name})
+            counter = doc["version"] if doc else 0
+            count = self.collection.estimated_document_count()
+            self._version = f"{count}.{counter}"
+            self._version_checked = time.monotonic()
+
+        return self._version
+
+    def bump_version(self) -> None:
+        """Mark the buyables as changed, invalidating snapshots and SMARTS results."""
+        self.version_collection.update_one(
+            {"_id": self.collection.name},
+            {"$inc": {"version": 1}},
+            upsert=True
+        )
+        self._version = None
+
+    def load_snapshot(self, version: str) -> BuyablesSnapshot | None:
+        """
+        Get the local buyables snapshot for the version, if saved to
+        snapshot_dir (None otherwise). A missing or stale snapshot is rebuilt
+        in the background, so that requests are not held up by the build.
+        """
+        if self.snapshot is not None and self.snapshot_version == version:
+            return self.snapshot
+        if not self.snapshot_dir:
+            return None
+
+        with self._snapshot_lock:
+            if self.snapshot is not None and self.snapshot_version == version:
+                return self.snapshot
+
+            path = resolve_path(os.path.join(self.snapshot_dir, self.collection.name))
+            meta = load_meta(path=path)
+            if meta is None or meta.get("version") != version:
+                self._refresh_snapshot_in_background()
+                return None
+            try:
+                self.snapshot = BuyablesSnapshot.load(path)
+            except FileNotFoundError:
+                return None     # replaced twice since resolved
+            self.snapshot_version = version
+
+        return self.snapshot
+
+    def _refresh_snapshot_in_background(self) -> None:
+        """Called with _snapshot_lock held; at most one refresh at a time."""
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        print("Buyables snapshot missing or out of date, SMARTS lookups are "
+              "searched in Mongo until it is rebuilt in the background")
+        self._snapshot_thread = threading.Thread(
+            target=self._refresh_snapshot,
+            name="buyables-snapshot",
+            daemon=True
+        )
+        self._snapshot_thread.start()
+
+    def _refresh_snapshot(self) -> None:
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            print(f"Failed to rebuild the buyables snapshot: {e}")
+
+    def save_snapshot(self) -> None:
+        """
+        Build the buyables snapshot for the current version and save it to
+        snapshot_dir for the API processes, unless already saved.
+        """
+        if not self.snapshot_dir:
+            raise ValueError("Saving the buyables snapshot requires a snapshot_dir")
+
+        self._version = None
+        version = self.get_version()
+        path = os.path.join(self.snapshot_dir, self.collection.name)
+        with snapshot_lock(path):
+            meta = load_meta(path=resolve_path(path))
+            if meta is not None and meta.get("version") == version:
+                print(f"Buyables snapshot in {path} is up to date")
+                return
+
+            start = time.time()
+            cursor = self.collection.find(
+                {"mol": {"$ne": None}},
+                {"_id": 0, "smiles": 1, "mol": 1, "pfp": 1}
+            )
+            snapshot = BuyablesSnapshot.build(
+                cursor, num_docs=self.collection.estimated_document_count())
+            snapshot.save(path, meta={"version": version})
+            print(f"Saved buyables snapshot with {len(snapshot)} mols to {path} "
+                  f"in {time.time() - start: .2f} seconds")
+
+    def _get_smarts_cache_collection(self):
+        if self._smarts_cache_collection is None:
+            name = f"{self.collection.name}_smarts_cache"
+            try:
+                # capped, so that old results (e.g., of old versions) are evicted
+                self.db.create_collection(
+                    name,
+                    capped=True,
+                    size=SMARTS_CACHE_COLLECTION_BYTES,
+                    max=self.smarts_cache_size
+                )
+            except errors.CollectionInvalid:
+                pass            # already created
+            self._smarts_cache_collection = self.db[name]
+
+        return self._smarts_cache_collection
+
+    def _get_cached_smarts_matches(self, key: str) -> list[str]:
+        try:
+            return json.loads(self.smarts_query_index.get(key))
+        except KeyError:
+            pass
+
+        try:
+            doc = self._get_smarts_cache_collection().find_one({"_id": key})
+        except errors.PyMongoError:
+            doc = None
+        if doc is None:
+            raise KeyError(key)
+        self.smarts_query_index.set(key, json.dumps(doc["smiles"]))
+
+        return doc["smiles"]
+
+    def _cache_smarts_matches(
+        self,
+        key: str,
+        smarts: str,
+        version: str,
+        matched_smiles: list[str]
+    ) -> None:
+        self.smarts_query_index.set(key, json.dumps(matched_smiles))
+        if len(matched_smiles) > MAX_PERSISTED_MATCHES:
+            return
+
+        try:
+            self._get_smarts_cache_collection().insert_one({
+                "_id": key,
+                "smarts": smarts,
+                "version": version,
+                "smiles": matched_smiles,
+                "created": datetime.utcnow()
+            })
+        except errors.PyMongoError:
+            pass                # e.g., inserted concurrently by another process
+
+    def _search_and_cache_smarts(self, key: str, smarts: str, version: str) -> list[str]:
+        try:
+            # cached by a flight that landed since the lookup missed
+            return self._get_cached_smarts_matches(key)
+        except KeyError:
+            pass
+
+        matched_smiles = self._search_smarts(smarts, version)
+        self._cache_smarts_matches(
+            key=key,
+            smarts=smarts,
+            version=version,
+            matched_smiles=matched_smiles
+        )
+
+        return matched_smiles
+
+    def _search_smarts(self, smarts: str, version: str) -> list[str]:
+        """
+        Full substructure search over the local snapshot, or over Mongo
+        if there is no snapshot of the current version.
+        """
+        snapshot = self.load_snapshot(version)
+        if snapshot is None:
+            return self._search_smarts_in_mongo(smarts)
+
+        pattern = Chem.MolFromSmarts(smarts)
+        query_bits = list(Chem.rdmolops.PatternFingerprint(pattern).GetOnBits())
+        candidates = snapshot.screen(query_bits)
+
+        if self.num_workers > 1 and len(candidates) >= MIN_CANDIDATES_FOR_POOL:
+            if self._pool is None:
+                # not forked from this multi-threaded process
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("forkserver")
                 )
-                pfp = list(Chem.rdmolops.PatternFingerprint(rdmol).GetOnBits())
-                document["mol"] = Binary(rdmol.ToBinary())
-                document["mfp"] = {"bits": mfp, "count": len(mfp)}
-                document["pfp"] = {"bits": pfp, "count": len(pfp)}
-                document_list.append(document)
+            # only the row indices are sent, the workers map the snapshot files
+            chunk_size = -(-len(candidates) // (self.num_workers * 4))
+            results = self._pool.map(
+                _match_snapshot_rows,
+                [(snapshot.path, smarts, candidates[start:start+chunk_size])
+                 for start in range(0, len(candidates), chunk_size)]
+            )
+            matched = [i for result in results for i in result]
+        else:
+            matched = _match_substructures(snapshot, smarts, candidates)
+
+        return [snapshot.get_smiles(i) for i in matched]
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _search_smarts_in_mongo(self, smarts: str) -> list[str]:
+        """Substructure search over the pattern fingerprints screened in Mongo."""
+        pattern = Chem.MolFromSmarts(smarts)
+        query_fp = list(Chem.rdmolops.PatternFingerprint(pattern).GetOnBits())
+        query = {
+            "mol": {"$ne": None},
+            "pfp.count": {"$gte": len(query_fp)},
+            "pfp.bits": {"$all": query_fp},
+        }
+        cursor = self.collection.aggregate(
+            [
+                {"$match": query},
+                {
+                    "$group": {
+                        "_id": "$smiles",
+                        "mol": {"$first": "$mol"},
+                    }
+                },
+            ]
+        )
+
+        return [
+            doc["_id"] for doc in cursor
+            if Chem.Mol(doc["mol"]).HasSubstructMatch(pattern, useChirality=True)
+        ]
 
-                for bit in mfp:
-                    mfp_counts[bit] = mfp_counts.get(bit, 0) + 1
-            self.collection.delete_many(query)
+    def precompute_mols(
+        self,
+        batch_size: int = 10000,
+        num_workers: int | None = None,
+        incremental: bool = True
+    ) -> None:
+        """
+        Stores rdkit Mol objects as a Binary,a molecular fingerprint and bit
+        counts, and a pattern fingerprint and bit counts for each molecule in
+        the database
 
-            print(f"Done computing RDK mol objects for batch "
-                  f"{i} out of {len(batched_idxs)}")
-            self.collection.insert_many(document_list)
-            document_list = []
+        The fingerprints are computed in a process pool and written in place
+        with bulk $set updates. Progress (with the running bit counts) is
+        checkpointed before every batch is written, together with the _ids of
+        the batch, so that an interrupted run rewrites the last batch without
+        counting it twice and resumes where it stopped. In incremental mode,
+        only the documents without "mfp" are processed and their bit counts
+        are added to the existing ones.
+        """
+        if not self._acquire_precompute_lease():
+            print("precompute_mols() is already running in another process")
+            return
+
+        checkpoint = self.precompute_collection.find_one({"_id": self.collection.name})
+        if checkpoint.get("incremental") != incremental or "run_id" not in checkpoint:
+            checkpoint["run_id"] = str(uuid.uuid4())
+            checkpoint["mfp_counts"] = {}
+            checkpoint["processed"] = 0
+            checkpoint["pending_ids"] = []
+        run_id = checkpoint["run_id"]
+        mfp_counts = Counter({int(k): v for k, v in checkpoint["mfp_counts"].items()})
+        processed = checkpoint["processed"]
+
+        pending_ids = checkpoint.get("pending_ids") or []
+        if pending_ids:
+            # counted in the checkpoint, but possibly not written before stopping
+            cursor = self.collection.find({"_id": {"$in": pending_ids}}, {"smiles": 1})
+            batch = [(doc["_id"], doc.get("smiles") or "") for doc in cursor]
+            self.collection.bulk_write(
+                self._get_precompute_operations(
+                    _compute_buyables_fps(batch), run_id, incremental),
+                ordered=False
+            )
+            print(f"Rewrote the {len(batch)} documents of the interrupted batch")
 
+        if incremental:
+            query = {"mfp": {"$exists": False}}
+        else:
+            query = {"precompute_run": {"$ne": run_id}}
         print(f"{self.collection.count_documents(filter={})} "
-              f"documents in the buyables database")
+              f"documents in the buyables database, "
+              f"{self.collection.count_documents(filter=query)} to precompute "
+              f"({processed} done before resuming)")
+        sys.stdout.flush()
+
+        start = time.time()
+        num_workers = num_workers or self.num_workers
+        with ProcessPoolExecutor(max_workers=num_workers) as pool, \
+                self.collection.find(
+                    query, {"_id": 1, "smiles": 1}, no_cursor_timeout=True
+                ) as cursor:
+            pending = deque()
+            batches = _get_batches(cursor, batch_size)
+            while True:
+                # keep a bounded number of batches in flight
+                for batch in batches:
+                    pending.append(pool.submit(_compute_buyables_fps, batch))
+                    if len(pending) >= 2 * num_workers:
+                        break
+                if not pending:
+                    break
+
+                results = pending.popleft().result()
+                if not self._acquire_precompute_lease():
+                    print("precompute_mols() lost its lease to another process, "
+                          "stopping")
+                    for future in pending:
+                        future.cancel()
+                    return
+
+                for _id, mol, mfp, pfp in results:
+                    mfp_counts.update(mfp)
+                processed += len(results)
+                # counts first, so that a batch written is always counted
+                self.precompute_collection.update_one(
+                    {"_id": self.collection.name},
+                    {"$set": {
+                        "run_id": run_id,
+                        "incremental": incremental,
+                        "mfp_counts": {str(k): v for k, v in mfp_counts.items()},
+                        "processed": processed,
+                        "pending_ids": [_id for _id, _, _, _ in results]
+                    }}
+                )
+                self.collection.bulk_write(
+                    self._get_precompute_operations(results, run_id, incremental),
+                    ordered=False
+                )
+                print(f"Precomputed mols for {processed} documents "
+                      f"in {time.time() - start: .2f} seconds")
+                sys.stdout.flush()
 
         self.count_collection = self.db["count_collection"]
-        self.count_collection.delete_many({})
+        if incremental:
+            operations = [
+                UpdateOne({"_id": k}, {"$inc": {"count": v}}, upsert=True)
+                for k, v in mfp_counts.items()
+            ]
+        else:
+            operations = [DeleteMany({})] + [
+                InsertOne({"_id": k, "count": v}) for k, v in mfp_counts.items()
+            ]
+        if operations:
+            self.count_collection.bulk_write(operations, ordered=True)
         print(f"{self.count_collection.count_documents(filter={})} "
               f"documents in the counts database")
-        for k, v in mfp_counts.items():
-            self.count_collection.insert_one({"_id": k, "count": v})
+
         self.collection.create_index("mfp.bits")
         self.collection.create_index("mfp.count")
         self.collection.create_index("pfp.bits")
         self.collection.create_index("pfp.count")
 
         print("Created new indexes in the database")
+        self.precompute_collection.delete_one({"_id": self.collection.name})
+        self.bump_version()
+
+    @staticmethod
+    def _get_precompute_operations(
+        results: list[tuple[Any, bytes | None, list[int], list[int]]],
+        run_id: str,
+        incremental: bool
+    ) -> list[UpdateOne]:
+        operations = []
+        for _id, mol, mfp, pfp in results:
+            doc = {
+                "mol": Binary(mol) if mol is not None else None,
+                "mfp": {"bits": mfp, "count": len(mfp)},
+                "pfp": {"bits": pfp, "count": len(pfp)}
+            }
+            if not incremental:
+                doc["precompute_run"] = run_id
+            operations.append(UpdateOne({"_id": _id}, {"$set": doc}))
+
+        return operations
 
     def lookup_smarts(
         self,
@@ -603,73 +1260,20 @@ class MongoPricer:
             Implementation adapted from https://github.com/rdkit/mongo-rdkit/blob
                 /master/mongordkit/Search/substructure.py
         """
-        if not self.is_mols_precomputed():
-            self.precompute_mols()
+        self.ensure_mols_precomputed()
 
-        if smarts in self.smarts_query_index.keys():
-            matched_ids = self.smarts_query_index[smarts]
-            query = {"smiles": {"$in": matched_ids}}
-            cursor = self.collection.aggregate(
-                [
-                    {"$match": query},
-                    {
-                        "$group": {
-                            "_id": "$_id",
-                            "smiles": {"$first": "$smiles"},
-                        }
-                    },
-                ]
-            )
-            # result = list(result)
-            result = []
-            for doc in cursor:
-                trimmed_doc = {
-                    "_id": str(doc["_id"]),
-                    "smiles": doc["smiles"]
-                }
-                result.append(trimmed_doc)
-
-        else:
-            pattern = Chem.MolFromSmarts(smarts)
-            query_fp = list(Chem.rdmolops.PatternFingerprint(pattern).GetOnBits())
-            qfp_len = len(query_fp)
-            matched_ids = []
-            query = {
-                "mol": {"$ne": None},
-                "pfp.count": {"$gte": qfp_len},
-                "pfp.bits": {"$all": query_fp},
-            }
-
-            cursor = self.collection.aggregate(
-                [
-                    {"$match": query},
-                    {
-                        "$group": {
-                            "_id": "$smiles",
-                            "smiles": {"$first": "$smiles"},
-                            "mol": {"$first": "$mol"},
-                        }
-                    },
-                ]
-            )
-
-            # Perform substructure matching
-            result = []
-            for doc in cursor:
-                try:
-                    rdmol = Chem.Mol(doc["mol"])
-                    if rdmol.HasSubstructMatch(pattern, useChirality=True):
-                        matched_ids.append(doc["_id"])
-                        # Not returning the "mol"; serialization issue with fastapi
-                        trimmed_doc = {
-                            "_id": str(doc["_id"]),
-                            "smiles": doc["smiles"]
-                        }
-                        result.append(trimmed_doc)
-                except KeyError as e:
-                    print("Key error {}, {}".format(e, doc["smiles"]))
+        version = self.get_version()
+        key = hashlib.sha256(f"{version}:{smarts}".encode("utf-8")).hexdigest()
+        try:
+            matched_smiles = self._get_cached_smarts_matches(key)
+        except KeyError:
+            # concurrent requests for the same SMARTS share a single search,
+            # which only lands once its result is cached
+            matched_smiles, _ = self._smarts_flights.do(
+                key, lambda: self._search_and_cache_smarts(key, smarts, version))
 
-            self.smarts_query_index[smarts] = matched_ids
+        # Not returning the "mol"; serialization issue with fastapi
+        result = [{"_id": smi, "smiles": smi} for smi in matched_smiles]
 
         if limit:
             result = result[:limit]
@@ -701,8 +1305,7 @@ class MongoPricer:
             the lookup speed, at the cost of accuracy (especially at lower
             similarity thresholds).
         """
-        if not self.is_mols_precomputed():
-            self.precompute_mols()
+        self.ensure_mols_precomputed()
 
         query_mol = Chem.MolFromSmiles(smiles)
         if method == "accurate":
@@ -736,6 +1339,8 @@ class FilePricer:
         """
         Load price data from local file.
         """
+        self.data = None
+        self.index = {}
         if os.path.isfile(path):
             self.path = path
             self.data = pd.read_json(
@@ -749,11 +1354,47 @@ class FilePricer:
         else:
             print(f"Buyables file does not exist: {path}")
 
-        if precompute_mols:
+        if precompute_mols and self.data is not None:
             self.data["mols"] = [Chem.MolFromSmiles(x) for x in self.data["smiles"]]
 
+        if self.data is not None:
+            self.index = self.build_index(self.data)
+            print(f"Indexed prices for {len(self.index)} unique SMILES")
+
         self.smarts_query_index = {}
 
+    @staticmethod
+    def build_index(data: pd.DataFrame) -> dict[str, dict[str, dict]]:
+        """
+        Build a hash index of smiles -> source -> lowest price row for that source.
+        """
+        cheapest = data.sort_values("ppg", kind="stable").drop_duplicates(
+            subset=["smiles", "source"], keep="first"
+        )
+        index = {}
+        for record in cheapest.to_dict(orient="records"):
+            index.setdefault(record["smiles"], {})[record["source"]] = record
+
+        return index
+
+    def _lookup_in_index(
+        self,
+        smiles: str,
+        source: list[str] | str | None = None
+    ) -> dict | None:
+        rows_by_source = self.index.get(smiles)
+        if not rows_by_source:
+            return None
+
+        if source is None:
+            rows = rows_by_source.values()
+        elif isinstance(source, list):
+            rows = [rows_by_source[s] for s in source if s in rows_by_source]
+        else:
+            rows = [rows_by_source[source]] if source in rows_by_source else []
+
+        return min(rows, key=lambda x: x["ppg"], default=None)
+
     def lookup_smiles(
         self,
         smiles: str,
@@ -765,30 +1406,30 @@ class FilePricer:
             # will not be included in query, and '' is a valid source value
             return None
 
-        if self.data is not None:
-            query = self.data["smiles"] == smiles
+        result = self._lookup_in_index(smiles=smiles, source=source)
+        if result is not None:
+            result = dict(result)
 
-            if source is not None:
-                if isinstance(source, list):
-                    query = query & (self.data["source"].isin(source))
-                else:
-                    query = query & (self.data["source"] == source)
-
-            results = self.data.loc[query]
-            if len(results.index):
-                idxmin = results["ppg"].idxmin()
-                return results.loc[idxmin].to_dict()
-            else:
-                return None
-        else:
-            return None
+        return result
 
     def lookup_smiles_list(
         self,
         smiles_list: list[str],
         source: list[str] | str | None = None
-    ):
-        raise NotImplementedError
+    ) -> dict[str, Any]:
+        if source == []:
+            return {}
+
+        result = {}
+        for smiles in smiles_list:
+            doc = self._lookup_in_index(smiles=smiles, source=source)
+            if doc is not None:
+                result[smiles] = {
+                    k: v for k, v in doc.items()
+                    if k in ["smiles", "ppg", "lead_time", "source", "properties"]
+                }
+
+        return result
 
     def lookup_smarts(
         self,
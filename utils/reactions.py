@@ -1,5 +1,5 @@
-import numpy as np
-import sys
+import os
+import threading
 import time
 from configs import db_config
 from pydantic import BaseModel
@@ -9,10 +9,14 @@ from rdkit.Chem import AllChem
 from schemas.base import LowerCamelAliasModel
 from typing import Any
 from utils import register_util
+from utils.fingerprint_index import PackedFingerprintIndex
 from utils.similarity_search_utils import sim_search, sim_search_aggregate
+from utils.snapshot_utils import resolve_path, snapshot_lock
 
 DEFAULT_MORGAN_RADIUS = 2
 DEFAULT_MORGAN_LEN = 2048
+# Seconds for which a loaded fingerprint index is trusted before its version is rechecked
+FP_INDEX_CHECK_INTERVAL = 30
 
 
 class ReactionsInput(LowerCamelAliasModel):
@@ -24,14 +28,6 @@ class ReactionsResponse(BaseModel):
     reactions: list
 
 
-def _bits_to_array(bits: list[int], fp_size: int = 2048) -> np.ndarray:
-    bits_array = np.zeros(fp_size, dtype=np.bool_)
-    for bit in bits:
-        bits_array[bit] = True
-
-    return bits_array
-
-
 @register_util(name="reactions")
 class Reactions:
     """Util class for Reactions"""
@@ -49,6 +45,8 @@ class Reactions:
         # only products with valid reaction_smarts are kept in mol_collection
         mol_collection = "products_in_reactions"
         count_collection = "fp_counts_in_reactions"
+        # bumped by scripts/pre_compute.py for every changed template set
+        version_collection = "mol_versions_in_reactions"
 
         try:
             self.client.server_info()
@@ -59,56 +57,96 @@ class Reactions:
             self.collection = self.db[collection]
             self.mol_collection = self.db[mol_collection]
             self.count_collection = self.db[count_collection]
-
-            # FIXME: loading fingerprints is very expensive
-            # self.mol_fps, self.mol_fp_counts, self.mol_fp_refs = (
-            #     self.load_mol_fps_and_counts())
-
-    def load_mol_fps_and_counts(self) -> tuple[
-        dict[str, np.ndarray],
-        dict[str, np.ndarray],
-        dict[str, dict[int, str]]
-    ]:
-        template_sets = []
-        mol_fps = {}
-        mol_fp_counts = {}
-        mol_fp_refs = {}
-
-        start = time.time()
-        for i, doc in enumerate(self.mol_collection.find()):
-            if i % 100000 == 0:
-                print(f"Processed {i} reactions in {time.time() - start: .2f} seconds")
-                sys.stdout.flush()
-
-            template_set = doc["template_set"]
-            if template_set not in template_sets:
-                template_sets.append(template_set)
-                mol_fps[template_set] = []
-                mol_fp_counts[template_set] = []
-                mol_fp_refs[template_set] = {}
-
-            current_index_in_set = len(mol_fps[template_set])
-            mol_fps[template_set].append(_bits_to_array(doc["mfp_bits"]))
-            mol_fp_counts[template_set].append(doc["mfp_count"])
-            mol_fp_refs[template_set][current_index_in_set] = doc["_id"]
-
-        for template_set in template_sets:
-            mol_fps[template_set] = np.stack(mol_fps[template_set])
-            print(f"mol_fps shape for template_set {template_set}: "
-                  f"{mol_fps[template_set].shape}")
-            mol_fp_counts[template_set] = np.array(
-                mol_fp_counts[template_set],
-                dtype=int
-            )
-
-        return mol_fps, mol_fp_counts, mol_fp_refs
+            self.version_collection = self.db[version_collection]
+
+        # opt-in in-memory fingerprint index for method="fast",
+        # persisted as memory-mapped sidecars under fp_index_dir
+        self.fp_index_dir = util_config.get("fp_index_dir", "")
+        self.force_recompute_mols = util_config.get("force_recompute_mols", False)
+        self.fp_indexes = {}
+        # version of each loaded index, and when it was last checked
+        self._fp_index_versions: dict[str, tuple[Any, float]] = {}
+        self._fp_index_lock = threading.Lock()
+
+    def load_fp_index(self, template_set: str) -> PackedFingerprintIndex:
+        """
+        Get the packed fingerprint index for the template set, loading it from
+        the sidecar files if present and up to date (by the version that
+        scripts/pre_compute.py bumps on changes), or building it from
+        the mol_collection (and saving the sidecar files) otherwise. A loaded
+        index is reloaded once its version has been bumped, as rechecked at
+        most every FP_INDEX_CHECK_INTERVAL seconds.
+        """
+        if self._is_fp_index_checked(template_set):
+            return self.fp_indexes[template_set]
+
+        with self._fp_index_lock:
+            if self._is_fp_index_checked(template_set):
+                return self.fp_indexes[template_set]
+
+            path = os.path.join(self.fp_index_dir, template_set)
+            query = {"template_set": template_set}
+            # read before building, so that concurrent changes trigger a rebuild
+            doc = self.version_collection.find_one({"_id": template_set})
+            version = doc["version"] if doc else 0
+            if (
+                template_set in self.fp_indexes
+                and self._fp_index_versions[template_set][0] == version
+            ):
+                self._fp_index_versions[template_set] = (version, time.monotonic())
+                return self.fp_indexes[template_set]
+
+            count = self.mol_collection.count_documents(query)
+
+            # other workers may be building the same index
+            with snapshot_lock(path):
+                meta = PackedFingerprintIndex.load_meta(resolve_path(path))
+                if (
+                    self.force_recompute_mols
+                    or meta is None
+                    or meta.get("version") != version
+                    or meta.get("count") != count
+                ):
+                    print(f"Building fingerprint index for template_set {template_set}")
+                    cursor = self.mol_collection.find(
+                        query, {"product_smiles": 1, "mfp_bits": 1}
+                    )
+                    PackedFingerprintIndex.build(cursor).save(
+                        path,
+                        meta={
+                            "template_set": template_set,
+                            "version": version,
+                            "count": count
+                        }
+                    )
+                    print(f"Saved fingerprint index for template_set {template_set} "
+                          f"to {path}")
+                fp_index = PackedFingerprintIndex.load(resolve_path(path))
+
+            print(f"Loaded fingerprint index for template_set {template_set} "
+                  f"with {len(fp_index)} entries from {path}")
+
+            # versions first, as fp_indexes is read without the lock
+            self._fp_index_versions[template_set] = (version, time.monotonic())
+            self.fp_indexes[template_set] = fp_index
+
+        return fp_index
+
+    def _is_fp_index_checked(self, template_set: str) -> bool:
+        """Whether the index is loaded and its version was checked recently"""
+        if template_set not in self.fp_indexes:
+            return False
+        _, checked = self._fp_index_versions[template_set]
+
+        return time.monotonic() - checked < FP_INDEX_CHECK_INTERVAL
 
     def lookup_similar_smiles(
         self,
         smiles: str,
         sim_threshold: float = 0.3,
         reaction_set: str = "USPTO_FULL",
-        method: str = "accurate"
+        method: str = "accurate",
+        top_k: int | None = None
     ) -> list:
         """
         Lookup molecules in the database based on tanimoto similarity to the input
@@ -122,11 +160,12 @@ class Reactions:
             the tanimoto similarity to the query
 
         Note:
-            Currently there are two options implemented lookup methods.
+            Currently there are three options implemented lookup methods.
             The 'accurate' method is based on an aggregation pipeline in Mongo.
-            The 'fast' method uses locality-sensitive hashing to greatly improve
-            the lookup speed, at the cost of accuracy (especially at lower
-            similarity thresholds).
+            The 'naive' method computes the similarity in Python over a Mongo query.
+            The 'fast' method uses an in-memory packed fingerprint index per
+            template set (opt-in via 'fp_index_dir' in the util config), which
+            gives the same results as 'accurate' without a Mongo round-trip.
         """
         query_mol = Chem.MolFromSmiles(smiles)
         if not query_mol:
@@ -149,11 +188,25 @@ class Reactions:
                 reaction_set=reaction_set
             )
         elif method == "fast":
-            raise NotImplementedError
+            if not self.fp_index_dir:
+                raise ValueError("Similarity search method 'fast' requires "
+                                 "'fp_index_dir' to be set for reactions")
+            query_bits = list(
+                AllChem.GetMorganFingerprintAsBitVect(
+                    query_mol, DEFAULT_MORGAN_RADIUS, nBits=DEFAULT_MORGAN_LEN
+                ).GetOnBits()
+            )
+            results = self.load_fp_index(reaction_set).search(
+                query_bits=query_bits,
+                threshold=sim_threshold,
+                top_k=top_k
+            )
         else:
             raise ValueError(f"Similarity search method '{method}' not implemented")
 
         output = [{'smiles': i['product_smiles'], 'tanimoto': i['tanimoto'], 'id': i['_id']} for i in results]
+        if top_k is not None:
+            output = output[:top_k]
 
         return output
 
@@ -1,36 +1,163 @@
+import functools
 import importlib
+import inspect
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
 from utils import UTIL_CLASSES
+from utils.startup import startup_recorder
 
 _util_registry = None
 
+# Number of threads for initializing the (non-lazy) utils concurrently,
+# most of which block on connecting to mongo
+DEFAULT_UTIL_INIT_WORKERS = 8
+
+
+def get_config_path() -> str:
+    default_path = "configs.module_config_full"
+    config_path = os.environ.get(
+        "MODULE_CONFIG_PATH", default_path
+    ).replace("/", ".").rstrip(".py")
+
+    return config_path
+
 
 def get_util_registry():
     """Get global util registry."""
     global _util_registry
     if _util_registry is None:
-        default_path = "configs.module_config_full"
-        config_path = os.environ.get(
-            "MODULE_CONFIG_PATH", default_path
-        ).replace("/", ".").rstrip(".py")
+        config_path = get_config_path()
         _util_registry = UtilRegistry(config_path=config_path)
         print(f"Loaded util configuration from {config_path}")
 
     return _util_registry
 
 
+class LazyUtil:
+    """
+    Placeholder for a util with "lazy_init" in its config, which is only
+    initialized on first use. Class attributes (e.g., prefixes and
+    methods_to_bind) are read off the util class, and methods are returned
+    as endpoints that initialize the util when first called.
+    """
+
+    def __init__(self, util_class: type, util_config: dict[str, Any] | None):
+        self.util_class = util_class
+        self.util_config = util_config
+        self._util = None
+        self._lock = threading.Lock()
+        startup_recorder.register("util", util_class.name, lazy=True)
+
+    @property
+    def initialized(self) -> bool:
+        return self._util is not None
+
+    def get(self, concurrent: bool = False) -> Any:
+        if self._util is None:
+            with self._lock:
+                if self._util is None:
+                    with startup_recorder.record(
+                        "util", self.util_class.name, lazy=True, concurrent=concurrent
+                    ):
+                        self._util = self.util_class(util_config=self.util_config)
+
+        return self._util
+
+    def __getattr__(self, name: str) -> Any:
+        if self._util is not None:
+            return getattr(self._util, name)
+
+        attr = inspect.getattr_static(self.util_class, name)
+        if not inspect.isfunction(attr):
+            # class attributes, static and class methods need no instance
+            return getattr(self.util_class, name)
+
+        return self._bind_lazily(attr)
+
+    def _bind_lazily(self, func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def endpoint(*args, **kwargs):
+                return await func(self.get(), *args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def endpoint(*args, **kwargs):
+                return func(self.get(), *args, **kwargs)
+
+        # without self, for FastAPI to read the parameters as for a bound method
+        signature = inspect.signature(func)
+        endpoint.__signature__ = signature.replace(
+            parameters=list(signature.parameters.values())[1:])
+
+        return endpoint
+
+
 class UtilRegistry:
     def __init__(self, config_path: str):
         module_config = importlib.import_module(config_path).module_config
         self.module_config = module_config
+        self.init_workers = module_config.get("global", {}).get(
+            "util_init_workers", DEFAULT_UTIL_INIT_WORKERS)
 
-        self._utils = {
-            util_name: util_class(util_config=module_config.get(util_name))
-            for util_name, util_class in UTIL_CLASSES.items()
-        }
+        to_init = {}
+        self._utils = {}
+        for util_name, util_class in UTIL_CLASSES.items():
+            util_config = module_config.get(util_name)
+            if util_config and util_config.get("lazy_init", False):
+                self._utils[util_name] = LazyUtil(util_class, util_config)
+            else:
+                self._utils[util_name] = None
+                to_init[util_name] = (util_class, util_config)
+
+        # the remaining utils are independent of each other, and mostly I/O bound
+        concurrent = self.init_workers > 1
+        with ThreadPoolExecutor(max_workers=max(self.init_workers, 1)) as executor:
+            futures = {
+                util_name: executor.submit(
+                    self._init_util, util_class, util_config, concurrent)
+                for util_name, (util_class, util_config) in to_init.items()
+            }
+        for util_name, future in futures.items():
+            self._utils[util_name] = future.result()
+
+    @staticmethod
+    def _init_util(
+        util_class: type,
+        util_config: dict[str, Any] | None,
+        concurrent: bool
+    ) -> Any:
+        with startup_recorder.record("util", util_class.name, concurrent=concurrent):
+            return util_class(util_config=util_config)
+
+    def preload(self) -> None:
+        """Initialize the lazy utils, e.g., before forking worker processes"""
+        lazy_utils = [
+            util for util in self._utils.values()
+            if isinstance(util, LazyUtil) and not util.initialized
+        ]
+        concurrent = self.init_workers > 1 and len(lazy_utils) > 1
+        with ThreadPoolExecutor(max_workers=max(self.init_workers, 1)) as executor:
+            list(executor.map(lambda util: util.get(concurrent=concurrent), lazy_utils))
+
+    def shutdown(self) -> None:
+        """Release the resources (e.g., process pools) of the initialized utils"""
+        for util in self._utils.values():
+            if isinstance(util, LazyUtil):
+                if not util.initialized:
+                    continue
+                util = util.get()
+            if hasattr(util, "shutdown"):
+                util.shutdown()
 
     def get_util(self, module: str):
-        return self._utils.get(module, None)
+        util = self._utils.get(module, None)
+        if isinstance(util, LazyUtil):
+            util = util.get()
+
+        return util
 
     def __iter__(self):
+        # lazy utils are iterated as their placeholders, without initializing them
         return iter(self._utils.values())
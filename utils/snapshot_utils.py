@@ -0,0 +1,136 @@
+import fcntl
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+# Helpers for storing variable-length strings in .npy files, so that they can
+# be memory-mapped read-only and shared across processes through the page cache.
+# The strings are utf-8 encoded and concatenated into a single uint8 blob,
+# with an int64 offsets array of length n + 1 marking the boundaries.
+
+
+def strings_to_blob(strings: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Encode a list of strings into (blob, offsets) arrays."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    return blob, offsets
+
+
+def get_bytes_from_blob(blob: np.ndarray, offsets: np.ndarray, i: int) -> bytes:
+    """Get the utf-8 encoded i-th string from (blob, offsets) arrays."""
+    return blob[offsets[i]:offsets[i + 1]].tobytes()
+
+
+def get_string_from_blob(blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+    """Get the i-th string from (blob, offsets) arrays."""
+    return get_bytes_from_blob(blob, offsets, i).decode("utf-8")
+
+
+def search_sorted_blob(blob: np.ndarray, offsets: np.ndarray, key: str) -> int | None:
+    """
+    Binary search for key in (blob, offsets) arrays, where the strings are
+    sorted by their utf-8 encoding.
+
+    Returns:
+        int: index of the key, None if not found
+    """
+    target = key.encode("utf-8")
+    lo, hi = 0, len(offsets) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if get_bytes_from_blob(blob, offsets, mid) < target:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    if lo < len(offsets) - 1 and get_bytes_from_blob(blob, offsets, lo) == target:
+        return lo
+
+    return None
+
+
+@contextmanager
+def snapshot_lock(path: str) -> Iterator[None]:
+    """
+    Exclusive file lock on `path` across processes, to be held around
+    checking, building, saving and opening the snapshot so that concurrent
+    workers build it only once, and never open a version being removed.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    with open(f"{os.path.abspath(path)}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def resolve_path(path: str) -> str:
+    """
+    Resolve `path` to the version directory it currently points to, so that
+    the meta and the arrays of one snapshot are read from the same version.
+    """
+    return os.path.realpath(path)
+
+
+def save_arrays(path: str, arrays: dict[str, np.ndarray], meta: dict = None) -> None:
+    """
+    Save named arrays as .npy files (plus meta.json) into a new version
+    directory next to `path`, then atomically swap the symlink `path` to it.
+    Memory maps of replaced versions stay valid after their files are removed,
+    but only versions older than the previous one are removed, for readers
+    without the lock. Callers should hold snapshot_lock(path).
+    """
+    path = os.path.abspath(path)
+    parent, name = os.path.split(path)
+    os.makedirs(parent, exist_ok=True)
+    version_path = tempfile.mkdtemp(prefix=f".{name}.snapshot-", dir=parent)
+    os.chmod(version_path, 0o755)
+    for array_name, array in arrays.items():
+        np.save(os.path.join(version_path, f"{array_name}.npy"), array)
+    with open(os.path.join(version_path, "meta.json"), "w") as f:
+        json.dump(meta or {}, f)
+
+    previous_path = os.path.realpath(path) if os.path.islink(path) else None
+    link_path = f"{version_path}.link"
+    os.symlink(os.path.basename(version_path), link_path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # plain directory saved before snapshots were versioned
+        shutil.rmtree(path)
+    os.replace(link_path, path)
+
+    keep = {version_path, previous_path}
+    for entry in os.listdir(parent):
+        entry_path = os.path.join(parent, entry)
+        if (
+            entry.startswith(f".{name}.snapshot-")
+            and entry_path not in keep
+            and os.path.isdir(entry_path)
+            and not os.path.islink(entry_path)
+        ):
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+
+def load_arrays(path: str, names: list[str]) -> dict[str, np.ndarray]:
+    """Load named .npy files from directory `path` as read-only memory maps."""
+    return {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in names
+    }
+
+
+def load_meta(path: str) -> dict | None:
+    """Load meta.json from directory `path`, None if not saved (yet)."""
+    meta_file = os.path.join(path, "meta.json")
+    if not os.path.isfile(meta_file):
+        return None
+    with open(meta_file, "r") as f:
+        return json.load(f)
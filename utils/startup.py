@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pydantic import BaseModel
+from typing import Iterator
+
+# Initialization time and memory of the utils and wrappers of this process,
+# exposed on /api/admin/startup-report. Memory is the change in resident set
+# size over the initialization, so for components initialized concurrently it
+# may include some of the memory of the others.
+
+
+class ComponentInit(BaseModel):
+    name: str
+    kind: str
+    lazy: bool
+    initialized: bool
+    concurrent: bool = False
+    init_seconds: float | None = None
+    rss_delta_mb: float | None = None
+    error: str | None = None
+
+
+class StartupReport(BaseModel):
+    pid: int
+    started_at: float
+    uptime_seconds: float
+    rss_mb: float | None
+    components: list[ComponentInit]
+
+
+def get_rss_bytes() -> int | None:
+    """Current resident set size of the process, from /proc (Linux only)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupRecorder:
+    def __init__(self):
+        self.started_at = time.time()
+        self._components: dict[tuple[str, str], ComponentInit] = {}
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, name: str, lazy: bool = False) -> None:
+        """Record a component before (or without) its initialization"""
+        with self._lock:
+            self._components.setdefault(
+                (kind, name),
+                ComponentInit(name=name, kind=kind, lazy=lazy, initialized=False)
+            )
+
+    @contextmanager
+    def record(
+        self,
+        kind: str,
+        name: str,
+        lazy: bool = False,
+        concurrent: bool = False
+    ) -> Iterator[None]:
+        """Time the initialization of a component within the context"""
+        self.register(kind, name, lazy=lazy)
+        rss_start = get_rss_bytes()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            init_seconds = time.perf_counter() - start
+            rss_end = get_rss_bytes()
+            with self._lock:
+                component = self._components[(kind, name)]
+                component.initialized = error is None
+                component.concurrent = concurrent
+                component.init_seconds = init_seconds
+                component.error = error
+                if rss_start is not None and rss_end is not None:
+                    component.rss_delta_mb = (rss_end - rss_start) / 2 ** 20
+
+    def get_report(self) -> StartupReport:
+        rss = get_rss_bytes()
+        with self._lock:
+            components = [c.copy() for c in self._components.values()]
+
+        return StartupReport(
+            pid=os.getpid(),
+            started_at=self.started_at,
+            uptime_seconds=time.time() - self.started_at,
+            rss_mb=rss / 2 ** 20 if rss is not None else None,
+            components=components
+        )
+
+
+startup_recorder = StartupRecorder()
+
+
+def get_startup_report() -> StartupReport:
+    """
+    API endpoint for the initialization time and memory of the utils and
+    wrappers of the serving process; lazy utils show as not initialized
+    until their first use
+
+    Method: GET
+    """
+    return startup_recorder.get_report()
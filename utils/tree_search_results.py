@@ -1,11 +1,15 @@
+import asyncio
+import copy
 import json
 import uuid
 from configs import db_config
 from datetime import datetime
 from fastapi import Depends, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, constr, Field
-from pymongo import errors, MongoClient
-from typing import Annotated, Any, Literal
+from pymongo import errors, MongoClient, ReturnDocument
+from typing import Annotated, Any, AsyncIterator, Literal
 from utils import register_util
 from utils.oauth2 import oauth2_scheme
 from utils.registry import get_util_registry
@@ -13,6 +17,9 @@ from utils.tree_search_results_util import standardize_result
 
 # TODO: fix the time zone issue
 
+# Seconds between polls of a running result by stream()
+STREAM_POLL_INTERVAL = 2
+
 
 class TreeSearchSavedResults(BaseModel):
     """
@@ -31,6 +38,8 @@ class TreeSearchSavedResults(BaseModel):
     result_state: constr(max_length=64) = None
     result_type: str = "tree_builder"
     revision: int = 0
+    # run through the streaming endpoint of the backend, so that stop() applies
+    stoppable: bool = False
 
     target_smiles: str | None = None
     num_trees: int | None = 0
@@ -54,7 +63,9 @@ class TreeSearchResultsController:
         "share": ["GET"],
         "unshare": ["GET"],
         "add": ["POST"],
-        "remove": ["DELETE"]
+        "remove": ["DELETE"],
+        "stream": ["GET"],
+        "stop": ["POST"]
     }
 
     def __init__(self, util_config: dict[str, Any]):
@@ -72,6 +83,9 @@ class TreeSearchResultsController:
         else:
             self.collection = self.client[database][collection]
             self.db = self.client[database]
+            # Standardized copies of the tree builder results, by owner and
+            # result_id, kept apart so that they do not count towards the result documents
+            self.standardized_collection = self.db[f"{collection}_standardized"]
 
     def list(self, token: Annotated[str, Depends(oauth2_scheme)]
              ) -> list[TreeSearchSavedResults]:
@@ -99,7 +113,7 @@ class TreeSearchResultsController:
         cursor = self.collection.aggregate(
             [
                 {"$match": query},
-                {"$unset": ["result", "settings"]},
+                {"$unset": ["result", "settings", "partial_result"]},
                 {"$sort": {"dt": -1}}
             ]
         )
@@ -131,18 +145,40 @@ class TreeSearchResultsController:
                 }
             ]
         }
-        result = self.collection.find_one(query)
+        # the raw result is only fetched if there is no up-to-date standardized copy
+        result = self.collection.find_one(query, {"result": 0})
         if not result:
             raise HTTPException(
                 status_code=404,
                 detail=f"Result with id {result_id} not found or not viewable!"
             )
         if result["result_state"] in ["completed", "ipp"]:
-            result["_id"] = str(result["_id"])
-
+            revision = result.get("revision", 0)
+            standardized = None
             if result["result_type"] == "tree_builder":
-                result["result"] = standardize_result(result["result"])
+                standardized = self._get_standardized_result(
+                    user=result["user"],
+                    result_id=result_id,
+                    revision=revision
+                )
+
+            if standardized is not None:
+                result["result"] = standardized
+            else:
+                raw = self.collection.find_one({"_id": result["_id"]}, {"result": 1})
+                result["result"] = raw.get("result") if raw else None
+
+                if result["result_type"] == "tree_builder":
+                    # pre-existing or stale copy, standardize and back-fill
+                    result["result"] = standardize_result(result["result"])
+                    self._save_standardized_result(
+                        user=result["user"],
+                        result_id=result_id,
+                        revision=revision,
+                        standardized=result["result"]
+                    )
 
+            result["_id"] = str(result["_id"])
             result = TreeSearchSavedResults(**result)
 
             return result
@@ -220,11 +256,21 @@ class TreeSearchResultsController:
                 "result", "settings", "description", "tags", "modified", "revision"
             ] and v
         }
-        res = self.collection.update_one(
+        res = self.collection.find_one_and_update(
             query,
-            {"$set": updated_result}
+            {"$set": updated_result},
+            projection={"_id": 1, "user": 1, "result_type": 1, "revision": 1},
+            return_document=ReturnDocument.AFTER
         )
-        if not res.matched_count:
+        if res and "result" in updated_result and res["result_type"] == "tree_builder":
+            self._standardize_and_save(
+                user=res["user"],
+                result_id=result_id,
+                revision=res.get("revision", 0),
+                result=updated_result["result"]
+            )
+
+        if not res:
             resp = {
                 "success": False,
                 "error": f"Result {result_id} not editable by user {user.username}, "
@@ -277,6 +323,12 @@ class TreeSearchResultsController:
                 status_code=500,
                 media_type="application/json"
             )
+        if res.deleted_count:
+            try:
+                self.standardized_collection.delete_one(
+                    {"_id": self._standardized_id(user.username, result_id)})
+            except errors.PyMongoError:
+                pass
         if not res.deleted_count:
             resp = {
                 "success": False,
@@ -489,10 +541,268 @@ class TreeSearchResultsController:
         if "result_id" not in result_doc or not result_doc["result_id"]:
             result_doc["result_id"] = result_id
 
+        res = self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "result": result_doc,
+                    "num_trees": result_doc["stats"]["total_paths"]
+                },
+                "$unset": {"partial_result": "", "stop_requested": ""}
+            },
+            projection={"_id": 1, "result_type": 1, "revision": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if res and res["result_type"] == "tree_builder":
+            self._standardize_and_save(
+                user=user.username,
+                result_id=result_id,
+                revision=res.get("revision", 0),
+                result=result_doc
+            )
+
+    def save_partial_results(
+        self,
+        result_id: str,
+        result: dict,
+        token: Annotated[str, Depends(oauth2_scheme)] = None
+    ) -> None:
+        """Persist the partial results of a running search, for stream()"""
+        user_controller = get_util_registry().get_util(module="user_controller")
+        user = user_controller.get_current_user(token)
+
+        query = {
+            "user": user.username,
+            "result_id": result_id,
+            "result_state": "started"
+        }
         self.collection.update_one(
             query,
-            {"$set": {
-                "result": result_doc,
-                "num_trees": result_doc["stats"]["total_paths"]
-            }}
+            {"$set": {"partial_result": {
+                "stats": result.get("stats"),
+                "paths": result.get("paths"),
+                "modified": datetime.now()
+            }}}
+        )
+
+    def is_stop_requested(
+        self,
+        result_id: str,
+        token: Annotated[str, Depends(oauth2_scheme)] = None
+    ) -> bool:
+        user_controller = get_util_registry().get_util(module="user_controller")
+        user = user_controller.get_current_user(token)
+
+        query = {
+            "user": user.username,
+            "result_id": result_id,
+            "stop_requested": True
+        }
+
+        return self.collection.count_documents(query, limit=1) > 0
+
+    def set_stoppable(
+        self,
+        result_id: str,
+        stoppable: bool,
+        token: Annotated[str, Depends(oauth2_scheme)] = None
+    ) -> None:
+        """Mark whether the search can be stopped early, i.e., is being streamed"""
+        user_controller = get_util_registry().get_util(module="user_controller")
+        user = user_controller.get_current_user(token)
+
+        self.collection.update_one(
+            {"user": user.username, "result_id": result_id},
+            {"$set": {"stoppable": stoppable}}
+        )
+
+    def stop(self, result_id: str, token: Annotated[str, Depends(oauth2_scheme)]
+             ) -> Response:
+        """
+        API endpoint to stop a running search early, keeping the buyable paths
+        found so far as its result. Only applies to async searches run through
+        the streaming endpoint of the backend, i.e., with streaming_prediction_url
+        set in the deployment config of the tree search module (and supported
+        by its backend), once the backend has accepted the search; 409 for any
+        other search, or one not (yet) streaming or no longer running.
+
+        Method: POST
+        """
+        user_controller = get_util_registry().get_util(module="user_controller")
+        user = user_controller.get_current_user(token)
+
+        query = {
+            "user": user.username,
+            "result_id": result_id
+        }
+        doc = self.collection.find_one(query, {"result_state": 1, "stoppable": 1})
+        if not doc:
+            status_code = 404
+            message = f"Result {result_id} not found for user {user.username}!"
+        elif doc.get("result_state") not in ["pending", "started"]:
+            status_code = 409
+            message = f"Result {result_id} is not running!"
+        elif not doc.get("stoppable"):
+            status_code = 409
+            message = f"Result {result_id} cannot be stopped, as its search " \
+                      f"is not (or not yet) run through a streaming endpoint " \
+                      f"of the backend!"
+        else:
+            res = self.collection.update_one(
+                {**query, "result_state": {"$in": ["pending", "started"]}},
+                {"$set": {"stop_requested": True}}
+            )
+            if res.matched_count:
+                return Response(content=f"Successfully request stop for result: "
+                                        f"{result_id}!")
+            status_code = 409
+            message = f"Result {result_id} is not running!"
+
+        return Response(
+            content=json.dumps({"message": message}),
+            status_code=status_code,
+            media_type="application/json"
+        )
+
+    async def stream(self, result_id: str, token: Annotated[str, Depends(oauth2_scheme)]
+                     ) -> StreamingResponse:
+        """
+        API endpoint to follow a running search as server-sent events:
+        "state" whenever the result_state changes, "progress" with the stats and
+        buyable paths found so far whenever partial results are persisted, and
+        a final "result" with the stats once the search has completed.
+
+        Method: GET
+        """
+        user_controller = get_util_registry().get_util(module="user_controller")
+        user = await run_in_threadpool(user_controller.get_current_user, token)
+
+        query = {
+            "result_id": result_id,
+            "$or": [
+                {"user": user.username},
+                {
+                    "public": True,
+                    "shared_with": user.username
+                }
+            ]
+        }
+        projection = {
+            "result_state": 1,
+            "partial_result": 1,
+            "result.stats": 1,
+            "num_trees": 1
+        }
+        doc = await run_in_threadpool(self.collection.find_one, query, projection)
+        if not doc:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Result with id {result_id} not found or not viewable!"
+            )
+
+        return StreamingResponse(
+            self._get_events(query=query, projection=projection, doc=doc),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    async def _get_events(self, query: dict, projection: dict, doc: dict | None
+                          ) -> AsyncIterator[str]:
+        def _format_event(event: str, data: dict) -> str:
+            return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+        result_state = None
+        partial_modified = None
+        while doc:
+            if doc["result_state"] != result_state:
+                result_state = doc["result_state"]
+                yield _format_event("state", {"result_state": result_state})
+
+            partial_result = doc.get("partial_result")
+            if partial_result and partial_result["modified"] != partial_modified:
+                partial_modified = partial_result["modified"]
+                yield _format_event("progress", partial_result)
+
+            if result_state == "completed" and doc.get("result"):
+                yield _format_event("result", {
+                    "stats": doc["result"].get("stats"),
+                    "num_trees": doc.get("num_trees")
+                })
+                return
+            elif result_state not in ["pending", "started", "completed"]:
+                return
+
+            # comment line as keep-alive for proxies
+            yield ": ping\n\n"
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+            doc = await run_in_threadpool(self.collection.find_one, query, projection)
+
+    def _standardize_and_save(
+        self,
+        user: str,
+        result_id: str,
+        revision: int,
+        result: dict
+    ) -> None:
+        """
+        Standardize a tree builder result once, at save/update time, so that
+        retrieve() can serve the stored copy instead of redoing it per view.
+        On failure, nothing is stored and retrieve() standardizes as before.
+        """
+        try:
+            standardized = standardize_result(copy.deepcopy(result))
+        except Exception:
+            return
+
+        self._save_standardized_result(
+            user=user,
+            result_id=result_id,
+            revision=revision,
+            standardized=standardized
         )
+
+    @staticmethod
+    def _standardized_id(user: str, result_id: str) -> dict:
+        # result_id is only unique per user, like in every other query here
+        return {"user": user, "result_id": result_id}
+
+    def _get_standardized_result(
+        self,
+        user: str,
+        result_id: str,
+        revision: int
+    ) -> dict | None:
+        try:
+            doc = self.standardized_collection.find_one({
+                "_id": self._standardized_id(user, result_id),
+                "revision": revision
+            })
+        except errors.PyMongoError:
+            return None
+
+        return doc.get("result") if doc else None
+
+    def _save_standardized_result(
+        self,
+        user: str,
+        result_id: str,
+        revision: int,
+        standardized: dict
+    ) -> None:
+        """
+        Best effort: if the copy cannot be stored (e.g., over the document
+        size limit), retrieve() keeps serving freshly standardized results.
+        """
+        try:
+            # Only replace copies of older revisions; for a newer copy, the
+            # upsert fails on the duplicate _id and this one is dropped
+            self.standardized_collection.replace_one(
+                {
+                    "_id": self._standardized_id(user, result_id),
+                    "revision": {"$lte": revision}
+                },
+                {"revision": revision, "result": standardized},
+                upsert=True
+            )
+        except (errors.PyMongoError, errors.DocumentTooLarge):
+            pass
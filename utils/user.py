@@ -1,4 +1,7 @@
+import hashlib
 import os
+import threading
+import time
 import uuid
 from configs import db_config
 from fastapi import Depends, HTTPException, Response, status
@@ -8,6 +11,7 @@ from pydantic import BaseModel
 from pymongo import errors, MongoClient
 from typing import Annotated, Any
 from utils import register_util
+from utils.cache import LRUCache
 from utils.custom_auth import CustomAuthAPI
 from utils.oauth2 import (
     ALGORITHM,
@@ -66,9 +70,7 @@ class UserController:
             self.db = self.client[database]
 
         # create default admin account if there's none
-        users = self.collection.find()
-        users = [User(**u) for u in users]
-        if not any(u.is_superuser for u in users):
+        if not self.collection.find_one({"is_superuser": True}, {"_id": 1}):
             self.register_superuser(
                 username="askcos_admin",
                 password="reallybadpassword"
@@ -94,6 +96,19 @@ class UserController:
         if custom_auth_url:
             self.custom_auth_api = CustomAuthAPI(custom_auth_url)
 
+        # In-process cache of the resolved users, by token digest. Entries
+        # expire with their tokens (or after token_cache_ttl, after which the
+        # changes made through other workers are picked up), and are dropped
+        # when the user is changed through this one.
+        self.token_cache_ttl = util_config.get("token_cache_ttl", 60)
+        self.token_cache = LRUCache(
+            max_size=util_config.get("token_cache_size", 10000),
+            ttl=self.token_cache_ttl
+        )
+        self._invalidations = 0
+        self._invalidated_at: dict[str, int] = {}
+        self._invalidations_lock = threading.Lock()
+
     def get_user_by_name(self, username: str) -> User | None:
         query = {"username": username}
         try:
@@ -106,11 +121,55 @@ class UserController:
 
     def get_current_user(self, token: Annotated[str, Depends(oauth2_scheme)]
                          ) -> User:
+        if not token:
+            raise credentials_exception
+
+        # tokens are only kept as digests, and users as serialized JSON
+        key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        try:
+            resolved_at, username, serialized = self.token_cache.get(key)
+        except KeyError:
+            user = None
+        else:
+            # unless the user got invalidated since the resolution
+            if resolved_at >= self._invalidated_at.get(username, 0):
+                user = User.parse_raw(serialized)
+            else:
+                user = None
+
+        if user is None:
+            resolved_at = self._invalidations
+            user, username, expires_at = self._resolve_user(token)
+            ttl = self.token_cache_ttl
+            if expires_at is not None:
+                ttl = min(ttl, expires_at - time.time())
+            if user is not None and ttl > 0:
+                self.token_cache.set(
+                    key, (resolved_at, username, user.json()), ttl=ttl)
+
+        if user is None:
+            raise credentials_exception
+
+        if user.disabled:
+            raise HTTPException(status_code=400, detail="Disabled user")
+
+        return user
+
+    def invalidate_user(self, username: str) -> None:
+        """Drop the cached resolutions of the tokens of a user"""
+        with self._invalidations_lock:
+            self._invalidations += 1
+            self._invalidated_at[username] = self._invalidations
+
+    def _resolve_user(self, token: str) -> tuple[User | None, str, float | None]:
+        """Returns the user of a token, its username and the token expiry, if any"""
+        expires_at = None
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             username: str = payload.get("sub")
             if username is None:
                 raise JWTError
+            expires_at = payload.get("exp")
             user = self.get_user_by_name(username=username)
 
         except JWTError:
@@ -153,13 +212,7 @@ class UserController:
                 except:
                     raise credentials_exception
 
-        if user is None:
-            raise credentials_exception
-
-        if user.disabled:
-            raise HTTPException(status_code=400, detail="Disabled user")
-
-        return user
+        return user, username, expires_at
 
     def am_i_superuser(self, token: Annotated[str, Depends(oauth2_scheme)]
                        ) -> bool:
@@ -241,6 +294,7 @@ class UserController:
                     "disabled": disabled
                 }}
             )
+            self.invalidate_user(username)
 
         else:
             raise HTTPException(
@@ -262,6 +316,7 @@ class UserController:
                 "last_login": last_login
             }}
         )
+        self.invalidate_user(username)
 
         return Response(content=f"Successfully reset the password for {username}!")
 
@@ -280,6 +335,7 @@ class UserController:
                     "hashed_password": hashed_password
                 }}
             )
+            self.invalidate_user(username)
         else:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -302,6 +358,7 @@ class UserController:
                     "is_superuser": True
                 }}
             )
+            self.invalidate_user(username)
         else:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -324,6 +381,7 @@ class UserController:
                     "is_superuser": False
                 }}
             )
+            self.invalidate_user(username)
         else:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -348,6 +406,7 @@ class UserController:
                 headers={"WWW-Authenticate": "Bearer"},
             )
         self.collection.delete_one({"username": username})
+        self.invalidate_user(username)
 
         return Response(content=f"Successfully delete user: {username}!")
 
@@ -367,6 +426,7 @@ class UserController:
             {"username": username},
             {"$set": {"disabled": False}}
         )
+        self.invalidate_user(username)
 
         return Response(content=f"Successfully enable user: {username}!")
 
@@ -386,6 +446,7 @@ class UserController:
             {"username": username},
             {"$set": {"disabled": True}}
         )
+        self.invalidate_user(username)
 
         return Response(content=f"Successfully disable user: {username}!")
 
@@ -1,9 +1,114 @@
+import asyncio
+import atexit
+import httpx
+import os
+import queue
 import requests
+import threading
+import time
+import weakref
 from celery.result import AsyncResult
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 from configs import db_config
 from datetime import date
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from pymongo import errors, MongoClient
+from pymongo import errors, MongoClient, UpdateOne
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, Hashable
+from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
+from utils import metrics
+
+# Defaults for the optional connection settings under module_config[*]["deployment"]
+DEFAULT_MAX_IN_FLIGHT = 32
+DEFAULT_RETRIES = 0
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUS_CODES = [502, 503, 504]
+
+# Defaults for the optional micro-batching settings under module_config[*]["deployment"],
+# for wrappers implementing call_raw_batch(); a batch size of 1 disables batching
+DEFAULT_MICRO_BATCH_SIZE = 1
+DEFAULT_MICRO_BATCH_WAIT_MS = 5
+
+# Seconds between flushes of the buffered API call counts into logs.api_calls
+API_CALLS_FLUSH_INTERVAL = 10
+
+
+class MicroBatcher:
+    """
+    Micro-batching of concurrent single-item calls. Items submitted within
+    max_wait seconds of the first one (or until max_batch_size items) are
+    sent in one batch_fn(items) call, and its per-item results are fanned back
+    to the callers through their futures. Batches are cut by a background
+    thread and run on a pool, at most max_in_flight at a time.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list], list],
+        max_batch_size: int,
+        max_wait: float,
+        max_in_flight: int
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self._queue = None
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, item: Hashable) -> Future:
+        future = Future()
+        with self._lock:
+            if self._pid != os.getpid():
+                # (re)start the dispatcher lazily, so that forked workers get their own
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                executor = ThreadPoolExecutor(
+                    max_workers=self.max_in_flight, thread_name_prefix="micro-batch")
+                threading.Thread(
+                    target=self._run,
+                    args=(self._queue, executor),
+                    name="micro-batcher",
+                    daemon=True
+                ).start()
+            self._queue.put((item, future))
+
+        return future
+
+    def _run(self, _queue: queue.Queue, executor: ThreadPoolExecutor) -> None:
+        while True:
+            batch = [_queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list[tuple[Hashable, Future]]) -> None:
+        # identical items are only sent once
+        items = list(dict.fromkeys(item for item, _ in batch))
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise ValueError(f"Expected {len(items)} results from the batch call, "
+                                 f"got {len(results)}")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        results = dict(zip(items, results))
+        for item, future in batch:
+            future.set_result(results[item])
 
 
 class BaseResponse(BaseModel):
@@ -12,6 +117,97 @@ class BaseResponse(BaseModel):
     result: str | int | float | list | dict
 
 
+class APICallCounter:
+    """
+    In-process aggregator for API call counts. Increments are buffered in
+    memory and flushed into logs.api_calls with a single bulk_write every
+    flush_interval seconds from a background thread (and once more at exit),
+    keeping the {"method": ..., "count": {"yymmdd": n}} schema.
+    """
+
+    def __init__(self, collection, flush_interval: float = API_CALLS_FLUSH_INTERVAL):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._pid = None
+
+        atexit.register(self.flush)
+
+    def increment(self, method: str) -> None:
+        dt = date.today().strftime("%y%m%d")
+        with self._lock:
+            self._counts[(method, dt)] += 1
+            if self._pid != os.getpid():
+                # (re)start the flusher lazily, so that forked workers get their own
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._run, name="api-call-counter", daemon=True
+                ).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts or self.collection is None:
+            return
+
+        increments = {}
+        for (method, dt), count in counts.items():
+            increments.setdefault(method, {})[f"count.{dt}"] = count
+        operations = [
+            UpdateOne({"method": method}, {"$inc": inc}, upsert=True)
+            for method, inc in increments.items()
+        ]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            print(f"Failed to flush api call counts, will retry: {e}")
+            with self._lock:
+                self._counts.update(counts)
+
+
+class TracingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter forwarding the trace id of the current request to the backends,
+    and observing the BACKEND_LATENCY of the POSTs (i.e., the backend calls,
+    not the is_ready() probes) of a wrapper
+    """
+
+    def __init__(self, wrapper: str, **kwargs):
+        self.wrapper = wrapper
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "POST":
+            return super().send(request, **kwargs)
+
+        start = time.perf_counter()
+        status_code = None
+        try:
+            response = super().send(request, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            metrics.observe_backend_call(
+                self.wrapper, method="call_raw", start=start, status_code=status_code)
+
+    def add_headers(self, request: requests.PreparedRequest, **kwargs) -> None:
+        trace_id = metrics.get_trace_id()
+        if trace_id:
+            request.headers[metrics.TRACE_ID_HEADER] = trace_id
+
+
+async def _add_trace_header(request: httpx.Request) -> None:
+    trace_id = metrics.get_trace_id()
+    if trace_id:
+        request.headers[metrics.TRACE_ID_HEADER] = trace_id
+
+
 class BaseWrapper:
     input_class: type[BaseModel]
     output_class: type[BaseModel]
@@ -28,9 +224,23 @@ class BaseWrapper:
     }
     methods_to_log: list[str] = [
         "call_raw",
-        "call_sync"
+        "call_sync",
+        "call_raw_async"
     ]
+    # Bound endpoints to be served by an async method instead, e.g.,
+    # {"call_sync": "call_sync_async"} to serve /call-sync on the event loop
+    async_endpoints: dict[str, str] = {}
 
+    # Shared across wrappers, by event loop and then by backend base url
+    # and by prediction_url respectively; dropped along with their loop
+    _async_clients: weakref.WeakKeyDictionary[
+        asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]
+    ] = weakref.WeakKeyDictionary()
+    _async_semaphores: weakref.WeakKeyDictionary[
+        asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]
+    ] = weakref.WeakKeyDictionary()
+
+    logs_collection = None
     logs_client = MongoClient(serverSelectionTimeoutMS=1000, **db_config.MONGO)
     try:
         logs_client.server_info()
@@ -40,6 +250,7 @@ class BaseWrapper:
     else:
         logs_db = logs_client["logs"]
         logs_collection = logs_client["logs"]["api_calls"]
+    call_counter = APICallCounter(collection=logs_collection)
 
     def __init__(self, config: dict):
         self.config = config
@@ -48,7 +259,34 @@ class BaseWrapper:
             self.prediction_url = config["deployment"]["default_prediction_url"]
 
         self.config["prediction_url_in_use"] = self.prediction_url
+
+        deployment = config["deployment"]
+        self.timeout = deployment["timeout"]
+        self.max_in_flight = deployment.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT)
+        self.retries = deployment.get("retries", DEFAULT_RETRIES)
+        self.backoff = deployment.get("backoff", DEFAULT_BACKOFF)
+        self.micro_batch_size = deployment.get(
+            "micro_batch_size", DEFAULT_MICRO_BATCH_SIZE)
+        self.micro_batch_wait_ms = deployment.get(
+            "micro_batch_wait_ms", DEFAULT_MICRO_BATCH_WAIT_MS)
+        self._batcher = None
+        self._batcher_lock = threading.Lock()
+
         self.session_sync = requests.Session()
+        adapter = TracingHTTPAdapter(
+            wrapper=self.name,
+            pool_connections=1,
+            pool_maxsize=self.max_in_flight,
+            max_retries=Retry(
+                total=self.retries,
+                backoff_factor=self.backoff,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=None,
+                raise_on_status=False
+            )
+        )
+        self.session_sync.mount("http://", adapter)
+        self.session_sync.mount("https://", adapter)
 
     def get_config(self) -> dict:
         return self.config
@@ -76,23 +314,140 @@ class BaseWrapper:
 
         return ready
 
+    def get_request_url(self, input: BaseModel) -> str:
+        """Backend url to post the input to; override for per-model urls."""
+        return self.prediction_url
+
+    def parse_output(self, output: Any) -> BaseModel:
+        """Convert the json returned by the backend into the output class."""
+        return self.output_class(**output)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        clients = self._async_clients.setdefault(asyncio.get_running_loop(), {})
+        url = urlsplit(self.prediction_url)
+        key = f"{url.scheme}://{url.netloc}"
+        if key not in clients:
+            clients[key] = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_in_flight,
+                    max_keepalive_connections=self.max_in_flight
+                ),
+                timeout=self.timeout,
+                event_hooks={"request": [_add_trace_header]}
+            )
+
+        return clients[key]
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        semaphores = self._async_semaphores.setdefault(asyncio.get_running_loop(), {})
+        if self.prediction_url not in semaphores:
+            semaphores[self.prediction_url] = asyncio.Semaphore(self.max_in_flight)
+
+        return semaphores[self.prediction_url]
+
+    @classmethod
+    async def aclose_async_clients(cls) -> None:
+        """Close the shared async clients of the running loop, e.g., on shutdown."""
+        loop = asyncio.get_running_loop()
+        clients = cls._async_clients.pop(loop, {})
+        cls._async_semaphores.pop(loop, None)
+        for client in clients.values():
+            await client.aclose()
+
+    async def post_async(self, url: str, json: Any) -> httpx.Response:
+        """
+        Non-blocking POST to the backend through the shared connection pool,
+        with at most max_in_flight concurrent requests per prediction_url,
+        and with retries and exponential backoff on connection errors
+        and on the status codes in RETRY_STATUS_CODES.
+        """
+        client = self._get_async_client()
+        semaphore = self._get_async_semaphore()
+        start = time.perf_counter()
+        status_code = None
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with semaphore:
+                        response = await client.post(
+                            url, json=json, timeout=self.timeout)
+                except httpx.TransportError:
+                    if attempt == self.retries:
+                        raise
+                else:
+                    if (
+                        response.status_code not in RETRY_STATUS_CODES
+                        or attempt == self.retries
+                    ):
+                        status_code = response.status_code
+                        return response
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        finally:
+            # over the retries, like the retries of the sync TracingHTTPAdapter
+            metrics.observe_backend_call(
+                self.name, method="call_raw_async", start=start, status_code=status_code)
+
     def call_raw(self, input: BaseModel) -> BaseModel:
         response = self.session_sync.post(
-            self.prediction_url,
+            self.get_request_url(input),
             json=input.dict(),
-            timeout=self.config["deployment"]["timeout"]
+            timeout=self.timeout
         )
         output = response.json()
-        output = self.output_class(**output)
+        output = self.parse_output(output)
 
         return output
 
+    async def call_raw_async(self, input: BaseModel) -> BaseModel:
+        if type(self).call_raw is not BaseWrapper.call_raw:
+            # custom call_raw() not expressed through get_request_url() and
+            # parse_output(); keep it off the event loop at least. Bypassing
+            # __getattribute__, as the call is already logged as call_raw_async
+            call_raw = super().__getattribute__("call_raw")
+            return await run_in_threadpool(call_raw, input)
+
+        response = await self.post_async(
+            self.get_request_url(input),
+            json=input.dict()
+        )
+        output = response.json()
+        output = self.parse_output(output)
+
+        return output
+
+    def call_raw_batch(self, items: list) -> list[BaseModel]:
+        """
+        Backend call for a micro-batch of single-item inputs (as keyed by the
+        wrapper), returning one output per item; override to support batching.
+        """
+        raise NotImplementedError
+
+    def submit_to_batch(self, item: Hashable) -> Future:
+        """Queue a single item for the next call_raw_batch()"""
+        if self._batcher is None:
+            with self._batcher_lock:
+                if self._batcher is None:
+                    self._batcher = MicroBatcher(
+                        batch_fn=self.call_raw_batch,
+                        max_batch_size=self.micro_batch_size,
+                        max_wait=self.micro_batch_wait_ms / 1000,
+                        max_in_flight=self.max_in_flight
+                    )
+
+        return self._batcher.submit(item)
+
     def call_sync(self, input: BaseModel) -> BaseResponse:
         output = self.call_raw(input=input)
         response = self.convert_output_to_response(output)
 
         return response
 
+    async def call_sync_async(self, input: BaseModel) -> BaseResponse:
+        output = await self.call_raw_async(input=input)
+        response = self.convert_output_to_response(output)
+
+        return response
+
     async def call_async(self, input: BaseModel, priority: int = 0) -> str:
         from askcos2_celery.tasks import base_task
         async_result = base_task.apply_async(
@@ -123,14 +478,8 @@ class BaseWrapper:
         # Hook for logging function (thus API) calls
         _methods_to_log = super().__getattribute__("methods_to_log")
         if item in _methods_to_log:
-            _collection = super().__getattribute__("logs_collection")
+            _counter = super().__getattribute__("call_counter")
             _wrapper_name = super().__getattribute__("name")
-            query = {"method": f"{_wrapper_name}.{item}"}
-            dt = date.today().strftime("%y%m%d")
-            _collection.update_one(
-                query,
-                {"$inc": {f"count.{dt}": 1}},
-                upsert=True
-            )
+            _counter.increment(method=f"{_wrapper_name}.{item}")
 
         return super().__getattribute__(item)
@@ -1,7 +1,10 @@
+import asyncio
 from pydantic import BaseModel, Field
 from schemas.base import LowerCamelAliasModel
 from wrappers import register_wrapper
 from wrappers.base import BaseResponse, BaseWrapper
+from wrappers.fast_filter.batch import FastFilterBatchInput
+from wrappers.registry import get_wrapper_registry
 
 
 class FastFilterInput(LowerCamelAliasModel):
@@ -49,6 +52,19 @@ class FastFilterWrapper(BaseWrapper):
     prefixes = ["fast_filter"]
 
     def call_raw(self, input: FastFilterInput) -> FastFilterOutput:
+        if self.micro_batch_size > 1 and len(input.smiles) == 2:
+            # concurrent single calls are micro-batched into fast_filter_batch calls
+            return self.submit_to_batch(tuple(input.smiles)).result()
+
+        return self._call_raw_single(input)
+
+    async def call_raw_async(self, input: FastFilterInput) -> FastFilterOutput:
+        if self.micro_batch_size > 1 and len(input.smiles) == 2:
+            return await asyncio.wrap_future(self.submit_to_batch(tuple(input.smiles)))
+
+        return await super().call_raw_async(input=input)
+
+    def _call_raw_single(self, input: FastFilterInput) -> FastFilterOutput:
         response = self.session_sync.post(
             f"{self.prediction_url}/fast_filter_evaluate",
             json=input.dict(),
@@ -59,6 +75,32 @@ class FastFilterWrapper(BaseWrapper):
 
         return output
 
+    def call_raw_batch(self, items: list[tuple[str, str]]) -> list[FastFilterOutput]:
+        wrapper = get_wrapper_registry().get_wrapper(module="fast_filter_batch")
+        output = wrapper.call_raw(input=FastFilterBatchInput(
+            rxn_smiles=[f"{reactants}>>{target}" for reactants, target in items]
+        ))
+        if output.status == "SUCCESS" and len(output.results) == len(items):
+            # same single outcome as from fast_filter_evaluate, with the score as prob
+            return [
+                FastFilterOutput(
+                    error=output.error,
+                    status=output.status,
+                    results=[[[FastFilterResult(
+                        rank=1.0,
+                        outcome=FastFilterOutcome(
+                            smiles=target, template_ids=[], num_examples=0),
+                        score=score,
+                        prob=score
+                    )]]]
+                ) for (_, target), score in zip(items, output.results)
+            ]
+
+        # isolate the failing items, with the same outputs as the unbatched calls
+        return [
+            self._call_raw_single(FastFilterInput(smiles=list(item))) for item in items
+        ]
+
     def call_sync(self, input: FastFilterInput) -> FastFilterResponse:
         """
         Endpoint for synchronous call to the fast filter.
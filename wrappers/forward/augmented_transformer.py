@@ -39,19 +39,11 @@ class ForwardATWrapper(BaseWrapper):
     """Wrapper class for Forward Prediction with Augmented Transformer"""
     prefixes = ["forward/augmented_transformer"]
 
-    def call_raw(self, input: ForwardATInput) -> ForwardATOutput:
-        input_as_dict = input.dict()
-        model_name = input_as_dict["model_name"]
-
-        response = self.session_sync.post(
-            f"{self.prediction_url}/{model_name}",
-            json=input_as_dict,
-            timeout=self.config["deployment"]["timeout"]
-        )
-        output = response.json()
-        output = ForwardATOutput(__root__=output)
-
-        return output
+    def get_request_url(self, input: ForwardATInput) -> str:
+        return f"{self.prediction_url}/{input.model_name}"
+
+    def parse_output(self, output: list) -> ForwardATOutput:
+        return ForwardATOutput(__root__=output)
 
     def call_sync(self, input: ForwardATInput) -> ForwardATResponse:
         """
@@ -66,6 +66,7 @@ class ForwardController(BaseWrapper):
         "graph2smiles": "forward_graph2smiles",
         "wldn5": "forward_wldn5"
     }
+    async_endpoints = {"call_sync": "call_sync_async"}
 
     def __init__(self):
         pass        # TODO: proper inheritance
@@ -78,17 +79,27 @@ class ForwardController(BaseWrapper):
         module = self.backend_wrapper_names[input.backend]
         wrapper = get_wrapper_registry().get_wrapper(module=module)
 
-        if input.reagents:
-            for i, smi in enumerate(input.smiles):
-                input.smiles[i] = smi + "." + input.reagents
+        self.add_reagents_and_solvent(input)
+        wrapper_input = self.convert_input(
+            input=input, backend=input.backend)
+        wrapper_response = wrapper.call_sync(wrapper_input)
+        response = self.convert_response(
+            wrapper_response=wrapper_response, backend=input.backend)
 
-        if input.solvent:
-            for i, smi in enumerate(input.smiles):
-                input.smiles[i] = smi + "." + input.solvent
+        return response
 
+    async def call_sync_async(self, input: ForwardInput) -> ForwardResponse:
+        """
+        Endpoint for synchronous call to the forward prediction controller,
+        which dispatches the call to respective forward prediction backend service
+        """
+        module = self.backend_wrapper_names[input.backend]
+        wrapper = get_wrapper_registry().get_wrapper(module=module)
+
+        self.add_reagents_and_solvent(input)
         wrapper_input = self.convert_input(
             input=input, backend=input.backend)
-        wrapper_response = wrapper.call_sync(wrapper_input)
+        wrapper_response = await wrapper.call_sync_async(wrapper_input)
         response = self.convert_response(
             wrapper_response=wrapper_response, backend=input.backend)
 
@@ -109,6 +120,16 @@ class ForwardController(BaseWrapper):
     async def retrieve(self, task_id: str) -> ForwardResponse | None:
         return await super().retrieve(task_id=task_id)
 
+    @staticmethod
+    def add_reagents_and_solvent(input: ForwardInput) -> None:
+        if input.reagents:
+            for i, smi in enumerate(input.smiles):
+                input.smiles[i] = smi + "." + input.reagents
+
+        if input.solvent:
+            for i, smi in enumerate(input.smiles):
+                input.smiles[i] = smi + "." + input.solvent
+
     @staticmethod
     def convert_input(
         input: ForwardInput, backend: str
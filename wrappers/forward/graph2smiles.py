@@ -39,19 +39,11 @@ class ForwardG2SWrapper(BaseWrapper):
     """Wrapper class for Forward Prediction with Graph2SMILES"""
     prefixes = ["forward/graph2smiles"]
 
-    def call_raw(self, input: ForwardG2SInput) -> ForwardG2SOutput:
-        input_as_dict = input.dict()
-        model_name = input_as_dict["model_name"]
-
-        response = self.session_sync.post(
-            f"{self.prediction_url}/{model_name}",
-            json=input_as_dict,
-            timeout=self.config["deployment"]["timeout"]
-        )
-        output = response.json()
-        output = ForwardG2SOutput(__root__=output)
-
-        return output
+    def get_request_url(self, input: ForwardG2SInput) -> str:
+        return f"{self.prediction_url}/{input.model_name}"
+
+    def parse_output(self, output: list) -> ForwardG2SOutput:
+        return ForwardG2SOutput(__root__=output)
 
     def call_sync(self, input: ForwardG2SInput) -> ForwardG2SResponse:
         """
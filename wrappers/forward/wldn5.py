@@ -1,3 +1,4 @@
+import asyncio
 import copy
 from pydantic import BaseModel, Field
 from schemas.base import LowerCamelAliasModel
@@ -78,6 +79,31 @@ class ForwardWLDN5Wrapper(BaseWrapper):
 
         return output
 
+    async def call_raw_async(self, input: ForwardWLDN5Input) -> ForwardWLDN5Output:
+        if isinstance(input.reactants, str):
+            input.reactants = [input.reactants]
+
+        input_as_dicts = []
+        for reactants in input.reactants:
+            input_as_dict = copy.deepcopy(input.dict())
+            input_as_dict["reactants"] = reactants
+            input_as_dicts.append(input_as_dict)
+
+        # one request per reactant set, in flight concurrently
+        responses = await asyncio.gather(*[
+            self.post_async(self.prediction_url, json=input_as_dict)
+            for input_as_dict in input_as_dicts
+        ])
+        results = []
+        for response in responses:
+            results.extend(response.json()["results"])
+
+        output = responses[-1].json()       # hardcoding using the last response status
+        output["results"] = results
+        output = ForwardWLDN5Output(**output)
+
+        return output
+
     def call_sync(self, input: ForwardWLDN5Input) -> ForwardWLDN5Response:
         """
         Endpoint for synchronous call to WLDN5 forward predictor.
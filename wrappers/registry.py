@@ -1,6 +1,8 @@
 import importlib
-import os
 from pydantic import BaseModel
+from typing import Any
+from utils.registry import get_config_path
+from utils.startup import startup_recorder
 from wrappers import WRAPPER_CLASSES
 
 _wrapper_registry = None
@@ -23,10 +25,7 @@ def get_wrapper_registry():
     """Get global wrapper registry."""
     global _wrapper_registry
     if _wrapper_registry is None:
-        default_path = "configs.module_config_full"
-        config_path = os.environ.get(
-            "MODULE_CONFIG_PATH", default_path
-        ).replace("/", ".").rstrip(".py")
+        config_path = get_config_path()
         _wrapper_registry = WrapperRegistry(config_path=config_path)
         print(f"Loaded wrapper configuration from {config_path}")
 
@@ -53,26 +52,31 @@ class WrapperRegistry:
                     controller_name = f"{controller_prefix}_controller"
                     if module.startswith(controller_prefix) and \
                             controller_name not in self._wrappers:
-                        controller_class = WRAPPER_CLASSES[controller_name]
-                        self._wrappers[controller_name] = controller_class()
+                        self._wrappers[controller_name] = \
+                            self._init_wrapper(controller_name)
 
                 # Moved the wrapper binding behind controller so that the
                 # controller doc appears first in the API doc
                 if "wrapper_names" in wrapper_config:       # for multiple endpoints
                     for name in wrapper_config["wrapper_names"]:
-                        wrapper_class = WRAPPER_CLASSES[name]
-                        self._wrappers[name] = wrapper_class(wrapper_config)
+                        self._wrappers[name] = \
+                            self._init_wrapper(name, wrapper_config)
                 else:                                       # default to module name
-                    wrapper_class = WRAPPER_CLASSES[module]
-                    self._wrappers[module] = wrapper_class(wrapper_config)
+                    self._wrappers[module] = \
+                        self._init_wrapper(module, wrapper_config)
 
         # tree analysis controller will be created always
-        controller_class = WRAPPER_CLASSES["tree_analysis_controller"]
-        self._wrappers["tree_analysis_controller"] = controller_class()
+        self._wrappers["tree_analysis_controller"] = \
+            self._init_wrapper("tree_analysis_controller")
 
         # multi-target add-on, treating as a "controller" for now
-        wrapper_class = WRAPPER_CLASSES["tree_search_multi_target"]
-        self._wrappers["tree_search_multi_target"] = wrapper_class()
+        self._wrappers["tree_search_multi_target"] = \
+            self._init_wrapper("tree_search_multi_target")
+
+    @staticmethod
+    def _init_wrapper(name: str, *args: Any) -> Any:
+        with startup_recorder.record("wrapper", name):
+            return WRAPPER_CLASSES[name](*args)
 
     def get_backend_status(self) -> BackendStatusResponse:
         """Endpoint for getting the status of backend services"""
@@ -55,19 +55,11 @@ class RetroATWrapper(BaseWrapper):
     """Wrapper class for Retro Prediction with Augmented Transformer"""
     prefixes = ["retro/augmented_transformer"]
 
-    def call_raw(self, input: RetroATInput) -> RetroATOutput:
-        input_as_dict = input.dict()
-        model_name = input_as_dict["model_name"]
-
-        response = self.session_sync.post(
-            f"{self.prediction_url}/{model_name}",
-            json=input_as_dict,
-            timeout=self.config["deployment"]["timeout"]
-        )
-        output = response.json()
-        output = RetroATOutput(__root__=output)
-
-        return output
+    def get_request_url(self, input: RetroATInput) -> str:
+        return f"{self.prediction_url}/{input.model_name}"
+
+    def parse_output(self, output: list) -> RetroATOutput:
+        return RetroATOutput(__root__=output)
 
     def call_sync(self, input: RetroATInput) -> RetroATResponse:
         """
@@ -94,6 +94,7 @@ class RetroController(BaseWrapper):
         "template_relevance": "retro_template_relevance",
         "retrosim": "retro_retrosim"
     }
+    async_endpoints = {"call_sync": "call_sync_async"}
 
     def __init__(self):
         pass        # TODO: proper inheritance
@@ -103,26 +104,48 @@ class RetroController(BaseWrapper):
         Endpoint for synchronous call to the retro controller,
         which dispatches the call to respective one-step retro backend service
         """
-        cache_controller = get_util_registry().get_util(module="cache_controller")
-        try:
-            response = cache_controller.get(module_name=self.name, input=input)
-            if isinstance(response, dict):
-                response = RetroResponse(**response)
-        except KeyError:
+        def _call_backend() -> RetroResponse:
             module = self.backend_wrapper_names[input.backend]
             wrapper = get_wrapper_registry().get_wrapper(module=module)
 
             wrapper_input = self.convert_input(
                 input=input, backend=input.backend)
             wrapper_response = wrapper.call_sync(wrapper_input)
-            # print(wrapper_input)
-            # print(input.backend)
-            # print(wrapper)
-            # print(wrapper_response)
-            response = self.convert_response(
+
+            return self.convert_response(
                 wrapper_response=wrapper_response, backend=input.backend)
 
-            cache_controller.add(module_name=self.name, input=input, response=response)
+        # concurrent identical requests share one backend call on cache misses
+        cache_controller = get_util_registry().get_util(module="cache_controller")
+        response = cache_controller.get_or_compute(
+            module_name=self.name, input=input, compute=_call_backend)
+        if isinstance(response, dict):
+            response = RetroResponse(**response)
+
+        return response
+
+    async def call_sync_async(self, input: RetroInput) -> RetroResponse:
+        """
+        Endpoint for synchronous call to the retro controller,
+        which dispatches the call to respective one-step retro backend service
+        """
+        async def _call_backend() -> RetroResponse:
+            module = self.backend_wrapper_names[input.backend]
+            wrapper = get_wrapper_registry().get_wrapper(module=module)
+
+            wrapper_input = self.convert_input(
+                input=input, backend=input.backend)
+            wrapper_response = await wrapper.call_sync_async(wrapper_input)
+
+            return self.convert_response(
+                wrapper_response=wrapper_response, backend=input.backend)
+
+        # concurrent identical requests share one backend call on cache misses
+        cache_controller = get_util_registry().get_util(module="cache_controller")
+        response = await cache_controller.get_or_compute_async(
+            module_name=self.name, input=input, compute=_call_backend)
+        if isinstance(response, dict):
+            response = RetroResponse(**response)
 
         return response
 
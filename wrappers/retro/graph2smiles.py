@@ -55,19 +55,11 @@ class RetroG2SWrapper(BaseWrapper):
     """Wrapper class for Retro Prediction with Graph2SMILES"""
     prefixes = ["retro/graph2smiles"]
 
-    def call_raw(self, input: RetroG2SInput) -> RetroG2SOutput:
-        input_as_dict = input.dict()
-        model_name = input_as_dict["model_name"]
-
-        response = self.session_sync.post(
-            f"{self.prediction_url}/{model_name}",
-            json=input_as_dict,
-            timeout=self.config["deployment"]["timeout"]
-        )
-        output = response.json()
-        output = RetroG2SOutput(__root__=output)
-
-        return output
+    def get_request_url(self, input: RetroG2SInput) -> str:
+        return f"{self.prediction_url}/{input.model_name}"
+
+    def parse_output(self, output: list) -> RetroG2SOutput:
+        return RetroG2SOutput(__root__=output)
 
     def call_sync(self, input: RetroG2SInput) -> RetroG2SResponse:
         """
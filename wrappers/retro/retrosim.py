@@ -68,19 +68,6 @@ class RetroRSimWrapper(BaseWrapper):
     """Wrapper class for Retro Prediction with Retrosim"""
     prefixes = ["retro/retrosim"]
 
-    def call_raw(self, input: RetroRSimInput) -> RetroRSimOutput:
-        input_as_dict = input.dict()
-
-        response = self.session_sync.post(
-            f"{self.prediction_url}",
-            json=input_as_dict,
-            timeout=self.config["deployment"]["timeout"]
-        )
-        output = response.json()
-        output = RetroRSimOutput(**output)
-
-        return output
-
     def call_sync(self, input: RetroRSimInput) -> RetroRSimResponse:
         """
         Endpoint for synchronous call to one-step retrosynthesis based on
@@ -76,19 +76,11 @@ class RetroTemplRelWrapper(BaseWrapper):
     """Wrapper class for One-step Retrosynthesis with Template Relevance Model"""
     prefixes = ["retro/template_relevance"]
 
-    def call_raw(self, input: RetroTemplRelInput) -> RetroTemplRelOutput:
-        input_as_dict = input.dict()
-        model_name = input_as_dict["model_name"]
-
-        response = self.session_sync.post(
-            f"{self.prediction_url}/{model_name}",
-            json=input_as_dict,
-            timeout=self.config["deployment"]["timeout"]
-        )
-        output = response.json()
-        output = RetroTemplRelOutput(__root__=output)
-
-        return output
+    def get_request_url(self, input: RetroTemplRelInput) -> str:
+        return f"{self.prediction_url}/{input.model_name}"
+
+    def parse_output(self, output: list) -> RetroTemplRelOutput:
+        return RetroTemplRelOutput(__root__=output)
 
     def call_sync(self, input: RetroTemplRelInput) -> RetroTemplRelResponse:
         """
@@ -1,7 +1,10 @@
+import asyncio
 from pydantic import BaseModel, Field
 from schemas.base import LowerCamelAliasModel
 from wrappers import register_wrapper
 from wrappers.base import BaseResponse, BaseWrapper
+from wrappers.registry import get_wrapper_registry
+from wrappers.scscore.batch import SCScoreBatchInput
 
 
 class SCScoreInput(LowerCamelAliasModel):
@@ -33,6 +36,35 @@ class SCScoreWrapper(BaseWrapper):
     """Wrapper class for SCScore"""
     prefixes = ["scscore"]
 
+    def call_raw(self, input: SCScoreInput) -> SCScoreOutput:
+        if self.micro_batch_size <= 1:
+            return super().call_raw(input=input)
+
+        # concurrent single calls are micro-batched into scscore_batch calls
+        return self.submit_to_batch(input.smiles).result()
+
+    async def call_raw_async(self, input: SCScoreInput) -> SCScoreOutput:
+        if self.micro_batch_size <= 1:
+            return await super().call_raw_async(input=input)
+
+        return await asyncio.wrap_future(self.submit_to_batch(input.smiles))
+
+    def call_raw_batch(self, items: list[str]) -> list[SCScoreOutput]:
+        wrapper = get_wrapper_registry().get_wrapper(module="scscore_batch")
+        output = wrapper.call_raw(input=SCScoreBatchInput(smiles=items))
+        if output.status == "SUCCESS" and len(output.results) == len(items):
+            return [
+                SCScoreOutput(error=output.error, status=output.status, results=score)
+                for score in output.results
+            ]
+
+        # isolate the failing items, with the same outputs as the unbatched calls
+        outputs = []
+        for smiles in items:
+            outputs.append(super().call_raw(input=SCScoreInput(smiles=smiles)))
+
+        return outputs
+
     def call_sync(self, input: SCScoreInput) -> SCScoreResponse:
         """
         Endpoint for synchronous call to SCScorer.
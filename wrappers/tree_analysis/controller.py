@@ -1,30 +1,51 @@
+import contextvars
 import json
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Depends, HTTPException, Response
 from pydantic import BaseModel, Field
 from schemas.base import LowerCamelAliasModel
-from typing import Annotated, Literal
+from typing import Annotated, Any, Literal
 from utils.oauth2 import oauth2_scheme
 from utils.registry import get_util_registry
 from wrappers import register_wrapper
 from wrappers.base import BaseWrapper
-from wrappers.tree_analysis.tb_count_analogs import _tb_count_analogs
-from wrappers.tree_analysis.tb_pathway_ranking import _tb_pathway_ranking
-from wrappers.tree_analysis.tb_pmi_calculation import _tb_pmi_calculation
-from wrappers.tree_analysis.tb_reaction_classification \
-    import _tb_reaction_classification
+from wrappers.tree_analysis.tb_count_analogs import (
+    _apply_count_analogs,
+    _predict_count_analogs
+)
+from wrappers.tree_analysis.tb_pathway_ranking import (
+    _apply_pathway_ranking,
+    _predict_pathway_ranking
+)
+from wrappers.tree_analysis.tb_pmi_calculation import (
+    _apply_pmi_calculation,
+    _predict_pmi_calculation
+)
+from wrappers.tree_analysis.tb_reaction_classification import (
+    _apply_reaction_classification,
+    _predict_reaction_classification
+)
+from wrappers.tree_analysis.tree_analysis_utils import ParsedTreeResult
+
+TreeAnalysisTask = Literal[
+    "pathway_ranking",
+    "reaction_classification",
+    "pmi_calculation",
+    "count_analogs",
+]
 
 
 class TreeAnalysisInput(LowerCamelAliasModel):
     result_id: str = Field(description="tree result_id")
-    task: Literal[
-        "pathway_ranking",
-        "reaction_classification",
-        "pmi_calculation",
-        "count_analogs",
-    ] = Field(
+    task: TreeAnalysisTask = Field(
         default="pathway_ranking",
         description="tree analysis task name"
     )
+    tasks: list[TreeAnalysisTask] | None = Field(
+        default=None,
+        description="tree analysis task names, to run several tasks on the result "
+                    "at once with a single save; overrides 'task' if specified"
+    )
 
     # PMI calculator and count_analogs option
     index: int = Field(
@@ -112,14 +133,17 @@ class TreeAnalysisController(BaseWrapper):
             )
 
         result_id = input.result_id
-        task = input.task
+        tasks = list(dict.fromkeys(input.tasks or [input.task]))
 
-        output = {
-            "result_id": result_id,
-            "task": task,
+        output = {"result_id": result_id}
+        if len(tasks) == 1:
+            output["task"] = tasks[0]
+        else:
+            output["tasks"] = tasks
+        output.update({
             "success": True,
             "error": None,
-        }
+        })
 
         try:
             tb_result = result["result"]
@@ -146,26 +170,7 @@ class TreeAnalysisController(BaseWrapper):
                 media_type="application/json"
             )
 
-        if task == "pathway_ranking":
-            result, info = _tb_pathway_ranking(
-                tb_result=tb_result,
-                clustering=input.cluster_trees,
-                cluster_method=input.cluster_method,
-                min_samples=input.cluster_min_samples,
-                min_cluster_size=input.cluster_min_size
-            )
-        elif task == "reaction_classification":
-            result, info = _tb_reaction_classification(tb_result=tb_result)
-        elif task == "pmi_calculation":
-            result, info = _tb_pmi_calculation(tb_result=tb_result, index=input.index)
-        elif task == "count_analogs":
-            result, info = _tb_count_analogs(
-                tb_result=tb_result,
-                index=input.index,
-                min_plausibility=input.min_plausibility,
-                atom_map_backend=input.atom_map_backend
-            )
-        else:
+        if any(task not in self.backend_wrapper_names for task in tasks):
             output["success"] = False
             output["error"] = "Unrecognized tree analysis task type."
 
@@ -175,12 +180,41 @@ class TreeAnalysisController(BaseWrapper):
                 media_type="application/json"
             )
 
-        output.update(info)
+        # The paths are parsed once and shared by all tasks, whose backend calls
+        # are independent of each other and made concurrently (in copies of the
+        # context, for the trace id)
+        parsed = ParsedTreeResult(tb_result)
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = {
+                task: executor.submit(
+                    contextvars.copy_context().run, self._predict, task, parsed, input)
+                for task in tasks
+            }
+        predictions = {task: future.result() for task, future in futures.items()}
+
+        # reaction_classification re-serializes the paths, so it is applied first
+        infos = {}
+        for task in sorted(tasks, key=lambda t: t != "reaction_classification"):
+            prediction, info = predictions[task]
+            if info["success"]:
+                info = self._apply(task, tb_result, parsed, prediction, input)
+            infos[task] = info
+
+        if len(tasks) == 1:
+            output.update(infos[tasks[0]])
+        else:
+            failed_tasks = [task for task in tasks if not infos[task]["success"]]
+            output["success"] = not failed_tasks
+            if failed_tasks:
+                output["error"] = f"Tree analysis failed for tasks: {failed_tasks}"
+            output["results"] = {task: infos[task] for task in tasks}
+
         updated_result = {
-            "result": result,
+            "result": tb_result,
             "revision": new_revision
         }
-        if info["success"]:
+        if any(info["success"] for info in infos.values()):
+            # one update for all tasks
             resp = results_controller.update(
                 result_id=input.result_id,
                 updated_result=updated_result,
@@ -199,6 +233,71 @@ class TreeAnalysisController(BaseWrapper):
             media_type="application/json"
         )
 
+    @staticmethod
+    def _predict(
+        task: str,
+        parsed: ParsedTreeResult,
+        input: TreeAnalysisInput
+    ) -> tuple[Any, dict]:
+        """Run the backend call(s) for a task, without modifying the result"""
+        if task == "pathway_ranking":
+            return _predict_pathway_ranking(
+                parsed=parsed,
+                clustering=input.cluster_trees,
+                cluster_method=input.cluster_method,
+                min_samples=input.cluster_min_samples,
+                min_cluster_size=input.cluster_min_size
+            )
+        elif task == "reaction_classification":
+            return _predict_reaction_classification(parsed=parsed)
+        elif task == "pmi_calculation":
+            return _predict_pmi_calculation(parsed=parsed, index=input.index)
+        elif task == "count_analogs":
+            return _predict_count_analogs(
+                parsed=parsed,
+                index=input.index,
+                min_plausibility=input.min_plausibility,
+                atom_map_backend=input.atom_map_backend
+            )
+        else:
+            raise ValueError(f"Unrecognized tree analysis task type: {task}")
+
+    @staticmethod
+    def _apply(
+        task: str,
+        tb_result: dict,
+        parsed: ParsedTreeResult,
+        prediction: Any,
+        input: TreeAnalysisInput
+    ) -> dict:
+        """Write the prediction of a task into the result document"""
+        if task == "pathway_ranking":
+            return _apply_pathway_ranking(
+                tb_result=tb_result,
+                results=prediction,
+                clustering=input.cluster_trees
+            )
+        elif task == "reaction_classification":
+            return _apply_reaction_classification(
+                tb_result=tb_result,
+                parsed=parsed,
+                rxn_classes=prediction
+            )
+        elif task == "pmi_calculation":
+            return _apply_pmi_calculation(
+                tb_result=tb_result,
+                pmis=prediction,
+                index=input.index
+            )
+        elif task == "count_analogs":
+            return _apply_count_analogs(
+                tb_result=tb_result,
+                num_analogs=prediction,
+                index=input.index
+            )
+        else:
+            raise ValueError(f"Unrecognized tree analysis task type: {task}")
+
     async def call_async(
         self,
         input: TreeAnalysisInput,
@@ -1,7 +1,7 @@
 import networkx as nx
 import traceback as tb
 from wrappers.count_analogs.default import CountAnalogsInput
-from wrappers.tree_analysis.tree_analysis_utils import NODE_LINK_ATTRS
+from wrappers.tree_analysis.tree_analysis_utils import ParsedTreeResult
 from wrappers.registry import get_wrapper_registry
 from utils.registry import get_util_registry
 
@@ -56,7 +56,8 @@ def _tb_count_analogs(
     tb_result: dict,
     index: int,
     min_plausibility: float,
-    atom_map_backend: str = "rxnmapper"
+    atom_map_backend: str = "rxnmapper",
+    parsed: ParsedTreeResult = None
 ) -> tuple[dict, dict]:
     """
     Run a reaction classification prediction for a saved tree builder result.
@@ -64,41 +65,62 @@ def _tb_count_analogs(
     Returns:
         dict, dict: result document and info dict with success and error fields
     """
+    num_analogs, output = _predict_count_analogs(
+        parsed=parsed or ParsedTreeResult(tb_result),
+        index=index,
+        min_plausibility=min_plausibility,
+        atom_map_backend=atom_map_backend
+    )
+    if output["success"]:
+        output = _apply_count_analogs(
+            tb_result=tb_result,
+            num_analogs=num_analogs,
+            index=index
+        )
 
-    if index == -1:
-        trees = tb_result["paths"]
-    else:
-        trees = [tb_result["paths"][index]]
+    return tb_result, output
+
+
+def _predict_count_analogs(
+    parsed: ParsedTreeResult,
+    index: int,
+    min_plausibility: float,
+    atom_map_backend: str = "rxnmapper"
+) -> tuple[list[int] | None, dict]:
+    """
+    Count the analogs for the paths without modifying the result document.
 
+    Returns:
+        list, dict: number of analogs per path and info dict with success
+            and error fields
+    """
     output = {
         "success": True,
         "error": None,
     }
 
     try:
-        if trees:
-            if "nodes" in trees[0]:
-                graph_paths = [
-                    nx.node_link_graph(tree, attrs=NODE_LINK_ATTRS) for tree in trees
-                ]
+        if parsed.paths:
+            if parsed.json_format == "nodelink":
+                graph_paths = parsed.get_graph_paths(index)
             else:
                 output["success"] = False
                 output["error"] = "count_analogs only support paths in " \
                                   "nodelink format, but not treedata format"
 
-                return tb_result, output
+                return None, output
         else:
             output["success"] = False
             output["error"] = "Requested result does not have any paths to count."
 
-            return tb_result, output
+            return None, output
 
     except Exception as e:
         output["success"] = False
         output["error"] = "Unable to load requested result."
         print("Counting analogs failed for tree builder result:", str(e))
 
-        return tb_result, output
+        return None, output
 
     try:
         num_analogs = []
@@ -116,7 +138,21 @@ def _tb_count_analogs(
         output["error"] = "Analog counting failed."
         tb.print_exc()
 
-        return tb_result, output
+        return None, output
+
+    return num_analogs, output
+
+
+def _apply_count_analogs(tb_result: dict, num_analogs: list[int], index: int) -> dict:
+    if index == -1:
+        trees = tb_result["paths"]
+    else:
+        trees = [tb_result["paths"][index]]
+
+    output = {
+        "success": True,
+        "error": None,
+    }
 
     try:
         # Update target chemical nodes in every tree
@@ -130,6 +166,4 @@ def _tb_count_analogs(
         output["error"] = "Analog counting result processing failed."
         tb.print_exc()
 
-        return tb_result, output
-
-    return tb_result, output
+    return output
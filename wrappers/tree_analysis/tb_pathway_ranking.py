@@ -1,12 +1,7 @@
-import networkx as nx
 import traceback
 from wrappers.pathway_ranker.default import PathwayRankerInput
 from wrappers.registry import get_wrapper_registry
-from wrappers.tree_analysis.tree_analysis_utils import (
-    clean_json,
-    NIL_UUID,
-    NODE_LINK_ATTRS
-)
+from wrappers.tree_analysis.tree_analysis_utils import ParsedTreeResult
 
 
 def _tb_pathway_ranking(
@@ -14,48 +9,71 @@ def _tb_pathway_ranking(
     clustering: bool,
     cluster_method: str,
     min_samples: int,
-    min_cluster_size: int
+    min_cluster_size: int,
+    parsed: ParsedTreeResult = None
 ) -> tuple[dict, dict]:
     """
     Run a pathway ranking prediction for a saved tree builder result.
 
     Args:
         tb_result (dict): tree builder saved result document
+        parsed (ParsedTreeResult, optional): parsed views of tb_result,
+            if shared with other analysis tasks
 
     Returns:
         dict, dict: result document and info dict with success and error fields
     """
+    results, output = _predict_pathway_ranking(
+        parsed=parsed or ParsedTreeResult(tb_result),
+        clustering=clustering,
+        cluster_method=cluster_method,
+        min_samples=min_samples,
+        min_cluster_size=min_cluster_size
+    )
+    if output["success"]:
+        output = _apply_pathway_ranking(
+            tb_result=tb_result,
+            results=results,
+            clustering=clustering
+        )
+
+    return tb_result, output
+
+
+def _predict_pathway_ranking(
+    parsed: ParsedTreeResult,
+    clustering: bool,
+    cluster_method: str,
+    min_samples: int,
+    min_cluster_size: int
+) -> tuple[dict | None, dict]:
+    """
+    Run the pathway ranker on the paths without modifying the result document.
+
+    Returns:
+        dict, dict: pathway ranker results and info dict with success and error fields
+    """
     output = {
         "success": True,
         "error": None,
     }
 
     try:
-        # TODO: Consolidate tree processing with duplicate code in results API
-        trees = tb_result["paths"]
-        if trees:
-            if "nodes" in trees[0]:
-                # Convert paths to tree data format for pathway ranking
-                graph_paths = [
-                    nx.node_link_graph(tree, attrs=NODE_LINK_ATTRS) for tree in trees
-                ]
-                json_paths = [
-                    clean_json(nx.tree_data(tree, NIL_UUID)) for tree in graph_paths
-                ]
-            else:
-                json_paths = trees
+        if parsed.paths:
+            # Convert paths to tree data format for pathway ranking
+            json_paths = parsed.get_json_paths()
         else:
             output["success"] = False
             output["error"] = "Requested result does not have any paths to rank."
 
-            return tb_result, output
+            return None, output
     except Exception as e:
         traceback.print_tb(e.__traceback__)
         output["success"] = False
         output["error"] = "Unable to load requested result."
         print("Pathway ranking failed for tree builder result:", str(e))
 
-        return tb_result, output
+        return None, output
 
     try:
         # Run pathway ranking and clustering using JSON paths
@@ -75,11 +93,26 @@ def _tb_pathway_ranking(
         output["error"] = f"Pathway ranking prediction failed. Traceback: " \
                           f"{traceback.format_exc()}"
 
-        return tb_result, output
+        return None, output
+
+    return results, output
+
+
+def _apply_pathway_ranking(tb_result: dict, results: dict, clustering: bool) -> dict:
+    """
+    Write the pathway ranker results into the result document.
+
+    Returns:
+        dict: info dict with success and error fields
+    """
+    output = {
+        "success": True,
+        "error": None,
+    }
 
     try:
         # Update original JSON paths directly to keep same format
-        for i, tree in enumerate(trees):
+        for i, tree in enumerate(tb_result["paths"]):
             # Key for graph attributes based on JSON format
             key = "graph" if "nodes" in tree else "attributes"
             tree.setdefault(key, {})["score"] = results["scores"][i]
@@ -91,6 +124,4 @@ def _tb_pathway_ranking(
         output["error"] = f"Pathway ranking prediction failed. Traceback: " \
                           f"{traceback.format_exc()}"
 
-        return tb_result, output
-
-    return tb_result, output
+    return output
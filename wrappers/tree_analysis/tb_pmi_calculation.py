@@ -1,52 +1,50 @@
-import networkx as nx
 import traceback
 from wrappers.pmi_calculator.default import PmiCalculatorInput
 from wrappers.registry import get_wrapper_registry
-from wrappers.tree_analysis.tree_analysis_utils import (
-    clean_json,
-    NIL_UUID,
-    NODE_LINK_ATTRS
-)
+from wrappers.tree_analysis.tree_analysis_utils import ParsedTreeResult
 
 
-def _tb_pmi_calculation(tb_result: dict, index: int) -> tuple[dict, dict]:
-    if index == -1:
-        paths = tb_result["paths"]
-    else:
-        paths = [tb_result["paths"][index]]
+def _tb_pmi_calculation(
+    tb_result: dict,
+    index: int,
+    parsed: ParsedTreeResult = None
+) -> tuple[dict, dict]:
+    pmis, output = _predict_pmi_calculation(
+        parsed=parsed or ParsedTreeResult(tb_result),
+        index=index
+    )
+    if output["success"]:
+        output = _apply_pmi_calculation(tb_result=tb_result, pmis=pmis, index=index)
+
+    return tb_result, output
+
 
+def _predict_pmi_calculation(
+    parsed: ParsedTreeResult,
+    index: int
+) -> tuple[list | None, dict]:
     output = {
         "success": True,
         "error": None,
     }
 
     try:
-        # TODO: Consolidate tree processing with duplicate code in results API
-        trees = paths
-        if trees:
-            if "nodes" in trees[0]:
-                # Convert paths to tree data format for pathway ranking
-                graph_paths = [
-                    nx.node_link_graph(tree, attrs=NODE_LINK_ATTRS) for tree in trees
-                ]
-                json_paths = [
-                    clean_json(nx.tree_data(tree, NIL_UUID)) for tree in graph_paths
-                ]
-            else:
-                json_paths = trees
+        if parsed.paths:
+            # Convert paths to tree data format for pathway ranking
+            json_paths = parsed.get_json_paths(index)
         else:
             output["success"] = False
             output["error"] = \
                 "Requested result does not have any paths for PMI calculation."
 
-            return tb_result, output
+            return None, output
     except Exception as e:
         traceback.print_tb(e.__traceback__)
         output["success"] = False
         output["error"] = "Unable to load requested result."
         print("PMI calculation failed for tree builder result:", str(e))
 
-        return tb_result, output
+        return None, output
 
     try:
         # Run PMI calculator using JSON paths
@@ -59,7 +57,21 @@ def _tb_pmi_calculation(tb_result: dict, index: int) -> tuple[dict, dict]:
         output["error"] = "PMI calculation failed."
         print("PMI calculation failed for tree builder result:", str(e))
 
-        return tb_result, output
+        return None, output
+
+    return pmis, output
+
+
+def _apply_pmi_calculation(tb_result: dict, pmis: list, index: int) -> dict:
+    if index == -1:
+        trees = tb_result["paths"]
+    else:
+        trees = [tb_result["paths"][index]]
+
+    output = {
+        "success": True,
+        "error": None,
+    }
 
     try:
         # Update original JSON paths directly to keep same format
@@ -73,6 +85,4 @@ def _tb_pmi_calculation(tb_result: dict, index: int) -> tuple[dict, dict]:
         output["error"] = "PMI calculation result processing failed."
         print("PMI calculation failed for tree builder result:", str(e))
 
-        return tb_result, output
-
-    return tb_result, output
+    return output
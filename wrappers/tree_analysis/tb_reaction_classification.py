@@ -4,43 +4,58 @@ from wrappers.reaction_classification.get_top_class_batch import GetTopClassBatc
 from wrappers.registry import get_wrapper_registry
 from wrappers.tree_analysis.tree_analysis_utils import (
     NIL_UUID,
-    NODE_LINK_ATTRS,
     nx_paths_to_json,
-    tree_data_to_graph
+    ParsedTreeResult
 )
 
 
-def _tb_reaction_classification(tb_result: dict) -> tuple[dict, dict]:
+def _tb_reaction_classification(
+    tb_result: dict,
+    parsed: ParsedTreeResult = None
+) -> tuple[dict, dict]:
     """
     Run a reaction classification prediction for a saved tree builder result.
 
     Returns:
         dict, dict: result document and info dict with success and error fields
     """
+    parsed = parsed or ParsedTreeResult(tb_result)
+    rxn_classes, output = _predict_reaction_classification(parsed=parsed)
+    if output["success"]:
+        output = _apply_reaction_classification(
+            tb_result=tb_result,
+            parsed=parsed,
+            rxn_classes=rxn_classes
+        )
+
+    return tb_result, output
+
+
+def _predict_reaction_classification(
+    parsed: ParsedTreeResult
+) -> tuple[dict[str, list] | None, dict]:
+    """
+    Classify the reactions in the full network without modifying the result.
+
+    Returns:
+        dict, dict: reaction classes by reaction SMILES and info dict with
+            success and error fields
+    """
     output = {
         "success": True,
         "error": None,
     }
-    json_format = "nodelink"
     try:
         # TODO: Consolidate tree processing with duplicate code in results API
-        graph = nx.node_link_graph(tb_result["graph"])  # Full reaction network
-        trees = tb_result["paths"]
-        if trees:
-            if "nodes" in trees[0]:
-                trees = [
-                    nx.node_link_graph(tree, attrs=NODE_LINK_ATTRS) for tree in trees
-                ]
-            else:
-                json_format = "treedata"
-                trees = [tree_data_to_graph(tree) for tree in trees]
+        graph = parsed.graph   # Full reaction network
+        parsed.get_graph_paths()
     except Exception as e:
         traceback.print_tb(e.__traceback__)
         output["success"] = False
         output["error"] = "Unable to load requested result."
         print("Reaction classification failed for tree builder result:", str(e))
 
-        return tb_result, output
+        return None, output
 
     try:
         reactions = [v for v, d in graph.nodes(data=True) if d["type"] == "reaction"]
@@ -55,13 +70,35 @@ def _tb_reaction_classification(tb_result: dict) -> tuple[dict, dict]:
         output["error"] = "Reaction classification prediction failed."
         print("Reaction classification failed for tree builder result:", str(e))
 
-        return tb_result, output
+        return None, output
+
+    return dict(zip(reactions, rxn_classes)), output
+
 
+def _apply_reaction_classification(
+    tb_result: dict,
+    parsed: ParsedTreeResult,
+    rxn_classes: dict[str, list]
+) -> dict:
+    """
+    Write the reaction classes into the parsed graphs and re-serialize them into
+    the result document. This replaces tb_result["graph"] and tb_result["paths"],
+    so it must be applied before any other task writes into the JSON paths.
+
+    Returns:
+        dict: info dict with success and error fields
+    """
+    output = {
+        "success": True,
+        "error": None,
+    }
     try:
+        graph = parsed.graph
+        trees = parsed.get_graph_paths()
         # Update reaction nodes in full network
-        for i, rxn in enumerate(reactions):
+        for rxn, rxn_class in rxn_classes.items():
             rxn_data = graph.nodes[rxn]
-            rxn_data["class_num"], rxn_data["class_name"] = rxn_classes[i]
+            rxn_data["class_num"], rxn_data["class_name"] = rxn_class
         # Update reaction nodes in every tree
         for tree in trees:
             for v, d in tree.nodes(data=True):
@@ -73,13 +110,12 @@ def _tb_reaction_classification(tb_result: dict) -> tuple[dict, dict]:
                     )
         # Save updated result to database
         tb_result["graph"] = nx.node_link_data(graph)
-        tb_result["paths"] = nx_paths_to_json(trees, NIL_UUID, json_format=json_format)
+        tb_result["paths"] = nx_paths_to_json(
+            trees, NIL_UUID, json_format=parsed.json_format)
     except Exception as e:
         traceback.print_tb(e.__traceback__)
         output["success"] = False
         output["error"] = "Reaction classification result processing failed."
         print("Reaction classification failed for tree builder result:", str(e))
 
-        return tb_result, output
-
-    return tb_result, output
+    return output
@@ -1,4 +1,5 @@
 import networkx as nx
+import threading
 
 NIL_UUID = "00000000-0000-0000-0000-000000000000"
 NODE_LINK_ATTRS = {
@@ -172,3 +173,64 @@ def tree_data_to_graph(tree):
             del node_data["is_reaction"]
 
     return tree
+
+
+class ParsedTreeResult:
+    """
+    Lazily parsed views of a tree builder result, shared by the analysis tasks
+    run on it, so that each path is parsed with networkx at most once.
+    """
+
+    def __init__(self, tb_result: dict):
+        self.tb_result = tb_result
+        self.paths = tb_result["paths"]
+        self.json_format = \
+            "nodelink" if self.paths and "nodes" in self.paths[0] else "treedata"
+
+        self._lock = threading.Lock()
+        self._graph = None
+        self._graph_paths = [None] * len(self.paths)
+        self._json_paths = [None] * len(self.paths)
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        """Full reaction network"""
+        with self._lock:
+            if self._graph is None:
+                self._graph = nx.node_link_graph(self.tb_result["graph"])
+
+            return self._graph
+
+    def _get_indices(self, index: int) -> list[int]:
+        return list(range(len(self.paths))) if index == -1 else [index]
+
+    def get_graph_paths(self, index: int = -1) -> list[nx.DiGraph]:
+        """Paths as networkx graphs, either all of them (index=-1) or one"""
+        graph_paths = []
+        with self._lock:
+            for i in self._get_indices(index):
+                if self._graph_paths[i] is None:
+                    if self.json_format == "nodelink":
+                        self._graph_paths[i] = nx.node_link_graph(
+                            self.paths[i], attrs=NODE_LINK_ATTRS)
+                    else:
+                        # shallow copy, since tree_data_to_graph pops the attributes
+                        self._graph_paths[i] = tree_data_to_graph(dict(self.paths[i]))
+                graph_paths.append(self._graph_paths[i])
+
+        return graph_paths
+
+    def get_json_paths(self, index: int = -1) -> list[dict]:
+        """Paths in the cleaned tree data format, either all of them or one"""
+        if self.json_format == "treedata":
+            return [self.paths[i] for i in self._get_indices(index)]
+
+        graph_paths = self.get_graph_paths(index)
+        json_paths = []
+        with self._lock:
+            for i, graph_path in zip(self._get_indices(index), graph_paths):
+                if self._json_paths[i] is None:
+                    self._json_paths[i] = clean_json(nx.tree_data(graph_path, NIL_UUID))
+                json_paths.append(self._json_paths[i])
+
+        return json_paths
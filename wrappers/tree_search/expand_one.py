@@ -4,6 +4,7 @@ from schemas.base import LowerCamelAliasModel
 from schemas.cluster import ClusterSetting
 from schemas.retro import RetroBackendOption
 from typing import Annotated, Any, Literal
+from utils.base import compile_banlist
 from utils.oauth2 import oauth2_scheme
 from utils.registry import get_util_registry
 from wrappers import register_wrapper
@@ -128,20 +129,21 @@ class ExpandOneWrapper(BaseWrapper):
     }
 
     def call_raw(self, input: ExpandOneInput) -> ExpandOneOutput:
-        cache_controller = get_util_registry().get_util(module="cache_controller")
-        try:
-            response = cache_controller.get(module_name=self.name, input=input)
-            if isinstance(response, dict):
-                response = ExpandOneOutput(**response)
-        except KeyError:
+        def _call_backend() -> ExpandOneOutput:
             response = self.session_sync.post(
                 self.prediction_url,
                 json=input.dict(),
                 timeout=self.config["deployment"]["timeout"]
             )
-            response = response.json()
+
+            return ExpandOneOutput(**response.json())
+
+        # concurrent identical requests share one backend call on cache misses
+        cache_controller = get_util_registry().get_util(module="cache_controller")
+        response = cache_controller.get_or_compute(
+            module_name=self.name, input=input, compute=_call_backend)
+        if isinstance(response, dict):
             response = ExpandOneOutput(**response)
-            cache_controller.add(module_name=self.name, input=input, response=response)
 
         return response
 
@@ -156,34 +158,28 @@ class ExpandOneWrapper(BaseWrapper):
         Login required for access to user banned lists.
         """
         # banned_chemicals handling, requires login token
-        if not input.banned_chemicals:
-            input.banned_chemicals = []
-
         try:
             banned_chemicals_controller = get_util_registry().get_util(
                 module="banned_chemicals"
             )
-            user_banned_chemicals = banned_chemicals_controller.get(token=token).__root__
-            user_banned_chemicals = [entry.smiles for entry in user_banned_chemicals
-                                     if entry.active]
-            input.banned_chemicals.extend(user_banned_chemicals)
+            input.banned_chemicals = banned_chemicals_controller.merge_banlist(
+                banned=input.banned_chemicals,
+                token=token
+            )
         except:
-            pass
-
-        # banned_chemicals handling, requires login token
-        if not input.banned_reactions:
-            input.banned_reactions = []
+            input.banned_chemicals = compile_banlist(input.banned_chemicals or [])
 
+        # banned_reactions handling, requires login token
         try:
             banned_reactions_controller = get_util_registry().get_util(
                 module="banned_reactions"
             )
-            user_banned_reactions = banned_reactions_controller.get(token=token).__root__
-            user_banned_reactions = [entry.smiles for entry in user_banned_reactions
-                                     if entry.active]
-            input.banned_reactions.extend(user_banned_reactions)
+            input.banned_reactions = banned_reactions_controller.merge_banlist(
+                banned=input.banned_reactions,
+                token=token
+            )
         except:
-            pass
+            input.banned_reactions = compile_banlist(input.banned_reactions or [])
 
         # actual backend call
         output = self.call_raw(input=input)
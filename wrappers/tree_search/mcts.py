@@ -13,6 +13,7 @@ from utils.registry import get_util_registry
 from utils.tree_search_results import TreeSearchSavedResults
 from wrappers import register_wrapper
 from wrappers.base import BaseResponse, BaseWrapper
+from wrappers.tree_search.streaming import stream_tree_search
 
 
 class ExpandOneOptions(LowerCamelAliasModel):
@@ -293,6 +294,30 @@ class MCTSWrapper(BaseWrapper):
 
         return output
 
+    def call_raw_streaming(self, input: MCTSInput, token: str) -> MCTSOutput:
+        """
+        Same as call_raw(), but through the streaming endpoint of the backend
+        if one is configured, so that the partial results of an async run are
+        persisted as they come and the run can be stopped early.
+        """
+        streaming_url = self.config["deployment"].get("streaming_prediction_url", "")
+        if not streaming_url:
+            return self.call_raw(input=input)
+
+        output = stream_tree_search(
+            session=self.session_sync,
+            url=streaming_url,
+            dict_input=self.process_input(input),
+            timeout=self.config["deployment"]["timeout"],
+            result_id=input.result_id,
+            token=token
+        )
+        if output is None:
+            return self.call_raw(input=input)
+        output = MCTSOutput(**output)
+
+        return output
+
     def call_sync(
         self,
         input: MCTSInput,
@@ -303,26 +328,24 @@ class MCTSWrapper(BaseWrapper):
         Login required for access to user banned lists.
         """
         # banned_chemicals handling, requires login token
-        if not input.expand_one_options.banned_chemicals:
-            input.expand_one_options.banned_chemicals = []
         banned_chemicals_controller = get_util_registry().get_util(
             module="banned_chemicals"
         )
-        user_banned_chemicals = banned_chemicals_controller.get(token=token).__root__
-        user_banned_chemicals = [entry.smiles for entry in user_banned_chemicals
-                                 if entry.active]
-        input.expand_one_options.banned_chemicals.extend(user_banned_chemicals)
+        input.expand_one_options.banned_chemicals = \
+            banned_chemicals_controller.merge_banlist(
+                banned=input.expand_one_options.banned_chemicals,
+                token=token
+            )
 
-        # banned_chemicals handling, requires login token
-        if not input.expand_one_options.banned_reactions:
-            input.expand_one_options.banned_reactions = []
+        # banned_reactions handling, requires login token
         banned_reactions_controller = get_util_registry().get_util(
             module="banned_reactions"
         )
-        user_banned_reactions = banned_reactions_controller.get(token=token).__root__
-        user_banned_reactions = [entry.smiles for entry in user_banned_reactions
-                                 if entry.active]
-        input.expand_one_options.banned_reactions.extend(user_banned_reactions)
+        input.expand_one_options.banned_reactions = \
+            banned_reactions_controller.merge_banlist(
+                banned=input.expand_one_options.banned_reactions,
+                token=token
+            )
 
         results_controller = get_util_registry().get_util(
             module="tree_search_results_controller"
@@ -336,7 +359,10 @@ class MCTSWrapper(BaseWrapper):
             )
         try:
             # actual backend call
-            output = self.call_raw(input=input)
+            if input.run_async:
+                output = self.call_raw_streaming(input=input, token=token)
+            else:
+                output = self.call_raw(input=input)
             response = self.convert_output_to_response(output)
             result_doc = response.result
             result_doc.result_id = input.result_id
@@ -1,4 +1,7 @@
+import contextvars
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field
 from schemas.base import LowerCamelAliasModel
 from typing import Any
@@ -14,6 +17,11 @@ from wrappers.tree_search.mcts import (
 )
 from wrappers.tree_search.multi_target_impl import get_best_paths
 
+# Default for the optional "max_concurrent_searches" under the deployment config
+# of tree_search_mcts, i.e., the number of MCTS searches that may run at once
+# across all multi-target requests served by this process
+DEFAULT_MAX_CONCURRENT_SEARCHES = 4
+
 
 class MultiTargetInput(LowerCamelAliasModel):
     targets: list[str] = Field(
@@ -44,6 +52,13 @@ class MultiTargetInput(LowerCamelAliasModel):
         default_factory=EnumeratePathsOptions,
         description="options for path enumeration once the tree is built"
     )
+    max_parallel_targets: int = Field(
+        default=4,
+        description="max number of targets to search concurrently, "
+                    "further capped by the global search budget; "
+                    "1 to search the targets one at a time",
+        ge=1
+    )
     run_async: bool = False
     result_id: str = str(uuid.uuid4())
 
@@ -66,9 +81,15 @@ class MultiTargetWrapper(BaseWrapper):
     """Wrapper class for Multi Target MCTS"""
     prefixes = ["tree_search/multi_target"]
     methods_to_bind: dict[str, list[str]] = {
-        "call_sync_without_token": ["POST"]
+        "call_sync_without_token": ["POST"],
+        "call_async": ["POST"],
+        "retrieve": ["GET"]
     }
 
+    # Global budget of concurrent MCTS searches, created on first use
+    _search_slots: threading.BoundedSemaphore | None = None
+    _search_slots_lock = threading.Lock()
+
     def __init__(self):
         pass        # TODO: proper inheritance
 
@@ -78,30 +99,70 @@ class MultiTargetWrapper(BaseWrapper):
         Skip login at the expense of losing access to user banned lists.
         """
         wrapper = get_wrapper_registry().get_wrapper(module="tree_search_mcts")
+        search_slots = self.get_search_slots(wrapper)
 
-        all_paths = {}
-        for target in input.targets:
+        def search(target: str) -> list[dict[str, Any]] | None:
             wrapper_input = self.convert_input(
                 target=target,
                 multi_target_input=input
             )
-            wrapper_response = wrapper.call_sync_without_token(
-                wrapper_input
-            )
-
-            paths = self.get_paths_from_response(wrapper_response)
-            all_paths[target] = paths
+            with search_slots:
+                wrapper_response = wrapper.call_sync_without_token(
+                    wrapper_input
+                )
+
+            return self.get_paths_from_response(wrapper_response)
+
+        targets = list(dict.fromkeys(input.targets))
+        max_workers = max(min(input.max_parallel_targets, len(targets)), 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # in copies of the context, for the trace id
+            all_paths = dict(zip(targets, executor.map(
+                lambda target: contextvars.copy_context().run(search, target),
+                targets
+            )))
 
         best_paths = get_best_paths(all_paths)
         response = self.convert_output_to_response(best_paths)
 
         return response
 
+    async def call_async(self, input: MultiTargetInput, priority: int = 0) -> str:
+        """
+        Endpoint for asynchronous call to the multi target tree searcher,
+        with a single task id for the whole batch of targets.
+        Skip login at the expense of losing access to user banned lists.
+        """
+        from askcos2_celery.tasks import tree_search_multi_target_task
+        async_result = tree_search_multi_target_task.apply_async(
+            args=(self.name, input.dict()), priority=priority)
+        task_id = async_result.id
+
+        return task_id
+
+    async def retrieve(self, task_id: str) -> MultiTargetResponse | None:
+        return await super().retrieve(task_id=task_id)
+
+    @classmethod
+    def get_search_slots(cls, wrapper: BaseWrapper) -> threading.BoundedSemaphore:
+        if cls._search_slots is None:
+            with cls._search_slots_lock:
+                if cls._search_slots is None:
+                    max_concurrent_searches = wrapper.config["deployment"].get(
+                        "max_concurrent_searches", DEFAULT_MAX_CONCURRENT_SEARCHES)
+                    cls._search_slots = threading.BoundedSemaphore(
+                        max_concurrent_searches)
+
+        return cls._search_slots
+
     @staticmethod
     def convert_input(
         target: str,
         multi_target_input: MultiTargetInput
     ) -> MCTSInput:
+        # deep copies, as the MCTS wrapper may modify the options in place,
+        # possibly from concurrent searches
+        multi_target_input = multi_target_input.copy(deep=True)
         wrapper_input = MCTSInput(
             smiles=target,
             description=multi_target_input.description,
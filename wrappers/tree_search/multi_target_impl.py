@@ -1,13 +1,54 @@
 import numpy as np
 from rdkit import Chem
-from rdkit.Chem import AllChem, DataStructs
+from rdkit.Chem import AllChem
 from typing import Any
+from utils.fingerprint_index import (
+    DEFAULT_MORGAN_LEN,
+    DEFAULT_MORGAN_RADIUS,
+    pack_bits,
+    popcount
+)
+
+# Max number of (row, column) fingerprint pairs to AND/popcount at a time
+PAIRS_CHUNK_SIZE = 65536
+
+
+class FingerprintMemo:
+    """
+    Per-call memo of packed Morgan fingerprints keyed by SMILES, so that each
+    leaf is parsed and fingerprinted only once across all targets and paths.
+    """
+
+    def __init__(self):
+        self._fps: dict[str, np.ndarray] = {}
+        self._counts: dict[str, int] = {}
+
+    def get(self, smiles_list: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the stacked (n, DEFAULT_MORGAN_LEN // 64) packed fingerprints
+        and their popcounts for the SMILES.
+        """
+        missing = [smi for smi in dict.fromkeys(smiles_list) if smi not in self._fps]
+        if missing:
+            fps = pack_bits([_get_on_bits(smi) for smi in missing])
+            counts = popcount(fps)
+            for smi, fp, count in zip(missing, fps, counts):
+                self._fps[smi] = fp
+                self._counts[smi] = count
+
+        fps = np.zeros((len(smiles_list), DEFAULT_MORGAN_LEN // 64), dtype="<u8")
+        for i, smi in enumerate(smiles_list):
+            fps[i] = self._fps[smi]
+        counts = np.array([self._counts[smi] for smi in smiles_list], dtype=np.int32)
+
+        return fps, counts
 
 
 def get_best_paths(
     all_paths: dict[str, list[dict[str, Any]] | None]
 ) -> dict[str, dict[str, Any] | None]:
     best_buyables_size = 10
+    memo = FingerprintMemo()
 
     # compute leaves (the buyables) for all paths
     for target, paths in all_paths.items():
@@ -36,7 +77,8 @@ def get_best_paths(
         else:
             running_best_buyables = _get_running_best_buyables(
                 running_best_buyables=running_best_buyables,
-                new_best_buyables=new_best_buyables
+                new_best_buyables=new_best_buyables,
+                memo=memo
             )
         # print(f"running_best_buyables: {running_best_buyables}")
 
@@ -47,14 +89,16 @@ def get_best_paths(
             best_paths[target] = None
             continue
 
+        path_similarities = _get_set_scores(
+            ref_sets=[path["leaves"] for path in paths],
+            compared_sets=running_best_buyables,
+            memo=memo
+        )[0]
+
         highest_path_similarity = 0.0
         best_path = None
 
-        for path in paths:
-            path_similarity = _get_path_similarity(
-                leaves=path["leaves"],
-                running_best_buyables=running_best_buyables
-            )
+        for path, path_similarity in zip(paths, path_similarities):
             if path_similarity > highest_path_similarity:
                 highest_path_similarity = path_similarity
                 best_path = path
@@ -67,17 +111,14 @@ def get_best_paths(
 
 def _get_running_best_buyables(
     running_best_buyables: list[list[str]],
-    new_best_buyables: list[list[str]]
+    new_best_buyables: list[list[str]],
+    memo: FingerprintMemo
 ) -> list[list[str]]:
-    scores_existing = [
-        _get_pairwise_score(existing_buyable, new_best_buyables)
-        for existing_buyable in running_best_buyables
-    ]
-
-    scores_new = [
-        _get_pairwise_score(new_buyable, running_best_buyables)
-        for new_buyable in new_best_buyables
-    ]
+    scores_existing, scores_new = _get_set_scores(
+        ref_sets=running_best_buyables,
+        compared_sets=new_best_buyables,
+        memo=memo
+    )
 
     scores_agg = scores_existing + scores_new
     buyables_agg = running_best_buyables + new_best_buyables
@@ -88,41 +129,74 @@ def _get_running_best_buyables(
     return new_running_best_buyables
 
 
-def _get_pairwise_score(
-    ref_buyable: list[str],
-    compared_buyables: list[list[str]]
-) -> float:
-    score = 0.0
-    ref_mols = [Chem.MolFromSmiles(smi) for smi in ref_buyable]
-    ref_fps = [
-        AllChem.GetMorganFingerprintAsBitVect(mol, radius=2, nBits=2048)
-        for mol in ref_mols
-    ]
-
-    for compared_buyable in compared_buyables:
-        compared_mols = [Chem.MolFromSmiles(smi) for smi in compared_buyable]
-        compared_fps = [
-            AllChem.GetMorganFingerprintAsBitVect(mol, radius=2, nBits=2048)
-            for mol in compared_mols
-        ]
-
-        tanimoto = max(
-            max(DataStructs.BulkTanimotoSimilarity(ref_fp, compared_fps))
-            for ref_fp in ref_fps
-        )
-        if tanimoto > score:
-            score = tanimoto
-
-    return score
-
-
-def _get_path_similarity(
-    leaves: list[str],
-    running_best_buyables: list[list[str]]
-) -> float:
-    path_similarity = _get_pairwise_score(
-        ref_buyable=leaves,
-        compared_buyables=running_best_buyables
+def _get_set_scores(
+    ref_sets: list[list[str]],
+    compared_sets: list[list[str]],
+    memo: FingerprintMemo
+) -> tuple[list[float], list[float]]:
+    """
+    Score each ref set against all the compared sets and vice versa, where the
+    score between two sets of buyables is the highest Tanimoto similarity
+    between any of their members. All similarities are computed in one pass
+    over the unique SMILES on either side.
+
+    Returns:
+        (scores of ref_sets, scores of compared_sets)
+    """
+    ref_smiles = list(dict.fromkeys(smi for leaves in ref_sets for smi in leaves))
+    compared_smiles = list(dict.fromkeys(
+        smi for leaves in compared_sets for smi in leaves))
+
+    similarities = _get_tanimoto_matrix(
+        *memo.get(ref_smiles),
+        *memo.get(compared_smiles)
     )
+    ref_max = similarities.max(axis=1, initial=0.0)
+    compared_max = similarities.max(axis=0, initial=0.0)
+
+    ref_ids = {smi: i for i, smi in enumerate(ref_smiles)}
+    compared_ids = {smi: i for i, smi in enumerate(compared_smiles)}
+    ref_scores = [
+        float(ref_max[[ref_ids[smi] for smi in leaves]].max(initial=0.0))
+        for leaves in ref_sets
+    ]
+    compared_scores = [
+        float(compared_max[[compared_ids[smi] for smi in leaves]].max(initial=0.0))
+        for leaves in compared_sets
+    ]
 
-    return path_similarity
+    return ref_scores, compared_scores
+
+
+def _get_tanimoto_matrix(
+    fps_a: np.ndarray,
+    counts_a: np.ndarray,
+    fps_b: np.ndarray,
+    counts_b: np.ndarray
+) -> np.ndarray:
+    """Pairwise Tanimoto similarities between two sets of packed fingerprints"""
+    similarities = np.zeros((len(fps_a), len(fps_b)), dtype=np.float64)
+    if not len(fps_a) or not len(fps_b):
+        return similarities
+
+    chunk_rows = max(PAIRS_CHUNK_SIZE // len(fps_b), 1)
+    for start in range(0, len(fps_a), chunk_rows):
+        end = min(start + chunk_rows, len(fps_a))
+        common = popcount(
+            (fps_a[start:end, None, :] & fps_b[None, :, :]).reshape(
+                -1, fps_a.shape[1])
+        ).reshape(end - start, len(fps_b))
+        union = counts_a[start:end, None] + counts_b[None, :] - common
+        np.divide(common, union, out=similarities[start:end], where=union > 0)
+
+    return similarities
+
+
+def _get_on_bits(smiles: str) -> list[int]:
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return []
+    fp = AllChem.GetMorganFingerprintAsBitVect(
+        mol, radius=DEFAULT_MORGAN_RADIUS, nBits=DEFAULT_MORGAN_LEN)
+
+    return list(fp.GetOnBits())
@@ -0,0 +1,80 @@
+import json
+import requests
+import time
+from typing import Any
+from utils.registry import get_util_registry
+
+# Seconds between persisting the partial results of a streaming search, which
+# is also how often a stop request is checked for
+PARTIAL_RESULTS_INTERVAL = 5
+# Responses of a backend without the streaming endpoint
+UNSUPPORTED_STATUS_CODES = [404, 405]
+
+
+def stream_tree_search(
+    session: requests.Session,
+    url: str,
+    dict_input: dict,
+    timeout: float,
+    result_id: str,
+    token: str,
+    interval: float = PARTIAL_RESULTS_INTERVAL
+) -> dict[str, Any] | None:
+    """
+    Run a tree search through the streaming endpoint of the backend, i.e., the
+    streaming_prediction_url in the deployment config of the module, which
+    responds with newline-delimited JSON events. While the search is running,
+    each event is {"status": "RUNNING", "results": {...}} with the stats and
+    the buyable paths found so far, in the same format as the final results;
+    the last event is the final output as returned by the prediction endpoint.
+
+    The result is marked as stoppable once the backend accepts the request.
+    The partial results are persisted into tree_search_results every `interval`
+    seconds. If the user has requested a stop in the meantime, the connection
+    is closed (which ends the search in the backend), and the latest partial
+    results are returned as the final output.
+
+    Returns:
+        dict: backend output, in the format of the prediction endpoint, or None
+            if the backend has no streaming endpoint, in which case the result
+            stays not stoppable for the caller to fall back to call_raw()
+    """
+    results_controller = get_util_registry().get_util(
+        module="tree_search_results_controller"
+    )
+    partial_results = None
+    last_persisted = time.time()
+
+    with session.post(url, json=dict_input, timeout=timeout, stream=True) as response:
+        if response.status_code in UNSUPPORTED_STATUS_CODES:
+            print(f"No streaming endpoint at {url}, falling back to "
+                  f"the prediction endpoint for result {result_id}")
+            return None
+        response.raise_for_status()
+        results_controller.set_stoppable(
+            result_id=result_id, stoppable=True, token=token)
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("status") != "RUNNING":
+                return event
+
+            partial_results = event.get("results") or {}
+            if time.time() - last_persisted < interval:
+                continue
+            last_persisted = time.time()
+
+            results_controller.save_partial_results(
+                result_id=result_id,
+                result=partial_results,
+                token=token
+            )
+            if results_controller.is_stop_requested(result_id=result_id, token=token):
+                stats = partial_results.setdefault("stats", {})
+                stats.setdefault("total_paths", len(partial_results.get("paths") or []))
+                stats["stopped_early"] = True
+
+                return {"status": "SUCCESS", "error": "", "results": partial_results}
+
+    raise ValueError("Streaming tree search ended without final results")